@@ -1,9 +1,14 @@
 import hmac
+import time
 import uuid
 from hashlib import sha1
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import models
+from django.db.models import signals as dbsignals
+from django.dispatch import receiver
+from django.utils.timezone import now
 
 from tower import ugettext_lazy as _lazy
 
@@ -11,6 +16,15 @@ from mozillians.users.managers import PRIVACY_CHOICES, PRIVILEGED, PUBLIC
 from mozillians.users.models import PrivacyField, UserProfile
 
 
+APP_CACHE_TIMEOUT = 300  # seconds
+APP_LOCAL_CACHE_TIMEOUT = 10  # seconds
+APP_LOCAL_CACHE_SIZE = 1000
+# Longer than the interval of the flush_last_used task.
+APP_LAST_USED_TIMEOUT = 60 * 60  # seconds
+# Apps by key, cached in process for APP_LOCAL_CACHE_TIMEOUT seconds.
+_local_app_cache = {}
+
+
 class APIApp(models.Model):
     """APIApp Model."""
     name = models.CharField(max_length=100, unique=True)
@@ -80,3 +94,74 @@ class APIv2App(models.Model):
         """Return a key."""
         new_uuid = uuid.uuid4()
         return hmac.new(str(new_uuid), digestmod=sha1).hexdigest()
+
+    @staticmethod
+    def _cache_key(key):
+        return 'apiv2:app:{0}'.format(sha1(key.encode('utf-8')).hexdigest())
+
+    @classmethod
+    def get_cached_by_key(cls, key):
+        """Return a dict with the id, privacy_level and enabled of the app with key.
+
+        Returns None if there is no such app. The result is cached in
+        process and in the cache backend.
+
+        """
+        cached = _local_app_cache.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1] or None
+
+        app = cache.get(cls._cache_key(key))
+        if app is None:
+            app = (cls.objects.filter(key=key)
+                   .values('id', 'privacy_level', 'enabled').first()) or {}
+            cache.set(cls._cache_key(key), app, APP_CACHE_TIMEOUT)
+        if len(_local_app_cache) >= APP_LOCAL_CACHE_SIZE:
+            # Don't let requests with made up keys fill up the memory.
+            _local_app_cache.clear()
+        _local_app_cache[key] = (time.time() + APP_LOCAL_CACHE_TIMEOUT, app)
+        return app or None
+
+    @classmethod
+    def invalidate_cached_key(cls, key):
+        _local_app_cache.pop(key, None)
+        cache.delete(cls._cache_key(key))
+
+    @staticmethod
+    def _last_used_cache_key(app_id):
+        return 'apiv2:last_used:{0}'.format(app_id)
+
+    @classmethod
+    def mark_used(cls, app_id):
+        """Record that the app was used now.
+
+        The time is kept in the cache and written to the database by
+        the flush_last_used task.
+
+        """
+        cache.set(cls._last_used_cache_key(app_id), now(), APP_LAST_USED_TIMEOUT)
+
+    @classmethod
+    def flush_last_used(cls):
+        """Write the times recorded by mark_used to the database."""
+        keys = dict((cls._last_used_cache_key(app_id), app_id)
+                    for app_id in cls.objects.values_list('id', flat=True))
+        last_used = cache.get_many(keys.keys())
+        cache.delete_many(last_used.keys())
+        for key, timestamp in last_used.items():
+            cls.objects.filter(id=keys[key]).update(last_used=timestamp)
+
+
+@receiver(dbsignals.pre_save, sender=APIv2App, dispatch_uid='invalidate_apiv2app_old_key_sig')
+def invalidate_apiv2app_old_key(sender, instance, raw, **kwargs):
+    # The key of an app may change, make sure the old one stops working.
+    if instance.pk and not raw:
+        old_key = APIv2App.objects.filter(pk=instance.pk).values_list('key', flat=True).first()
+        if old_key:
+            APIv2App.invalidate_cached_key(old_key)
+
+
+@receiver(dbsignals.post_delete, sender=APIv2App, dispatch_uid='invalidate_apiv2app_delete_sig')
+@receiver(dbsignals.post_save, sender=APIv2App, dispatch_uid='invalidate_apiv2app_save_sig')
+def invalidate_apiv2app(sender, instance, **kwargs):
+    APIv2App.invalidate_cached_key(instance.key)
@@ -0,0 +1,14 @@
+from datetime import timedelta
+
+from celery.task import periodic_task
+
+from mozillians.api.models import APIv2App
+
+
+LAST_USED_FLUSH_INTERVAL = 5  # minutes
+
+
+@periodic_task(run_every=timedelta(minutes=LAST_USED_FLUSH_INTERVAL), ignore_result=True)
+def flush_last_used():
+    """Write the last_used times of APIv2 apps buffered in the cache."""
+    APIv2App.flush_last_used()
@@ -1,9 +1,10 @@
 from django.test import TestCase
 
+from mock import patch
 from nose.tools import ok_
 
 from mozillians.users.tests import UserFactory
-from mozillians.api.models import APIApp
+from mozillians.api.models import APP_LAST_USED_TIMEOUT, APIApp, APIv2App
 
 
 class APIAppTests(TestCase):
@@ -13,3 +14,12 @@ class APIAppTests(TestCase):
                                         description='Foo',
                                         key='')
         ok_(api_app.key != '')
+
+
+class APIv2AppTests(TestCase):
+    @patch('mozillians.api.models.cache')
+    def test_mark_used_expires(self, cache_mock):
+        APIv2App.mark_used(1)
+        args, kwargs = cache_mock.set.call_args
+        ok_(args[0].endswith(':1'))
+        ok_(args[2] == APP_LAST_USED_TIMEOUT)
@@ -7,6 +7,7 @@ from nose.tools import ok_
 from waffle.models import Flag
 
 from mozillians.api.models import APIv2App
+from mozillians.api.tasks import flush_last_used
 from mozillians.api.tests import APIv2AppFactory
 from mozillians.api.v2.permissions import MozilliansPermission
 from mozillians.common.tests import TestCase
@@ -30,7 +31,7 @@ class MozilliansPermissionTests(TestCase):
         request.user = AnonymousUser()
         mozillians_permission = MozilliansPermission()
 
-        with patch('mozillians.api.v2.permissions.now') as now_mock:
+        with patch('mozillians.api.models.now') as now_mock:
             now_mock.return_value = timestamp
             with patch('mozillians.api.v2.permissions.statsd.incr') as incr_mock:
                 ok_(mozillians_permission.has_permission(request, view))
@@ -41,8 +42,26 @@ class MozilliansPermissionTests(TestCase):
             call('apiv2.requests.total'),
             call('apiv2.resources.DummyClass')
         ])
+        ok_(not APIv2App.objects.filter(id=app.id, last_used=timestamp).exists())
+        flush_last_used()
         ok_(APIv2App.objects.filter(id=app.id, last_used=timestamp).exists())
 
+    def test_has_permission_cached_key(self):
+        user = UserFactory.create()
+        app = APIv2AppFactory.create(owner=user.userprofile)
+        request = RequestFactory().get('/', data={'api-key': app.key})
+        request.user = AnonymousUser()
+        mozillians_permission = MozilliansPermission()
+        ok_(mozillians_permission.has_permission(request, '/'))
+
+        with patch('mozillians.api.v2.permissions.waffle.flag_is_active', return_value=True):
+            with self.assertNumQueries(0):
+                ok_(mozillians_permission.has_permission(request, '/'))
+
+        app.enabled = False
+        app.save()
+        ok_(not mozillians_permission.has_permission(request, '/'))
+
     def test_has_permission_no_key(self):
         request = RequestFactory().request()
         request.user = AnonymousUser()
@@ -70,7 +89,7 @@ class MozilliansPermissionTests(TestCase):
         request.user = user
         mozillians_permission = MozilliansPermission()
 
-        with patch('mozillians.api.v2.permissions.now') as now_mock:
+        with patch('mozillians.api.models.now') as now_mock:
             now_mock.return_value = timestamp
             with patch('mozillians.api.v2.permissions.statsd.incr') as incr_mock:
                 ok_(mozillians_permission.has_permission(request, view))
@@ -81,4 +100,6 @@ class MozilliansPermissionTests(TestCase):
             call('apiv2.requests.total'),
             call('apiv2.resources.DummyClass')
         ])
+        ok_(not APIv2App.objects.filter(id=app.id, last_used=timestamp).exists())
+        flush_last_used()
         ok_(APIv2App.objects.filter(id=app.id, last_used=timestamp).exists())
@@ -24,5 +24,7 @@ router.register(r'skills', mozillians.groups.api.v2.SkillViewSet)
 urlpatterns = patterns(
     '',
     url(r'', include(v1_api.urls)),
+    url(r'^v2/users/export/$', mozillians.users.api.v2.UserProfileExportView.as_view(),
+        name='userprofile-export'),
     url(r'^v2/', include(router.urls), name='v2root'),
 )
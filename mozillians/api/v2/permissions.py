@@ -1,5 +1,3 @@
-from django.utils.timezone import now
-
 import waffle
 from django_statsd.clients import statsd
 from rest_framework.permissions import BasePermission
@@ -14,28 +12,26 @@ class MozilliansPermission(BasePermission):
 
         api_key = None
 
-        if request.user.is_authenticated():
-            api_query = APIv2App.objects.filter(owner=request.user.userprofile)
-            if api_query.exists():
-                api_key = api_query.order_by('privacy_level')[0].key
+        api_key = request.REQUEST.get('api-key') or request.META.get('HTTP_X_API_KEY')
 
-        api_key = (request.REQUEST.get('api-key') or request.META.get('HTTP_X_API_KEY') or api_key)
+        if not api_key and request.user.is_authenticated():
+            api_key = (APIv2App.objects.filter(owner=request.user.userprofile)
+                       .order_by('privacy_level').values_list('key', flat=True).first())
 
         if api_key:
-            try:
-                app = APIv2App.objects.get(key=api_key, enabled=True)
-            except APIv2App.DoesNotExist:
+            app = APIv2App.get_cached_by_key(api_key)
+            if not app or not app['enabled']:
                 statsd.incr('apiv2.auth.failed')
                 return False
 
-            request.privacy_level = app.privacy_level
+            request.privacy_level = app['privacy_level']
 
             statsd.incr('apiv2.auth.success')
-            statsd.incr('apiv2.requests.app.{0}'.format(app.id))
+            statsd.incr('apiv2.requests.app.{0}'.format(app['id']))
             statsd.incr('apiv2.requests.total')
             statsd.incr('apiv2.resources.{0}'.format(view.__class__.__name__))
 
-            APIv2App.objects.filter(id=app.id).update(last_used=now())
+            APIv2App.mark_used(app['id'])
 
             return True
 
@@ -0,0 +1,255 @@
+"""Benchmarks for the hot paths of the site.
+
+Seeds a dataset with the test factories and measures the wall time
+and the number of queries of the busiest pages and API endpoints.
+Searches run against LocalElasticsearch, an in-memory stand-in for
+Elasticsearch, so that runs are comparable between machines.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from funfactory.helpers import urlparams
+from funfactory.urlresolvers import reverse
+from mock import patch
+from waffle.models import Flag
+
+from mozillians.api.tests import APIAppFactory, APIv2AppFactory
+from mozillians.geo.models import City
+from mozillians.geo.tasks import update_all_location_counts
+from mozillians.geo.tests import CityFactory, CountryFactory, RegionFactory
+from mozillians.groups.models import Group, GroupMembership, Skill
+from mozillians.groups.tasks import update_all_common_skills, update_member_counts
+from mozillians.groups.tests import GroupFactory, SkillFactory
+from mozillians.users.es import PrivacyAwareS, UserProfileMappingType
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC
+from mozillians.users.models import ExternalAccount, Language, UserProfile
+from mozillians.users.tests import UserFactory
+
+
+USERNAME_PREFIX = 'benchmark'
+VIEWER_USERNAME = 'bench_viewer'
+AUTHENTICATION_BACKENDS = (
+    'mozillians.common.tests.authentication.DummyAuthenticationBackend',
+)
+ACCOUNT_TYPES = [ExternalAccount.TYPE_AMO, ExternalAccount.TYPE_BMO,
+                 ExternalAccount.TYPE_GITHUB, ExternalAccount.TYPE_SUMO,
+                 ExternalAccount.TYPE_TWITTER, ExternalAccount.TYPE_WEBSITE,
+                 ExternalAccount.TYPE_EMAIL]
+LANGUAGES = ['en', 'fr', 'el', 'es', 'de', 'it', 'pt', 'ja']
+PRIVACY_LEVELS = [PUBLIC, MOZILLIANS, MOZILLIANS, EMPLOYEES]
+
+
+class LocalElasticsearch(object):
+    """In-memory stand-in for the Elasticsearch client.
+
+    Serves the documents of the profiles in the database, in name and
+    id order, for every query. It implements the part of the client API
+    used by searches (search and count) and ignores the query itself,
+    so it measures the cost of the site around Elasticsearch and not
+    relevance.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        for public_index in [False, True]:
+            index = UserProfileMappingType.get_index(public_index)
+            profiles = UserProfile.objects.complete().order_by('id')
+            if public_index:
+                profiles = profiles.public_indexable().privacy_level(PUBLIC)
+            ids = list(profiles.values_list('id', flat=True))
+            documents = UserProfileMappingType.extract_documents(ids, profiles)
+            self.documents[index] = sorted(documents, key=lambda doc: (doc['name'], doc['id']))
+
+    def _documents(self, index):
+        if isinstance(index, (list, tuple)):
+            index = index[0]
+        return self.documents.get(index, [])
+
+    def _response(self, index, start, size):
+        documents = self._documents(index)
+        hits = [{'_id': str(document['id']),
+                 '_index': index,
+                 '_type': UserProfileMappingType.get_mapping_type_name(),
+                 '_score': 1.0,
+                 '_source': document,
+                 'sort': [1.0, document['name'], document['id']]}
+                for document in documents[start:start + size]]
+        return {
+            'took': 1,
+            'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {'total': len(documents), 'max_score': 1.0, 'hits': hits},
+        }
+
+    def search(self, body=None, index=None, doc_type=None, **kwargs):
+        body = body or {}
+        return self._response(index, body.get('from', 0), body.get('size', 10))
+
+    def count(self, body=None, index=None, doc_type=None, **kwargs):
+        return {'count': len(self._documents(index))}
+
+
+@contextmanager
+def local_elasticsearch():
+    """Route searches to a LocalElasticsearch for the duration."""
+    es = LocalElasticsearch()
+    with patch.object(PrivacyAwareS, 'get_es', lambda *args, **kwargs: es):
+        with patch.object(UserProfileMappingType, 'get_es', classmethod(lambda cls: es)):
+            yield es
+
+
+def _create_profile(rng, n, cities, groups, skills):
+    city = rng.choice(cities)
+    privacy = dict(('privacy_%s' % field, rng.choice(PRIVACY_LEVELS))
+                   for field in ['full_name', 'ircname', 'email', 'bio', 'geo_city',
+                                 'geo_region', 'geo_country', 'groups', 'skills',
+                                 'languages', 'title', 'timezone'])
+    userprofile = dict(privacy, geo_country=city.country, geo_region=city.region,
+                       geo_city=city, lat=city.lat, lng=city.lng,
+                       ircname='irc{0}'.format(n), title='Title {0}'.format(n),
+                       bio='Bio of benchmark user {0}'.format(n))
+    user = UserFactory.create(username='{0}{1}'.format(USERNAME_PREFIX, n),
+                              userprofile=userprofile,
+                              vouched=rng.random() < 0.8)
+    profile = user.userprofile
+
+    memberships = [GroupMembership(userprofile=profile, group=group,
+                                   status=GroupMembership.MEMBER)
+                   for group in rng.sample(groups, rng.randint(0, 5))]
+    GroupMembership.objects.bulk_create(memberships)
+    UserProfile.skills.through.objects.bulk_create(
+        [UserProfile.skills.through(userprofile=profile, skill=skill)
+         for skill in rng.sample(skills, rng.randint(0, 8))])
+    Language.objects.bulk_create(
+        [Language(userprofile=profile, code=code)
+         for code in rng.sample(LANGUAGES, rng.randint(1, 3))])
+    ExternalAccount.objects.bulk_create(
+        [ExternalAccount(user=profile, type=account_type,
+                         identifier='{0}{1}'.format(account_type.lower(), n),
+                         privacy=rng.choice([PUBLIC, MOZILLIANS]))
+         for account_type in rng.sample(ACCOUNT_TYPES, rng.randint(0, 4))])
+    return profile
+
+
+def seed(profiles=20000, random_seed=0, stdout=None):
+    """Create benchmark profiles until there are `profiles` of them.
+
+    Profiles are spread over countries, cities, groups and skills and
+    get languages, external accounts and mixed privacy settings.
+    Seeding is resumable: existing benchmark profiles are kept.
+    """
+    rng = random.Random(random_seed)
+    existing = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+
+    cities = list(City.objects.select_related('country', 'region'))
+    if not cities:
+        for i in range(30):
+            country = CountryFactory.create()
+            for j in range(3):
+                region = RegionFactory.create(country=country)
+                cities.extend(CityFactory.create_batch(3, region=region))
+    groups = list(Group.objects.all()) or GroupFactory.create_batch(max(profiles / 100, 10))
+    skills = list(Skill.objects.all()) or SkillFactory.create_batch(max(profiles / 50, 10))
+
+    # Search indexing is replaced by LocalElasticsearch.
+    with override_settings(ES_DISABLED=True):
+        for n in range(existing, profiles):
+            _create_profile(rng, n, cities, groups, skills)
+            if stdout and n % 1000 == 999:
+                stdout.write('{0} profiles created\n'.format(n + 1))
+
+    update_member_counts()
+    update_all_common_skills()
+    update_all_location_counts()
+    Flag.objects.get_or_create(name='apiv2-endpoint', defaults={'everyone': True})
+
+
+def _busiest(queryset):
+    return queryset.order_by('-member_count')[0]
+
+
+def get_benchmarks(viewer):
+    """Return (name, url) of the benchmarked requests."""
+    profile = (UserProfile.objects.filter(user__username__startswith=USERNAME_PREFIX)
+               .order_by('-id')[0])
+    group = _busiest(Group.objects.visible())
+    country = (profile.geo_country.name if profile.geo_country else 'Greece')
+    app = APIAppFactory.create(owner=viewer, is_mozilla_app=True)
+    v2_app = APIv2AppFactory.create(owner=viewer.userprofile, privacy_level=MOZILLIANS)
+
+    return [
+        ('phonebook.view_profile',
+         reverse('phonebook:profile_view', args=[profile.user.username])),
+        ('phonebook.search',
+         urlparams(reverse('phonebook:search'), q='Doe')),
+        ('groups.show',
+         reverse('groups:show_group', args=[group.url])),
+        ('phonebook.list_mozillians_in_location',
+         reverse('phonebook:list_country', args=[country])),
+        ('api.v1.users',
+         urlparams(reverse('api_dispatch_list',
+                           kwargs={'api_name': 'v1', 'resource_name': 'users'}),
+                   app_name=app.name, app_key=app.key)),
+        ('api.v2.users',
+         urlparams(reverse('userprofile-list'), **{'api-key': v2_app.key})),
+    ]
+
+
+def measure(client, url, repeat=5, cold=False):
+    """Request url repeat times and return its timings and query count.
+
+    A first request warms up caches and connections and is not
+    counted. With cold, the cache is cleared before every request.
+    """
+    client.get(url)
+    timings = []
+    for i in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            response = client.get(url)
+            timings.append((time.time() - start) * 1000)
+    timings.sort()
+    return {
+        'url': url,
+        'status': response.status_code,
+        'queries': len(queries),
+        'wall_ms': {
+            'min': round(timings[0], 2),
+            'median': round(timings[len(timings) / 2], 2),
+            'max': round(timings[-1], 2),
+        },
+    }
+
+
+def run(repeat=5, cold=False, only=None):
+    """Run the benchmarks and return the results as a JSON-able dict."""
+    viewer = UserFactory.create(username=VIEWER_USERNAME)
+    try:
+        results = {}
+        with override_settings(AUTHENTICATION_BACKENDS=AUTHENTICATION_BACKENDS):
+            with local_elasticsearch():
+                client = Client()
+                client.login(email=viewer.email)
+                for name, url in get_benchmarks(viewer):
+                    if only and name not in only:
+                        continue
+                    results[name] = measure(client, url, repeat=repeat, cold=cold)
+    finally:
+        viewer.delete()
+
+    return {
+        'profiles': UserProfile.objects.filter(
+            user__username__startswith=USERNAME_PREFIX).count(),
+        'repeat': repeat,
+        'cold': cold,
+        'results': results,
+    }
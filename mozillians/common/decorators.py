@@ -1,4 +1,8 @@
-from functools import partial
+from functools import partial, wraps
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from django_statsd.clients import statsd
 
 
 def _set_attribute_func(function, attribute, value):
@@ -19,3 +23,30 @@ def allow_unvouched(function):
     """Allow view to be accessed by unvouched users."""
     _set_attribute_func(function, '_allow_unvouched', True)
     return function
+
+
+def instrument_view(name):
+    """Send the time and the number of database queries of a view to statsd.
+
+    Stats are sent as views.<name> and views.<name>.queries.
+
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(request, *args, **kwargs):
+            # Count the queries logged by the debug cursor of this
+            # thread's connection, like CaptureQueriesContext. Nested
+            # instrumented views each restore the flag they found.
+            db = connections[DEFAULT_DB_ALIAS]
+            use_debug_cursor = db.use_debug_cursor
+            db.use_debug_cursor = True
+            initial_queries = len(db.queries)
+            try:
+                with statsd.timer('views.{0}'.format(name)):
+                    return function(request, *args, **kwargs)
+            finally:
+                db.use_debug_cursor = use_debug_cursor
+                statsd.timing('views.{0}.queries'.format(name),
+                              len(db.queries) - initial_queries)
+        return wrapper
+    return decorator
@@ -0,0 +1,58 @@
+"""
+Benchmark search, profile, group, location and API requests.
+
+Seeds the database with benchmark profiles if needed, then prints or
+writes the wall time and query count of each request as JSON. Run it
+against a development database, never against production.
+"""
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from mozillians.common import benchmark
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Measures wall time and query counts of the busiest requests'
+
+    option_list = list(BaseCommand.option_list) + [
+        make_option('--profiles',
+                    dest='profiles',
+                    type='int',
+                    default=20000,
+                    help='Number of benchmark profiles to seed.'),
+        make_option('--repeat',
+                    dest='repeat',
+                    type='int',
+                    default=5,
+                    help='Number of measured requests per benchmark.'),
+        make_option('--cold',
+                    dest='cold',
+                    action='store_true',
+                    default=False,
+                    help='Clear the cache before every request.'),
+        make_option('--only',
+                    dest='only',
+                    action='append',
+                    default=None,
+                    help='Run only the named benchmark. Can be repeated.'),
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help='Path to write the JSON results to instead of stdout.'),
+    ]
+
+    def handle(self, *args, **options):
+        benchmark.seed(options.get('profiles'), stdout=self.stdout)
+        results = benchmark.run(repeat=options.get('repeat'), cold=options.get('cold'),
+                                only=options.get('only'))
+        output = json.dumps(results, indent=2, sort_keys=True)
+
+        path = options.get('output')
+        if path:
+            with open(path, 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output + '\n')
@@ -1,9 +1,11 @@
 import re
 from contextlib import contextmanager
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.cache import cache
 from django.utils.encoding import iri_to_uri
 
 from funfactory.urlresolvers import reverse
@@ -14,6 +16,56 @@ from mozillians.common.helpers import redirect
 
 LOGIN_MESSAGE = _lazy(u'You must be logged in to continue.')
 GET_VOUCHED_MESSAGE = _lazy(u'You must be vouched to continue.')
+VOUCHED_SESSION_KEY = 'stronghold_vouched'
+
+
+def _vouched_flag_version_key(user_id):
+    return 'users:vouched_flag_version:{0}'.format(user_id)
+
+
+def get_vouched_flag_version(user_id):
+    """Return the current version of the privacy flags of a user.
+
+    The version changes whenever invalidate_vouched_flag is called
+    for the user or the cache entry is evicted.
+
+    """
+    key = _vouched_flag_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_vouched_flag(user_id):
+    """Make sessions reload the vouched flag and privacy level of a user."""
+    cache.delete(_vouched_flag_version_key(user_id))
+
+
+def get_privacy_flags(request):
+    """Return whether the user of the request is vouched, and their privacy level.
+
+    The flags are kept in the session, so that the profile is only
+    loaded again after they have been invalidated.
+
+    """
+    flags = getattr(request, '_privacy_flags', None)
+    if flags is not None:
+        return flags
+
+    user_id = request.user.id
+    version = get_vouched_flag_version(user_id)
+    stored = request.session.get(VOUCHED_SESSION_KEY)
+    if stored and len(stored) == 4 and stored[:2] == [user_id, version]:
+        flags = tuple(stored[2:])
+    else:
+        profile = request.user.userprofile
+        flags = (profile.is_vouched, profile.privacy_level)
+        request.session[VOUCHED_SESSION_KEY] = [user_id, version] + list(flags)
+    request._privacy_flags = flags
+    return flags
 
 
 class StrongholdMiddleware(object):
@@ -24,12 +76,19 @@ class StrongholdMiddleware(object):
     """
 
     def __init__(self):
-        self.exceptions = getattr(settings, 'STRONGHOLD_EXCEPTIONS', [])
+        exceptions = getattr(settings, 'STRONGHOLD_EXCEPTIONS', [])
+        self.exceptions = None
+        if exceptions:
+            self.exceptions = re.compile('|'.join('(?:{0})'.format(view_url)
+                                                  for view_url in exceptions))
+
+    def is_vouched(self, request):
+        """Return whether the user of the request is vouched."""
+        return get_privacy_flags(request)[0]
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        for view_url in self.exceptions:
-            if re.match(view_url, request.path):
-                return None
+        if self.exceptions and self.exceptions.match(request.path):
+            return None
 
         allow_public = getattr(view_func, '_allow_public', None)
         if allow_public:
@@ -40,7 +99,7 @@ class StrongholdMiddleware(object):
             return (login_required(view_func, login_url=reverse('phonebook:home'))
                     (request, *view_args, **view_kwargs))
 
-        if request.user.userprofile.is_vouched:
+        if self.is_vouched(request):
             return None
 
         allow_unvouched = getattr(view_func, '_allow_unvouched', None)
@@ -0,0 +1,71 @@
+import json
+
+from nose.tools import eq_, ok_
+
+from mozillians.common import benchmark
+from mozillians.common.tests import TestCase
+from mozillians.users.es import UserProfileMappingType
+from mozillians.users.managers import PUBLIC
+from mozillians.users.models import UserProfile
+from mozillians.users.tests import UserFactory
+
+
+class LocalElasticsearchTests(TestCase):
+    def test_search(self):
+        users = [UserFactory.create() for i in range(3)]
+        UserFactory.create(userprofile={'full_name': ''})
+        profiles = sorted([user.userprofile for user in users],
+                          key=lambda profile: (profile.full_name.lower(), profile.id))
+        index = UserProfileMappingType.get_index()
+        es = benchmark.LocalElasticsearch()
+
+        response = es.search(body={'size': 2}, index=index)
+        eq_(response['hits']['total'], 3)
+        eq_([hit['_id'] for hit in response['hits']['hits']],
+            [str(profile.id) for profile in profiles[:2]])
+
+        response = es.search(body={'from': 2, 'size': 2}, index=index)
+        eq_([hit['_id'] for hit in response['hits']['hits']], [str(profiles[2].id)])
+        eq_(response['hits']['hits'][0]['sort'],
+            [1.0, profiles[2].full_name.lower(), profiles[2].id])
+        eq_(es.count(index=index)['count'], 3)
+
+    def test_public_index(self):
+        public_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        UserFactory.create()
+        es = benchmark.LocalElasticsearch()
+
+        response = es.search(index=UserProfileMappingType.get_index(public_index=True))
+        eq_([hit['_id'] for hit in response['hits']['hits']], [str(public_user.userprofile.id)])
+
+
+class BenchmarkTests(TestCase):
+    def test_seed(self):
+        benchmark.seed(profiles=3)
+        eq_(UserProfile.objects.filter(
+            user__username__startswith=benchmark.USERNAME_PREFIX).count(), 3)
+
+        # Seeding is resumable.
+        benchmark.seed(profiles=4)
+        eq_(UserProfile.objects.filter(
+            user__username__startswith=benchmark.USERNAME_PREFIX).count(), 4)
+
+    def test_run(self):
+        benchmark.seed(profiles=3)
+        results = benchmark.run(repeat=2)
+
+        eq_(results['profiles'], 3)
+        eq_(set(results['results'].keys()),
+            set(['phonebook.view_profile', 'phonebook.search', 'groups.show',
+                 'phonebook.list_mozillians_in_location', 'api.v1.users', 'api.v2.users']))
+        eq_(results['results']['phonebook.view_profile']['status'], 200)
+        for result in results['results'].values():
+            ok_(result['queries'] > 0)
+            ok_(result['wall_ms']['min'] <= result['wall_ms']['max'])
+        ok_(json.dumps(results))
+        ok_(not UserProfile.objects.filter(user__username=benchmark.VIEWER_USERNAME).exists())
+
+    def test_run_only(self):
+        benchmark.seed(profiles=2)
+        results = benchmark.run(repeat=1, only=['groups.show'])
+        eq_(results['results'].keys(), ['groups.show'])
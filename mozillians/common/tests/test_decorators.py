@@ -1,6 +1,10 @@
+from django.contrib.auth.models import User
+from django.db import connection
+
+from mock import call, patch
 from nose.tools import eq_, ok_
 
-from mozillians.common.decorators import allow_public, allow_unvouched
+from mozillians.common.decorators import allow_public, allow_unvouched, instrument_view
 from mozillians.common.tests import TestCase
 
 
@@ -19,3 +23,47 @@ class DecoratorsTest(TestCase):
         eq_(getattr(foo, '_allow_unvouched', None), None)
         allow_unvouched(foo)
         ok_(foo._allow_unvouched)
+
+    @patch('mozillians.common.decorators.statsd')
+    def test_instrument_view_decorator(self, statsd_mock):
+        @instrument_view('foo')
+        def foo(request):
+            User.objects.count()
+            User.objects.count()
+            return 'response'
+
+        eq_(foo('request'), 'response')
+        statsd_mock.timer.assert_called_with('views.foo')
+        statsd_mock.timing.assert_called_with('views.foo.queries', 2)
+
+    @patch('mozillians.common.decorators.statsd')
+    def test_instrument_view_decorator_nested(self, statsd_mock):
+        @instrument_view('inner')
+        def inner(request):
+            User.objects.count()
+
+        @instrument_view('outer')
+        def outer(request):
+            User.objects.count()
+            inner(request)
+            ok_(connection.use_debug_cursor)
+            User.objects.count()
+
+        use_debug_cursor = connection.use_debug_cursor
+        outer('request')
+        eq_(statsd_mock.timing.call_args_list,
+            [call('views.inner.queries', 1), call('views.outer.queries', 3)])
+        eq_(connection.use_debug_cursor, use_debug_cursor)
+
+    @patch('mozillians.common.decorators.statsd')
+    def test_instrument_view_decorator_error(self, statsd_mock):
+        @instrument_view('foo')
+        def foo(request):
+            User.objects.count()
+            raise ValueError
+
+        use_debug_cursor = connection.use_debug_cursor
+        with self.assertRaises(ValueError):
+            foo('request')
+        statsd_mock.timing.assert_called_with('views.foo.queries', 1)
+        eq_(connection.use_debug_cursor, use_debug_cursor)
@@ -1,9 +1,14 @@
 from django.core.urlresolvers import reverse
 from django.test.client import Client
 
-from nose.tools import eq_
+from mock import patch
+from nose.tools import eq_, ok_
 
+from mozillians.common.middleware import VOUCHED_SESSION_KEY, get_vouched_flag_version
 from mozillians.common.tests import (TestCase, requires_login, requires_vouch)
+from mozillians.groups.tests import GroupFactory
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS
+from mozillians.users.models import UserProfile
 from mozillians.users.tests import UserFactory
 
 
@@ -99,3 +104,41 @@ class StrongholdTests(TestCase):
         response = client.get(url, follow=True)
         eq_(response.status_code, 200)
         eq_(response.content, 'Hi!')
+
+    def test_vouched_flag_in_session(self):
+        user = UserFactory.create()
+        url = reverse('vouched', prefix='/en-US/')
+        with self.login(user) as client:
+            client.get(url, follow=True)
+            ok_(client.session[VOUCHED_SESSION_KEY][2])
+
+            # Changes that skip the signals are not noticed.
+            UserProfile.objects.filter(pk=user.userprofile.pk).update(is_vouched=False)
+            response = client.get(url, follow=True)
+            eq_(response.content, 'Hi!')
+
+            # Saving the profile invalidates the flag.
+            UserProfile.objects.get(pk=user.userprofile.pk).save(autovouch=False)
+            response = client.get(url, follow=True)
+            self.assertTemplateUsed(response, 'phonebook/home.html')
+            ok_(not client.session[VOUCHED_SESSION_KEY][2])
+
+    def test_privacy_level_in_session(self):
+        user = UserFactory.create()
+        url = reverse('vouched', prefix='/en-US/')
+        with self.login(user) as client:
+            client.get(url, follow=True)
+            eq_(client.session[VOUCHED_SESSION_KEY][3], MOZILLIANS)
+
+            # Joining the staff group invalidates the flags.
+            GroupFactory.create(name='staff').add_member(user.userprofile)
+            client.get(url, follow=True)
+            eq_(client.session[VOUCHED_SESSION_KEY][3], EMPLOYEES)
+
+    def test_vouched_flag_version(self):
+        version = get_vouched_flag_version(1)
+        with patch('mozillians.common.middleware.cache') as cache_mock:
+            cache_mock.get.return_value = version
+            eq_(get_vouched_flag_version(1), version)
+        eq_(cache_mock.get.call_count, 1)
+        ok_(not cache_mock.add.called)
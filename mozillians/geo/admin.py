@@ -4,7 +4,7 @@ from mozillians.geo.models import City, Country, Region
 
 
 class CountryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'code')
+    list_display = ('name', 'code', 'vouched_count', 'public_count')
     readonly_fields = ('name', 'mapbox_id')
     seach_fields = ('name', 'code')
 
@@ -12,7 +12,7 @@ admin.site.register(Country, CountryAdmin)
 
 
 class RegionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'country')
+    list_display = ('name', 'country', 'vouched_count', 'public_count')
     readonly_fields = ('name', 'country', 'mapbox_id')
     search_fields = ('name', 'country__name', 'country__code')
 
@@ -20,7 +20,7 @@ admin.site.register(Region, RegionAdmin)
 
 
 class CityAdmin(admin.ModelAdmin):
-    list_display = ('name', 'region', 'country', 'lng', 'lat')
+    list_display = ('name', 'region', 'country', 'lng', 'lat', 'vouched_count', 'public_count')
     readonly_fields = ('country', 'region', 'name', 'lat', 'lng', 'mapbox_id')
     search_fields = ('name', 'region__name', 'country__name', 'country__code')
 
@@ -1,17 +1,36 @@
 import logging
+import math
+from datetime import timedelta
+
 import requests
-from requests import ConnectionError, HTTPError
+from requests import ConnectionError, HTTPError, Timeout
+from requests.adapters import HTTPAdapter
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.utils.timezone import now
 
 from product_details import product_details
 
-from mozillians.geo.models import Country, Region, City
+from mozillians.geo.models import Country, Region, City, GeocodeCell
 
 
 logger = logging.getLogger(__name__)
 
+# Size in degrees of the cells of coordinates that share a cached
+# reverse geocoding result, about 1km.
+GEOCODE_CELL_SIZE = 0.01
+# Age after which cached results are fetched again from Mapbox.
+GEOCODE_CACHE_MAX_AGE = timedelta(days=30)
+# Age after which cells where Mapbox found no location are fetched again,
+# since an empty result can be a transient Mapbox failure.
+GEOCODE_EMPTY_CACHE_MAX_AGE = timedelta(hours=1)
+# Maximum number of pooled connections to Mapbox.
+MAPBOX_POOL_SIZE = 10
+
+_session = None
+
 # Example data from mapbox:
 # {
 #     u'query': [-79.083798999999999, 35.918596000000001],
@@ -47,13 +66,75 @@ class GeoLookupException(Exception):
     pass
 
 
-def reverse_geocode(lat, lng):
+def get_session():
+    """Return the requests Session used to call Mapbox.
+
+    The session is shared, so that connections to Mapbox are reused.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=MAPBOX_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def get_geocode_cell(lat, lng):
+    """Return the (lat_cell, lng_cell) of the cell holding lat and lng."""
+    return (int(math.floor(lat / GEOCODE_CELL_SIZE)),
+            int(math.floor(lng / GEOCODE_CELL_SIZE)))
+
+
+def get_cached_geocode(lat, lng):
+    """Return the cached Country, Region and City of lat and lng.
+
+    Returns None if there is no fresh result for their cell. Empty
+    results stay fresh for GEOCODE_EMPTY_CACHE_MAX_AGE only.
+    """
+    lat_cell, lng_cell = get_geocode_cell(lat, lng)
+    fresh = (Q(country__isnull=False, updated__gt=now() - GEOCODE_CACHE_MAX_AGE) |
+             Q(country__isnull=True, updated__gt=now() - GEOCODE_EMPTY_CACHE_MAX_AGE))
+    cell = (GeocodeCell.objects.select_related('country', 'region', 'city')
+            .filter(fresh, lat_cell=lat_cell, lng_cell=lng_cell)
+            .first())
+    if cell:
+        return cell.country, cell.region, cell.city
+    return None
+
+
+def set_cached_geocode(lat, lng, country, region, city):
+    """Cache the Country, Region and City of the cell of lat and lng."""
+    lat_cell, lng_cell = get_geocode_cell(lat, lng)
+    locations = dict(country=country, region=region, city=city)
+    updated = (GeocodeCell.objects.filter(lat_cell=lat_cell, lng_cell=lng_cell)
+               .update(updated=now(), **locations))
+    if not updated:
+        try:
+            with transaction.atomic():
+                GeocodeCell.objects.create(lat_cell=lat_cell, lng_cell=lng_cell, **locations)
+        except IntegrityError:
+            # Cached concurrently by another process.
+            pass
+
+
+def reverse_geocode(lat, lng, cached=True):
     """
     Given a lat and lng (floats), return a 3-tuple of
     Country, Region, and City objects.
 
+    Results are cached per cell of GEOCODE_CELL_SIZE degrees, so only
+    the first lookup in a cell calls mapbox. Pass cached=False when the
+    cache was already checked, to always call mapbox.
+
     Raises exception if there's any error calling mapbox.
     """
+    if cached:
+        result = get_cached_geocode(lat, lng)
+        if result:
+            return result
+
     try:
         result = get_first_mapbox_geocode_result('%s,%s' % (lng, lat))
     except HTTPError:
@@ -62,11 +143,16 @@ def reverse_geocode(lat, lng):
     except ConnectionError:
         logger.exception('Cannot open connection to Mapbox.')
         raise GeoLookupException
+    except Timeout:
+        logger.exception('Timed out calling Mapbox.')
+        raise GeoLookupException
 
     if result:
-        return result_to_country_region_city(result)
+        country, region, city = result_to_country_region_city(result)
     else:
-        return None, None, None
+        country = region = city = None
+    set_cached_geocode(lat, lng, country, region, city)
+    return country, region, city
 
 
 def get_first_mapbox_geocode_result(query):
@@ -75,14 +161,15 @@ def get_first_mapbox_geocode_result(query):
     Returns the first result, converted to a dictionary keyed on type
     (e.g. 'city', 'province', 'country', etc.)
 
-    If an error happens, requests raises HTTPError.
+    If an error happens, requests raises HTTPError, ConnectionError
+    or Timeout.
 
     If no results are returned, returns an empty dictionary.
     """
     map_id = settings.MAPBOX_MAP_ID
-    url = 'http://api.tiles.mapbox.com/v3/%s/geocode/%s.json' % (map_id, query)
+    url = '%s/v3/%s/geocode/%s.json' % (settings.MAPBOX_API_URL, map_id, query)
 
-    r = requests.get(url)
+    r = get_session().get(url, timeout=settings.MAPBOX_TIMEOUT)
     r.raise_for_status()
     data = r.json()
 
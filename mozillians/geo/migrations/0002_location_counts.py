@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+PUBLIC = 4
+
+
+def populate_location_counts(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    profiles = UserProfile.objects.exclude(full_name='').filter(is_vouched=True).order_by()
+    for model_name, field in [('Country', 'geo_country'),
+                              ('Region', 'geo_region'),
+                              ('City', 'geo_city')]:
+        model = apps.get_model('geo', model_name)
+        located = profiles.filter(**{'{0}__isnull'.format(field): False})
+        vouched = dict(located.values_list(field).annotate(Count('id')))
+        public = dict(located.filter(**{'privacy_{0}'.format(field): PUBLIC})
+                      .values_list(field).annotate(Count('id')))
+        for pk, vouched_count in vouched.items():
+            model.objects.filter(pk=pk).update(vouched_count=vouched_count,
+                                               public_count=public.get(pk, 0))
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0001_initial'),
+        ('users', '0002_auto_20150827_0822'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='vouched_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians in this location', editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='public_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians showing this location publicly', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='vouched_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians in this location', editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='public_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians showing this location publicly', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='vouched_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians in this location', editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='public_count',
+            field=models.PositiveIntegerField(default=0, help_text=b'Number of vouched Mozillians showing this location publicly', editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_location_counts, backwards),
+    ]
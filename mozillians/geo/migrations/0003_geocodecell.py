@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0002_location_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCell',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('lat_cell', models.IntegerField()),
+                ('lng_cell', models.IntegerField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('city', models.ForeignKey(blank=True, to='geo.City', null=True)),
+                ('country', models.ForeignKey(blank=True, to='geo.Country', null=True)),
+                ('region', models.ForeignKey(blank=True, to='geo.Region', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='geocodecell',
+            unique_together=set([('lat_cell', 'lng_cell')]),
+        ),
+    ]
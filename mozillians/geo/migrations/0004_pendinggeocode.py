@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_location_indexes'),
+        ('geo', '0003_geocodecell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingGeocode',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('save_region', models.BooleanField(default=True)),
+                ('save_city', models.BooleanField(default=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('profile', models.OneToOneField(related_name='pending_geocode', to='users.UserProfile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
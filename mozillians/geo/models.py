@@ -1,7 +1,28 @@
 from django.db import models
 
 
-class Country(models.Model):
+class LocationBase(models.Model):
+    """Base for locations, with counts of the Mozillians in them.
+
+    Counts are kept up to date by the update_location_counts task,
+    which is queued when profiles move, and reconciled by the
+    update_all_location_counts task.
+    """
+    # UserProfile field pointing to this kind of location.
+    profile_field = None
+
+    vouched_count = models.PositiveIntegerField(
+        default=0, db_index=True, editable=False,
+        help_text='Number of vouched Mozillians in this location')
+    public_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text='Number of vouched Mozillians showing this location publicly')
+
+    class Meta:
+        abstract = True
+
+
+class Country(LocationBase):
     #  {u'type': u'country', u'id': u'country.4150104525', u'name': u'United States'}
     name = models.CharField(
         max_length=120, unique=True,
@@ -15,6 +36,8 @@ class Country(models.Model):
         help_text="'id' field from Mapbox"
     )
 
+    profile_field = 'geo_country'
+
     class Meta(object):
         verbose_name_plural = 'Countries'
 
@@ -22,7 +45,7 @@ class Country(models.Model):
         return self.name
 
 
-class Region(models.Model):
+class Region(LocationBase):
     # {u'type': u'province', u'id': u'province.2516948401', u'name': u'North Carolina'}
     name = models.CharField(
         max_length=120,
@@ -34,6 +57,8 @@ class Region(models.Model):
     )
     country = models.ForeignKey(Country)
 
+    profile_field = 'geo_region'
+
     class Meta(object):
         unique_together = (
             ('name', 'country'),
@@ -43,7 +68,7 @@ class Region(models.Model):
         return u'%s, %s' % (self.name, self.country.name)
 
 
-class City(models.Model):
+class City(LocationBase):
     # {u'name': u'Carrboro', u'lon': -79.083798999999999, u'lat': 35.918596000000001,
     # u'bounds': [-79.100728852067547, 35.889960723848048,
     #             -79.063862048216336, 35.947221266002018],
@@ -61,6 +86,8 @@ class City(models.Model):
     lat = models.FloatField()
     lng = models.FloatField()
 
+    profile_field = 'geo_city'
+
     class Meta:
         verbose_name_plural = 'Cities'
         unique_together = (
@@ -69,3 +96,40 @@ class City(models.Model):
 
     def __unicode__(self):
         return u', '.join([x.name for x in self, self.region, self.country if x])
+
+
+class GeocodeCell(models.Model):
+    """Cached reverse geocoding result of a cell of coordinates.
+
+    Cells are GEOCODE_CELL_SIZE degrees wide in both directions. The
+    locations are None when Mapbox knows of no location in the cell.
+    """
+    lat_cell = models.IntegerField()
+    lng_cell = models.IntegerField()
+    country = models.ForeignKey(Country, null=True, blank=True)
+    region = models.ForeignKey(Region, null=True, blank=True)
+    city = models.ForeignKey(City, null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (
+            ('lat_cell', 'lng_cell'),
+        )
+
+    def __unicode__(self):
+        return u'{0}, {1}'.format(self.lat_cell, self.lng_cell)
+
+
+class PendingGeocode(models.Model):
+    """Profile waiting for its location to be looked up from its lat and lng.
+
+    save_region and save_city tell whether to store the region and the
+    city of the location, or only the country.
+    """
+    profile = models.OneToOneField('users.UserProfile', related_name='pending_geocode')
+    save_region = models.BooleanField(default=True)
+    save_city = models.BooleanField(default=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return unicode(self.profile_id)
@@ -0,0 +1,203 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.loading import get_model
+from django.utils import timezone
+
+from celery.task import periodic_task, task
+
+from mozillians.users.managers import PUBLIC
+
+
+logger = logging.getLogger(__name__)
+
+LOCATION_MODELS = ['Country', 'Region', 'City']
+LOCATION_COUNTS_INTERVAL = 1  # hours
+GEOCODE_QUEUE_DELAY = 10  # seconds
+GEOCODE_QUEUE_INTERVAL = 15  # minutes
+GEOCODE_QUEUE_BATCH = 500
+GEOCODE_QUEUE_KEY = 'geo:geocode_queue'
+
+
+def _count_members(model, ids=None):
+    """Return dicts of location id to vouched and public member counts."""
+    UserProfile = get_model('users', 'UserProfile')
+    field = model.profile_field
+    profiles = UserProfile.objects.vouched().order_by()
+    if ids is not None:
+        profiles = profiles.filter(**{'{0}__in'.format(field): ids})
+    else:
+        profiles = profiles.filter(**{'{0}__isnull'.format(field): False})
+
+    vouched = dict(profiles.values_list(field).annotate(Count('id')))
+    public = dict(profiles.filter(**{'privacy_{0}'.format(field): PUBLIC})
+                  .values_list(field).annotate(Count('id')))
+    return vouched, public
+
+
+def _update_counts(model, ids=None):
+    vouched, public = _count_members(model, ids)
+    locations = model.objects.all()
+    if ids is not None:
+        locations = locations.filter(id__in=ids)
+    current = locations.values_list('id', 'vouched_count', 'public_count')
+    for pk, vouched_count, public_count in current:
+        counts = (vouched.get(pk, 0), public.get(pk, 0))
+        if counts != (vouched_count, public_count):
+            model.objects.filter(pk=pk).update(vouched_count=counts[0],
+                                               public_count=counts[1])
+
+
+@task(ignore_result=True)
+def update_location_counts(country_ids=(), region_ids=(), city_ids=()):
+    """Recount the members of the given countries, regions and cities."""
+    for model_name, ids in zip(LOCATION_MODELS, [country_ids, region_ids, city_ids]):
+        if ids:
+            _update_counts(get_model('geo', model_name), set(ids))
+
+
+@periodic_task(run_every=timedelta(hours=LOCATION_COUNTS_INTERVAL), ignore_result=True)
+def update_all_location_counts():
+    """Fix member counts of locations that drifted from the real count.
+
+    Runs periodically, since a recount queued by a profile save can run
+    before the transaction of the save is committed.
+
+    """
+    for model_name in LOCATION_MODELS:
+        _update_counts(get_model('geo', model_name))
+
+
+def queue_geocode(profile_id, save_region=True, save_city=True):
+    """Queue a profile to have its location looked up from its lat and lng.
+
+    Profiles are marked with a PendingGeocode row and geocoded in a
+    batch by flush_geocode_queue at most every GEOCODE_QUEUE_DELAY
+    seconds. save_region and save_city tell whether to store the region
+    and the city of the location, or only the country.
+
+    """
+    PendingGeocode = get_model('geo', 'PendingGeocode')
+    PendingGeocode.objects.update_or_create(
+        profile_id=profile_id, defaults={'save_region': save_region, 'save_city': save_city})
+
+    if cache.add(GEOCODE_QUEUE_KEY + ':scheduled', True, GEOCODE_QUEUE_DELAY):
+        flush_geocode_queue.apply_async(countdown=GEOCODE_QUEUE_DELAY)
+
+
+@periodic_task(run_every=timedelta(minutes=GEOCODE_QUEUE_INTERVAL), ignore_result=True)
+def flush_geocode_queue():
+    """Geocode all profiles queued by queue_geocode.
+
+    Also runs periodically, so profiles whose scheduled flush was lost
+    are geocoded too. A profile queued again while it is being geocoded
+    stays queued for the next flush.
+
+    """
+    # Saves from now on schedule a new flush.
+    cache.delete(GEOCODE_QUEUE_KEY + ':scheduled')
+
+    PendingGeocode = get_model('geo', 'PendingGeocode')
+    last_id = 0
+    while True:
+        started = timezone.now()
+        pending = list(PendingGeocode.objects.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', 'profile', 'save_region', 'save_city')
+                       [:GEOCODE_QUEUE_BATCH])
+        if not pending:
+            break
+        geocode_profiles(dict((profile_id, (save_region, save_city))
+                              for _, profile_id, save_region, save_city in pending))
+        PendingGeocode.objects.filter(id__in=[row[0] for row in pending],
+                                      updated__lte=started).delete()
+        last_id = pending[-1][0]
+
+
+def geocode_profiles(options, min_interval=0):
+    """Set the location of profiles from their lat and lng.
+
+    options maps profile ids to their (save_region, save_city). Profiles
+    are grouped by geocoding cell, so every cell is looked up once.
+    Lookups that are not cached are at least min_interval seconds
+    apart. Locations are written with queryset updates, followed by a
+    single recount of the affected locations and a single reindex.
+    Returns the ids of the profiles whose location changed.
+
+    """
+    # Avoid circular dependencies
+    from mozillians.geo.lookup import (GeoLookupException, get_cached_geocode,
+                                       get_geocode_cell, reverse_geocode)
+    from mozillians.users.tasks import reindex_profiles
+    UserProfile = get_model('users', 'UserProfile')
+    Country = get_model('geo', 'Country')
+
+    cells = {}
+    profiles = (UserProfile.objects.filter(id__in=options.keys())
+                .exclude(lat__isnull=True).exclude(lng__isnull=True)
+                .order_by('id')
+                .values_list('id', 'lat', 'lng', 'geo_country', 'geo_region', 'geo_city'))
+    for profile in profiles:
+        cells.setdefault(get_geocode_cell(profile[1], profile[2]), []).append(profile)
+
+    updates = {}
+    last_lookup = 0
+    for cell_profiles in cells.values():
+        lat, lng = cell_profiles[0][1:3]
+        try:
+            result = get_cached_geocode(lat, lng)
+            if result is None:
+                time.sleep(max(0, last_lookup + min_interval - time.time()))
+                last_lookup = time.time()
+                result = reverse_geocode(lat, lng, cached=False)
+        except GeoLookupException:
+            # Profiles without a country get the placeholder one, the
+            # others keep their location.
+            error_country = Country.objects.get(mapbox_id='geo_error')
+            for profile in cell_profiles:
+                if not profile[3]:
+                    updates.setdefault((error_country, None, None), []).append(profile)
+            continue
+
+        country, region, city = result
+        if not country:
+            # The location is not inside a country, the placeholder one
+            # replaces the location of the old lat and lng.
+            logger.error('Got back no country from reverse_geocode on %s, %s' % (lng, lat))
+            error_country = Country.objects.get(mapbox_id='geo_error')
+            for profile in cell_profiles:
+                updates.setdefault((error_country, None, None), []).append(profile)
+            continue
+        for profile in cell_profiles:
+            save_region, save_city = options[profile[0]]
+            location = (country,
+                        region if save_region else None,
+                        city if save_city else None)
+            updates.setdefault(location, []).append(profile)
+
+    location_ids = [set(), set(), set()]
+    updated_ids = []
+    for location, location_profiles in updates.items():
+        new_ids = tuple(obj.id if obj else None for obj in location)
+        location_profiles = [profile for profile in location_profiles
+                             if tuple(profile[3:6]) != new_ids]
+        if not location_profiles:
+            continue
+        ids = [profile[0] for profile in location_profiles]
+        country, region, city = location
+        # Updating the queryset sends no signals, the location counts
+        # and the search index are updated once below.
+        UserProfile.objects.filter(id__in=ids).update(geo_country=country, geo_region=region,
+                                                      geo_city=city)
+        updated_ids.extend(ids)
+        for profile in location_profiles:
+            for i, pk in enumerate(profile[3:6] + new_ids):
+                if pk:
+                    location_ids[i % 3].add(pk)
+
+    if updated_ids:
+        update_location_counts(*[list(pks) for pks in location_ids])
+        reindex_profiles(updated_ids)
+    return updated_ids
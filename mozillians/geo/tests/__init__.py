@@ -1,4 +1,8 @@
+import json
 import random
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from contextlib import contextmanager
 
 import factory
 
@@ -35,3 +39,39 @@ class CityFactory(factory.DjangoModelFactory):
 
     class Meta:
         model = City
+
+
+class FakeMapboxHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = json.dumps({'results': self.server.results})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def fake_mapbox(results):
+    """Serve results to reverse geocoding requests from a local server.
+
+    Yields the server, which records the paths requested from it in
+    its requests attribute. Point settings.MAPBOX_API_URL at server.url
+    to use it.
+    """
+    server = HTTPServer(('127.0.0.1', 0), FakeMapboxHandler)
+    server.results = results
+    server.requests = []
+    server.url = 'http://127.0.0.1:{0}'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,36 +1,133 @@
+from datetime import timedelta
+
 from django.test.utils import override_settings
+from django.utils.timezone import now
 
 from mock import patch
 from nose.tools import eq_, ok_
-from requests import ConnectionError, HTTPError
+from requests import ConnectionError, HTTPError, Timeout
 
 from mozillians.common.tests import TestCase
-from mozillians.geo.models import Country, Region, City
+from mozillians.geo.models import Country, GeocodeCell, Region, City
 from mozillians.geo.lookup import (GeoLookupException, deduplicate_cities,
-                                   get_first_mapbox_geocode_result,
-                                   result_to_city, result_to_country_region_city,
-                                   result_to_country, result_to_region, reverse_geocode)
-from mozillians.geo.tests import CountryFactory, RegionFactory, CityFactory
+                                   get_first_mapbox_geocode_result, get_geocode_cell,
+                                   get_session, result_to_city,
+                                   result_to_country_region_city, result_to_country,
+                                   result_to_region, reverse_geocode, set_cached_geocode)
+from mozillians.geo.tests import CountryFactory, RegionFactory, CityFactory, fake_mapbox
 from mozillians.users.tests import UserFactory
 
 
-@patch('mozillians.geo.lookup.requests')
+@patch('mozillians.geo.lookup.get_session')
 class TestCallingGeocode(TestCase):
-    def test_raise_on_error(self, mock_requests):
-        mock_requests.get.return_value.raise_for_status.side_effect = HTTPError
+    def test_raise_on_error(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value.raise_for_status.side_effect = HTTPError
+        with self.assertRaises(GeoLookupException):
+            reverse_geocode(40, 20)
+        mock_get.return_value.raise_for_status.side_effect = ConnectionError
         with self.assertRaises(GeoLookupException):
             reverse_geocode(40, 20)
-        mock_requests.get.return_value.raise_for_status.side_effect = ConnectionError
+        mock_get.side_effect = Timeout
         with self.assertRaises(GeoLookupException):
             reverse_geocode(40, 20)
+        eq_(GeocodeCell.objects.count(), 0)
 
-    def test_url(self, mock_requests):
+    def test_url(self, mock_get_session):
         lng = lat = 1.0
         map_id = 'fake.map.id'
-        with override_settings(MAPBOX_MAP_ID=map_id):
+        with override_settings(MAPBOX_MAP_ID=map_id, MAPBOX_TIMEOUT=3):
             get_first_mapbox_geocode_result('1.0,1.0')
         expected_url = 'http://api.tiles.mapbox.com/v3/%s/geocode/%s,%s.json' % (map_id, lng, lat)
-        mock_requests.get.assert_called_with(expected_url)
+        mock_get_session.return_value.get.assert_called_with(expected_url, timeout=3)
+
+
+class TestGetSession(TestCase):
+    def test_shared(self):
+        ok_(get_session() is get_session())
+
+
+class TestFakeMapbox(TestCase):
+    result = [
+        {'name': 'Carrboro', 'lon': -79.083798999999999, 'lat': 35.918596000000001,
+         'type': 'city', 'id': 'mapbox-places.27510'},
+        {'name': 'North Carolina', 'lon': -78.717434999999995, 'lat': 35.182879999999997,
+         'type': 'province', 'id': 'province.2516948401'},
+        {'name': 'United States', 'lon': -99.041505000000001, 'lat': 37.940711,
+         'type': 'country', 'id': 'country.4150104525'}
+    ]
+
+    def test_reverse_geocode(self):
+        with fake_mapbox([self.result]) as server:
+            with override_settings(MAPBOX_API_URL=server.url, MAPBOX_MAP_ID='fake.map.id'):
+                country, region, city = reverse_geocode(35.9186, -79.0838)
+        eq_(server.requests, ['/v3/fake.map.id/geocode/-79.0838,35.9186.json'])
+        eq_(country.name, 'United States')
+        eq_(region.name, 'North Carolina')
+        eq_(city.name, 'Carrboro')
+
+    def test_cached_in_cell(self):
+        with fake_mapbox([self.result]) as server:
+            with override_settings(MAPBOX_API_URL=server.url):
+                result = reverse_geocode(35.9186, -79.0838)
+                eq_(reverse_geocode(35.9181, -79.0832), result)
+                eq_(len(server.requests), 1)
+                reverse_geocode(35.9286, -79.0838)
+                eq_(len(server.requests), 2)
+
+    def test_no_results_cached(self):
+        with fake_mapbox([]) as server:
+            with override_settings(MAPBOX_API_URL=server.url):
+                eq_(reverse_geocode(0.0, 0.0), (None, None, None))
+                eq_(reverse_geocode(0.0, 0.0), (None, None, None))
+        eq_(len(server.requests), 1)
+
+
+@patch('mozillians.geo.lookup.get_first_mapbox_geocode_result')
+class TestGeocodeCache(TestCase):
+    def test_hit(self, mock_get_result):
+        city = CityFactory.create()
+        set_cached_geocode(40.0, 20.0, city.country, city.region, city)
+        eq_(reverse_geocode(40.001, 20.001), (city.country, city.region, city))
+        ok_(not mock_get_result.called)
+
+    def test_stale(self, mock_get_result):
+        mock_get_result.return_value = {}
+        city = CityFactory.create()
+        set_cached_geocode(40.0, 20.0, city.country, city.region, city)
+        GeocodeCell.objects.update(updated=now() - timedelta(days=31))
+        eq_(reverse_geocode(40.0, 20.0), (None, None, None))
+        ok_(mock_get_result.called)
+        eq_(GeocodeCell.objects.get().country, None)
+
+    def test_empty_stale(self, mock_get_result):
+        mock_get_result.return_value = {}
+        set_cached_geocode(40.0, 20.0, None, None, None)
+        eq_(reverse_geocode(40.0, 20.0), (None, None, None))
+        ok_(not mock_get_result.called)
+        GeocodeCell.objects.update(updated=now() - timedelta(hours=2))
+        eq_(reverse_geocode(40.0, 20.0), (None, None, None))
+        ok_(mock_get_result.called)
+
+    def test_not_cached(self, mock_get_result):
+        mock_get_result.return_value = {}
+        city = CityFactory.create()
+        set_cached_geocode(40.0, 20.0, city.country, city.region, city)
+        eq_(reverse_geocode(40.0, 20.0, cached=False), (None, None, None))
+        ok_(mock_get_result.called)
+
+    def test_deleted_city(self, mock_get_result):
+        mock_get_result.return_value = {}
+        city = CityFactory.create()
+        set_cached_geocode(40.0, 20.0, city.country, city.region, city)
+        city.delete()
+        eq_(reverse_geocode(40.0, 20.0), (None, None, None))
+        ok_(mock_get_result.called)
+
+    def test_get_geocode_cell(self, mock_get_result):
+        eq_(get_geocode_cell(35.9186, -79.0838), (3591, -7909))
+        eq_(get_geocode_cell(35.9181, -79.0832), (3591, -7909))
+        eq_(get_geocode_cell(-0.001, 0.001), (-1, 0))
 
 
 @patch('mozillians.geo.lookup.result_to_country_region_city')
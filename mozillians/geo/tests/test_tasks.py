@@ -0,0 +1,281 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from mock import call, patch
+from nose.tools import eq_, ok_
+
+from mozillians.common.tests import TestCase
+from mozillians.geo.lookup import GeoLookupException, set_cached_geocode
+from mozillians.geo.models import City, Country, PendingGeocode
+from mozillians.geo.tasks import (GEOCODE_QUEUE_DELAY, flush_geocode_queue, geocode_profiles,
+                                  queue_geocode, update_all_location_counts,
+                                  update_location_counts)
+from mozillians.geo.tests import CityFactory, CountryFactory
+from mozillians.users.managers import PUBLIC
+from mozillians.users.models import LOCATION_COUNTS_DELAY, UserProfile
+from mozillians.users.tests import UserFactory
+
+
+class LocationCountsTests(TestCase):
+    def assert_counts(self, location, vouched_count, public_count):
+        location = type(location).objects.get(pk=location.pk)
+        eq_((location.vouched_count, location.public_count),
+            (vouched_count, public_count))
+
+    def test_update_location_counts(self):
+        city = CityFactory.create()
+        UserFactory.create(userprofile={'geo_city': city, 'privacy_geo_city': PUBLIC})
+        UserFactory.create(userprofile={'geo_city': city})
+        UserFactory.create(vouched=False, userprofile={'geo_city': city})
+        City.objects.filter(pk=city.pk).update(vouched_count=0, public_count=0)
+
+        update_location_counts(city_ids=[city.id])
+        self.assert_counts(city, 2, 1)
+
+    def test_update_location_counts_other_locations(self):
+        city = CityFactory.create()
+        UserFactory.create(userprofile={'geo_city': city})
+        City.objects.filter(pk=city.pk).update(vouched_count=0)
+
+        update_location_counts(city_ids=[city.id + 1])
+        self.assert_counts(city, 0, 0)
+
+    def test_update_all_location_counts(self):
+        country = CountryFactory.create()
+        UserFactory.create(userprofile={'geo_country': country})
+        Country.objects.filter(pk=country.pk).update(vouched_count=5, public_count=3)
+
+        update_all_location_counts()
+        self.assert_counts(country, 1, 0)
+
+    def test_profile_location_change(self):
+        country = CountryFactory.create()
+        country2 = CountryFactory.create()
+        user = UserFactory.create(userprofile={'geo_country': country})
+        self.assert_counts(country, 1, 0)
+
+        user.userprofile.geo_country = country2
+        user.userprofile.save()
+        self.assert_counts(country, 0, 0)
+        self.assert_counts(country2, 1, 0)
+
+    def test_profile_privacy_change(self):
+        region = CityFactory.create().region
+        user = UserFactory.create(userprofile={'geo_region': region})
+        self.assert_counts(region, 1, 0)
+
+        user.userprofile.privacy_geo_region = PUBLIC
+        user.userprofile.save()
+        self.assert_counts(region, 1, 1)
+
+    def test_profile_unvouch(self):
+        country = CountryFactory.create()
+        user = UserFactory.create(userprofile={'geo_country': country})
+        self.assert_counts(country, 1, 0)
+
+        user.userprofile.vouches_received.all().delete()
+        self.assert_counts(country, 0, 0)
+
+    def test_profile_delete(self):
+        country = CountryFactory.create()
+        user = UserFactory.create(userprofile={'geo_country': country})
+        self.assert_counts(country, 1, 0)
+
+        user.userprofile.delete()
+        self.assert_counts(country, 0, 0)
+
+    def test_deferred_profile_location_change(self):
+        country = CountryFactory.create()
+        country2 = CountryFactory.create()
+        user = UserFactory.create(userprofile={'geo_country': country})
+
+        profile = UserProfile.objects.only('id').get(pk=user.userprofile.pk)
+        profile.geo_country = country2
+        profile.save()
+        self.assert_counts(country, 0, 0)
+        self.assert_counts(country2, 1, 0)
+
+    @patch('mozillians.users.models.update_location_counts')
+    def test_profile_unchanged_location(self, update_mock):
+        user = UserFactory.create()
+        update_mock.reset_mock()
+
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        profile.bio = 'Updated bio'
+        profile.save()
+        ok_(not update_mock.delay.called)
+        ok_(not update_mock.apply_async.called)
+
+    @patch('mozillians.users.models.update_location_counts')
+    def test_recount_after_commit(self, update_mock):
+        country = CountryFactory.create()
+        user = UserFactory.create()
+        update_mock.reset_mock()
+
+        user.userprofile.geo_country = country
+        # Tests run in a transaction.
+        user.userprofile.save()
+        args, kwargs = update_mock.apply_async.call_args
+        ok_(country.id in args[0][0])
+        eq_(kwargs, {'countdown': LOCATION_COUNTS_DELAY})
+        ok_(not update_mock.delay.called)
+
+
+class GeocodeQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_1 = UserFactory.create().userprofile
+        self.profile_2 = UserFactory.create().userprofile
+
+    @patch('mozillians.geo.tasks.flush_geocode_queue.apply_async')
+    def test_queue_schedules_single_flush(self, apply_async_mock):
+        queue_geocode(self.profile_1.id)
+        queue_geocode(self.profile_2.id)
+        queue_geocode(self.profile_1.id)
+        apply_async_mock.assert_called_once_with(countdown=GEOCODE_QUEUE_DELAY)
+        eq_(PendingGeocode.objects.count(), 2)
+
+    @patch('mozillians.geo.tasks.geocode_profiles')
+    def test_flush_latest_options(self, geocode_profiles_mock):
+        with patch('mozillians.geo.tasks.flush_geocode_queue.apply_async'):
+            queue_geocode(self.profile_1.id)
+            queue_geocode(self.profile_2.id, save_city=False)
+            queue_geocode(self.profile_1.id, save_region=False, save_city=False)
+        flush_geocode_queue()
+        geocode_profiles_mock.assert_called_once_with({self.profile_1.id: (False, False),
+                                                       self.profile_2.id: (True, False)})
+
+        # The queue is empty after a flush.
+        ok_(not PendingGeocode.objects.exists())
+        geocode_profiles_mock.reset_mock()
+        flush_geocode_queue()
+        ok_(not geocode_profiles_mock.called)
+
+    @patch('mozillians.geo.tasks.GEOCODE_QUEUE_BATCH', 1)
+    @patch('mozillians.geo.tasks.geocode_profiles')
+    def test_flush_batches(self, geocode_profiles_mock):
+        with patch('mozillians.geo.tasks.flush_geocode_queue.apply_async'):
+            queue_geocode(self.profile_1.id)
+            queue_geocode(self.profile_2.id)
+        flush_geocode_queue()
+        eq_(geocode_profiles_mock.call_args_list,
+            [call({self.profile_1.id: (True, True)}), call({self.profile_2.id: (True, True)})])
+        ok_(not PendingGeocode.objects.exists())
+
+    @patch('mozillians.geo.tasks.geocode_profiles')
+    def test_queued_again_during_flush(self, geocode_profiles_mock):
+        def queue_again(options):
+            queue_geocode(self.profile_1.id, save_city=False)
+
+        with patch('mozillians.geo.tasks.flush_geocode_queue.apply_async'):
+            queue_geocode(self.profile_1.id)
+            geocode_profiles_mock.side_effect = queue_again
+            with patch('mozillians.geo.tasks.timezone') as timezone_mock:
+                timezone_mock.now.return_value = timezone.now() - timedelta(seconds=1)
+                flush_geocode_queue()
+
+        pending = PendingGeocode.objects.get()
+        eq_(pending.profile, self.profile_1)
+        ok_(not pending.save_city)
+
+    @patch('mozillians.geo.tasks.geocode_profiles')
+    def test_flush_failure_keeps_queue(self, geocode_profiles_mock):
+        with patch('mozillians.geo.tasks.flush_geocode_queue.apply_async'):
+            queue_geocode(self.profile_1.id)
+        geocode_profiles_mock.side_effect = Exception
+        with self.assertRaises(Exception):
+            flush_geocode_queue()
+        ok_(PendingGeocode.objects.filter(profile=self.profile_1).exists())
+
+
+@patch('mozillians.users.tasks.reindex_profiles')
+@patch('mozillians.geo.lookup.reverse_geocode')
+class GeocodeProfilesTests(TestCase):
+    def setUp(self):
+        self.city = CityFactory.create()
+        self.country = self.city.country
+        self.region = self.city.region
+
+    def create_profile(self, lat, lng, **kwargs):
+        kwargs.update({'lat': lat, 'lng': lng})
+        return UserFactory.create(userprofile=kwargs).userprofile
+
+    def test_cells_geocoded_once(self, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.return_value = (self.country, self.region, self.city)
+        profiles = [self.create_profile(40.0011, 20.0011),
+                    self.create_profile(40.0012, 20.0012),
+                    self.create_profile(50.0, 20.0)]
+        ids = [profile.id for profile in profiles]
+
+        eq_(sorted(geocode_profiles(dict((pk, (True, True)) for pk in ids))), sorted(ids))
+        eq_(reverse_geocode_mock.call_count, 2)
+        eq_(reverse_geocode_mock.call_args[1], {'cached': False})
+        for profile in UserProfile.objects.filter(id__in=ids):
+            eq_((profile.geo_country, profile.geo_region, profile.geo_city),
+                (self.country, self.region, self.city))
+        eq_(reindex_mock.call_count, 1)
+        eq_(sorted(reindex_mock.call_args[0][0]), sorted(ids))
+        eq_(Country.objects.get(pk=self.country.pk).vouched_count, 3)
+
+    def test_cached_cell(self, reverse_geocode_mock, reindex_mock):
+        set_cached_geocode(40.0, 20.0, self.country, self.region, self.city)
+        profile = self.create_profile(40.0, 20.0)
+
+        eq_(geocode_profiles({profile.id: (True, True)}), [profile.id])
+        ok_(not reverse_geocode_mock.called)
+        eq_(UserProfile.objects.get(pk=profile.pk).geo_city, self.city)
+
+    def test_save_options(self, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.return_value = (self.country, self.region, self.city)
+        profile = self.create_profile(40.0, 20.0)
+        profile2 = self.create_profile(40.0, 20.0)
+
+        geocode_profiles({profile.id: (False, False), profile2.id: (True, False)})
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_((profile.geo_country, profile.geo_region, profile.geo_city),
+            (self.country, None, None))
+        profile2 = UserProfile.objects.get(pk=profile2.pk)
+        eq_((profile2.geo_country, profile2.geo_region, profile2.geo_city),
+            (self.country, self.region, None))
+
+    @patch('mozillians.users.models.queue_index_update')
+    def test_no_signals(self, queue_index_update_mock, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.return_value = (self.country, self.region, self.city)
+        profile = self.create_profile(40.0, 20.0)
+        queue_index_update_mock.reset_mock()
+
+        eq_(geocode_profiles({profile.id: (True, True)}), [profile.id])
+        ok_(not queue_index_update_mock.called)
+
+    def test_unchanged(self, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.return_value = (self.country, self.region, self.city)
+        profile = self.create_profile(40.0, 20.0, geo_country=self.country,
+                                      geo_region=self.region, geo_city=self.city)
+
+        eq_(geocode_profiles({profile.id: (True, True)}), [])
+        ok_(not reindex_mock.called)
+
+    def test_lookup_error(self, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.side_effect = GeoLookupException
+        error_country = Country.objects.create(name='Error', mapbox_id='geo_error')
+        profile = self.create_profile(40.0, 20.0, geo_country=None, geo_region=None,
+                                      geo_city=None)
+        profile2 = self.create_profile(40.0, 20.0, geo_country=self.country)
+
+        eq_(geocode_profiles({profile.id: (True, True), profile2.id: (True, True)}),
+            [profile.id])
+        eq_(UserProfile.objects.get(pk=profile.pk).geo_country, error_country)
+        eq_(UserProfile.objects.get(pk=profile2.pk).geo_country, self.country)
+
+    def test_no_country(self, reverse_geocode_mock, reindex_mock):
+        reverse_geocode_mock.return_value = (None, None, None)
+        error_country = Country.objects.create(name='Error', mapbox_id='geo_error')
+        profile = self.create_profile(0.0, 0.0, geo_country=self.country)
+
+        eq_(geocode_profiles({profile.id: (True, True)}), [profile.id])
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.geo_country, error_country)
+        eq_(profile.geo_region, None)
+        eq_(profile.geo_city, None)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def populate_member_count(apps, schema_editor):
+    for model_name in ['Group', 'Skill']:
+        model = apps.get_model('groups', model_name)
+        counts = model.objects.annotate(mcount=Count('members')).values_list('id', 'mcount')
+        for pk, mcount in counts:
+            if mcount:
+                model.objects.filter(pk=pk).update(member_count=mcount)
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0003_groupmembership_invalidate'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_member_count, backwards),
+    ]
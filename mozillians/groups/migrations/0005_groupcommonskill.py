@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def populate_common_skills(apps, schema_editor):
+    Group = apps.get_model('groups', 'Group')
+    GroupCommonSkill = apps.get_model('groups', 'GroupCommonSkill')
+    Skill = apps.get_model('groups', 'Skill')
+
+    for group_id in Group.objects.values_list('id', flat=True):
+        counts = (Skill.objects
+                  .filter(members__groupmembership__group=group_id,
+                          members__groupmembership__status='member')
+                  .annotate(mcount=Count('members'))
+                  .filter(mcount__gt=1)
+                  .values_list('id', 'mcount'))
+        GroupCommonSkill.objects.bulk_create([
+            GroupCommonSkill(group_id=group_id, skill_id=skill_id, member_count=mcount)
+            for skill_id, mcount in counts])
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0004_member_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupCommonSkill',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('member_count', models.PositiveIntegerField()),
+                ('group', models.ForeignKey(related_name='common_skills', to='groups.Group')),
+                ('skill', models.ForeignKey(related_name='+', to='groups.Skill')),
+            ],
+            options={
+                'ordering': ['-member_count', 'skill__name'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupcommonskill',
+            unique_together=set([('group', 'skill')]),
+        ),
+        migrations.RunPython(populate_common_skills, backwards),
+    ]
@@ -1,5 +1,7 @@
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, signals as dbsignals
+from django.dispatch import receiver
 from django.utils.timezone import now
 
 from autoslug.fields import AutoSlugField
@@ -10,7 +12,8 @@ from tower import ugettext_lazy as _lazy
 
 from mozillians.groups.managers import GroupBaseManager, GroupQuerySet
 from mozillians.groups.helpers import slugify
-from mozillians.groups.tasks import email_membership_change, member_removed_email
+from mozillians.groups.tasks import (email_membership_change, member_removed_email,
+                                     schedule_common_skills_update)
 from mozillians.users.tasks import update_basket_task
 
 
@@ -18,6 +21,9 @@ class GroupBase(models.Model):
     name = models.CharField(db_index=True, max_length=50,
                             unique=True, verbose_name=_lazy(u'Name'))
     url = models.SlugField(blank=True)
+    # Number of members, including pending ones. Maintained by signals
+    # and fixed by the update_member_counts task.
+    member_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
 
     objects = GroupBaseManager.from_queryset(GroupQuerySet)()
 
@@ -36,6 +42,11 @@ class GroupBase(models.Model):
             raise ValidationError({'name': _('This name already exists.')})
         return self.name
 
+    @classmethod
+    def update_member_count(cls, pks, delta):
+        """Add delta to the member count of the groups with pks."""
+        cls.objects.filter(pk__in=pks).update(member_count=F('member_count') + delta)
+
     @classmethod
     def search(cls, query):
         query = query.lower()
@@ -305,6 +316,23 @@ class Group(GroupBase):
                                                status=GroupMembership.PENDING).exists()
 
 
+class GroupCommonSkill(models.Model):
+    """A skill shared by more than one member of a group.
+
+    Maintained by the update_common_skills task.
+    """
+    group = models.ForeignKey('Group', related_name='common_skills')
+    skill = models.ForeignKey('Skill', related_name='+')
+    member_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['-member_count', 'skill__name']
+        unique_together = ('group', 'skill')
+
+    def __unicode__(self):
+        return u'%s in %s' % (self.skill, self.group)
+
+
 class SkillAlias(GroupAliasBase):
     alias = models.ForeignKey('Skill', related_name='aliases')
 
@@ -314,3 +342,26 @@ class SkillAlias(GroupAliasBase):
 
 class Skill(GroupBase):
     ALIAS_MODEL = SkillAlias
+
+
+@receiver(dbsignals.post_save, sender=GroupMembership,
+          dispatch_uid='increase_group_member_count_sig')
+def increase_group_member_count(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        Group.update_member_count([instance.group_id], 1)
+
+
+@receiver(dbsignals.post_delete, sender=GroupMembership,
+          dispatch_uid='update_common_skills_delete_sig')
+@receiver(dbsignals.post_save, sender=GroupMembership,
+          dispatch_uid='update_common_skills_save_sig')
+def update_common_skills(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    schedule_common_skills_update([instance.group_id])
+
+
+@receiver(dbsignals.post_delete, sender=GroupMembership,
+          dispatch_uid='decrease_group_member_count_sig')
+def decrease_group_member_count(sender, instance, **kwargs):
+    Group.update_member_count([instance.group_id], -1)
@@ -1,16 +1,25 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import send_mail
+from django.db import transaction
 from django.db.models import Count, Max
 from django.db.models.loading import get_model
 from django.template import Context
 from django.template.loader import get_template, render_to_string
 
 import tower
-from celery.task import task
+from celery.task import periodic_task, task
 from tower import ugettext as _
 
 
+COMMON_SKILLS_UPDATE_DELAY = 60  # seconds
+MEMBER_COUNTS_INTERVAL = 6  # hours
+COMMON_SKILLS_INTERVAL = 24  # hours
+
+
 @task(ignore_result=True)
 def remove_empty_groups():
     """Remove empty groups."""
@@ -22,6 +31,77 @@ def remove_empty_groups():
          .annotate(mcount=Count('members')).filter(mcount=0).delete())
 
 
+@periodic_task(run_every=timedelta(hours=MEMBER_COUNTS_INTERVAL), ignore_result=True)
+def update_member_counts():
+    """Fix member counts of groups and skills that drifted from the real count.
+
+    Runs periodically, the counts are otherwise only maintained by
+    membership signals.
+
+    """
+    Group = get_model('groups', 'Group')
+    Skill = get_model('groups', 'Skill')
+
+    for model in [Group, Skill]:
+        counts = (model.objects.annotate(mcount=Count('members'))
+                  .values_list('id', 'member_count', 'mcount'))
+        for pk, member_count, mcount in counts:
+            if member_count != mcount:
+                model.objects.filter(pk=pk).update(member_count=mcount)
+
+
+def schedule_common_skills_update(group_ids):
+    """Schedule update_common_skills for groups.
+
+    At most one update per group is scheduled every
+    COMMON_SKILLS_UPDATE_DELAY seconds.
+
+    """
+    for group_id in set(group_ids):
+        if cache.add('groups:common_skills:{0}'.format(group_id), True,
+                     COMMON_SKILLS_UPDATE_DELAY):
+            update_common_skills.apply_async(args=[group_id],
+                                             countdown=COMMON_SKILLS_UPDATE_DELAY)
+
+
+@task(ignore_result=True)
+def update_common_skills(group_id):
+    """Store the skills shared by more than one member of a group."""
+    GroupCommonSkill = get_model('groups', 'GroupCommonSkill')
+    GroupMembership = get_model('groups', 'GroupMembership')
+    Skill = get_model('groups', 'Skill')
+
+    # Changes from now on schedule a new update.
+    cache.delete('groups:common_skills:{0}'.format(group_id))
+
+    counts = (Skill.objects
+              .filter(members__groupmembership__group=group_id,
+                      members__groupmembership__status=GroupMembership.MEMBER)
+              .annotate(mcount=Count('members'))
+              .filter(mcount__gt=1)
+              .values_list('id', 'mcount'))
+
+    with transaction.atomic():
+        GroupCommonSkill.objects.filter(group=group_id).delete()
+        GroupCommonSkill.objects.bulk_create([
+            GroupCommonSkill(group_id=group_id, skill_id=skill_id, member_count=mcount)
+            for skill_id, mcount in counts])
+
+
+@periodic_task(run_every=timedelta(hours=COMMON_SKILLS_INTERVAL), ignore_result=True)
+def update_all_common_skills():
+    """Update the common skills of all groups.
+
+    Runs daily, to rebuild common skills that the debounced per group
+    updates missed.
+
+    """
+    Group = get_model('groups', 'Group')
+
+    for group_id in Group.objects.values_list('id', flat=True):
+        update_common_skills(group_id)
+
+
 # TODO: Schedule this task nightly
 
 @task(ignore_result=True)
@@ -5,7 +5,7 @@ from django.core.urlresolvers import reverse
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, GroupAlias, GroupMembership
+from mozillians.groups.models import Group, GroupAlias, GroupMembership, Skill
 from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
                                      SkillFactory)
 from mozillians.users.tests import UserFactory
@@ -118,6 +118,20 @@ class GroupBaseTests(TestCase):
         ok_(not skill.has_member(userprofile=user.userprofile))
         ok_(user.userprofile not in skill.members.all())
 
+    def test_skill_member_count(self):
+        skill = SkillFactory.create()
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        skill.add_member(user_1.userprofile)
+        user_2.userprofile.skills.add(skill)
+        user_2.userprofile.skills.add(skill)
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 2)
+
+        skill.remove_member(user_1.userprofile)
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 1)
+        user_2.userprofile.skills.clear()
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 0)
+
     def test_has_member(self):
         skill = SkillFactory.create()
         user = UserFactory.create()
@@ -250,6 +264,20 @@ class GroupTests(TestCase):
                                            status=GroupMembership.MEMBER).exists())
         ok_(group.has_member(user.userprofile))
 
+    def test_member_count(self):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        group = GroupFactory.create()
+        group.add_member(user_1.userprofile)
+        group.add_member(user_2.userprofile, status=GroupMembership.PENDING)
+        group.add_member(user_2.userprofile)
+        eq_(Group.objects.get(pk=group.pk).member_count, 2)
+
+        group.remove_member(user_1.userprofile)
+        eq_(Group.objects.get(pk=group.pk).member_count, 1)
+        user_2.userprofile.delete()
+        eq_(Group.objects.get(pk=group.pk).member_count, 0)
+
     def test_has_member(self):
         user = UserFactory.create()
         group = GroupFactory.create()
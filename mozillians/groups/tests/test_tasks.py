@@ -4,10 +4,11 @@ from mozillians.groups.tasks import email_membership_change
 from nose.tools import eq_, ok_
 
 from django.conf import settings
+from django.core.cache import cache
 
 from mozillians.common.tests import TestCase
 from mozillians.groups import tasks
-from mozillians.groups.models import Group, GroupMembership, Skill
+from mozillians.groups.models import Group, GroupCommonSkill, GroupMembership, Skill
 from mozillians.groups.tests import GroupFactory, SkillFactory
 from mozillians.users.tests import UserFactory
 
@@ -31,6 +32,49 @@ class SendPendingMembershipEmailsTests(TestCase):
         eq_(Skill.objects.all().count(), 1)
         ok_(Skill.objects.filter(id=skill_1.id).exists())
 
+    def test_update_member_counts(self):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        skill = SkillFactory.create()
+        group.add_member(user.userprofile)
+        skill.add_member(user.userprofile)
+        Group.objects.filter(pk=group.pk).update(member_count=5)
+        Skill.objects.filter(pk=skill.pk).update(member_count=0)
+
+        tasks.update_member_counts()
+
+        eq_(Group.objects.get(pk=group.pk).member_count, 1)
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 1)
+
+    def test_update_common_skills(self):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        user_3 = UserFactory.create()
+        group = GroupFactory.create()
+        group.add_member(user_1.userprofile)
+        group.add_member(user_2.userprofile)
+        group.add_member(user_3.userprofile, GroupMembership.PENDING)
+        skill_1 = SkillFactory.create()
+        skill_2 = SkillFactory.create()
+        for user in [user_1, user_2, user_3]:
+            skill_1.members.add(user.userprofile)
+        skill_2.members.add(user_1.userprofile)
+        skill_2.members.add(user_3.userprofile)
+        GroupCommonSkill.objects.all().delete()
+
+        tasks.update_common_skills(group.id)
+
+        eq_([(common_skill.skill, common_skill.member_count)
+             for common_skill in group.common_skills.all()], [(skill_1, 2)])
+
+    @patch('mozillians.groups.tasks.update_common_skills.apply_async')
+    def test_schedule_common_skills_update(self, apply_async_mock):
+        cache.clear()
+        tasks.schedule_common_skills_update([1, 1, 2])
+        tasks.schedule_common_skills_update([2])
+        eq_(apply_async_mock.call_count, 2)
+        apply_async_mock.assert_any_call(args=[1], countdown=tasks.COMMON_SKILLS_UPDATE_DELAY)
+
     def test_sending_pending_email(self):
         # If a curated group has a pending membership, added since the reminder email
         # was last sent, send the curator an email.  It should contain the count of
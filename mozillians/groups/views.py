@@ -1,7 +1,5 @@
 import json
 
-from collections import defaultdict
-
 from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import EmptyPage, Paginator, PageNotAnInteger
@@ -11,11 +9,12 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.cache import cache_control, never_cache
 from django.views.decorators.http import require_POST
 
+from django_statsd.clients import statsd
 from funfactory.urlresolvers import reverse
 from mozillians.users.models import UserProfile
 from tower import ugettext as _
 
-from mozillians.common.decorators import allow_unvouched
+from mozillians.common.decorators import allow_unvouched, instrument_view
 from mozillians.groups.forms import GroupForm, MembershipFilterForm, SortForm, SuperuserGroupForm
 from mozillians.groups.models import Group, Skill, GroupMembership
 
@@ -91,6 +90,7 @@ def search(request, searched_object=Group):
 
 
 @never_cache
+@instrument_view('groups.show')
 def show(request, url, alias_model, template):
     """List all members in this group."""
     group_alias = get_object_or_404(alias_model, url=url)
@@ -143,21 +143,10 @@ def show(request, url, alias_model, template):
         # Order by UserProfile.Meta.ordering
         memberships = memberships.order_by('userprofile')
 
-        # Find the most common skills of the group members.
-        # Order by popularity in the group.
-        shared_skill_ids = (group.members.filter(groupmembership__status=GroupMembership.MEMBER)
-                            .values_list('skills', flat=True))
-
-        count_skills = defaultdict(int)
-        for skill_id in shared_skill_ids:
-            count_skills[skill_id] += 1
-        common_skills_ids = [k for k, v in sorted(count_skills.items(),
-                                                  key=lambda x: x[1],
-                                                  reverse=True)
-                             if count_skills[k] > 1]
-
-        # Translate ids to Skills preserving order.
-        skills = [Skill.objects.get(id=skill_id) for skill_id in common_skills_ids if skill_id]
+        # The most common skills of the group members, ordered by
+        # popularity in the group.
+        skills = [common_skill.skill
+                  for common_skill in group.common_skills.select_related('skill')]
 
         data.update(skills=skills, membership_filter_form=membership_filter_form)
 
@@ -187,7 +176,8 @@ def show(request, url, alias_model, template):
 
     data.update(extra_data)
 
-    return render(request, template, data)
+    with statsd.timer('views.groups.show.render'):
+        return render(request, template, data)
 
 
 def remove_member(request, url, user_pk):
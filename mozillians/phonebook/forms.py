@@ -14,6 +14,7 @@ from PIL import Image
 from tower import ugettext as _, ugettext_lazy as _lazy
 
 from mozillians.api.models import APIv2App
+from mozillians.geo.tasks import queue_geocode
 from mozillians.groups.models import Skill
 from mozillians.phonebook.models import Invite
 from mozillians.phonebook.validators import validate_username
@@ -237,6 +238,10 @@ class LocationForm(happyforms.ModelForm):
         fields = ('timezone', 'privacy_timezone', 'privacy_geo_city', 'privacy_geo_region',
                   'privacy_geo_country',)
 
+    def __init__(self, *args, **kwargs):
+        super(LocationForm, self).__init__(*args, **kwargs)
+        self.geocode_pending = False
+
     def clean(self):
         # If lng/lat were provided, make sure they point at a country somewhere...
         if self.cleaned_data.get('lat') is not None and self.cleaned_data.get('lng') is not None:
@@ -245,8 +250,13 @@ class LocationForm(happyforms.ModelForm):
                     'saveregion' in self.changed_data or 'savecity' in self.changed_data):
                 self.instance.lat = self.cleaned_data['lat']
                 self.instance.lng = self.cleaned_data['lng']
-                self.instance.reverse_geocode()
-                if not self.instance.geo_country:
+                # Locations missing from the geocoding cache are looked
+                # up in the background once the profile is saved, unless
+                # the profile has no country yet.
+                country = self.instance.geo_country
+                lookup = country is None or country.mapbox_id == 'geo_error'
+                self.geocode_pending = not self.instance.reverse_geocode(lookup=lookup)
+                if not self.geocode_pending and not self.instance.geo_country:
                     error_msg = _('Location must be inside a country.')
                     self.errors['savecountry'] = self.error_class([error_msg])
                     del self.cleaned_data['savecountry']
@@ -267,6 +277,13 @@ class LocationForm(happyforms.ModelForm):
 
         return self.cleaned_data
 
+    def save(self, *args, **kwargs):
+        profile = super(LocationForm, self).save(*args, **kwargs)
+        if self.geocode_pending:
+            queue_geocode(profile.id, save_region=bool(self.cleaned_data.get('saveregion')),
+                          save_city=bool(self.cleaned_data.get('savecity')))
+        return profile
+
 
 class ContributionForm(happyforms.ModelForm):
     date_mozillian = forms.DateField(
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
 from mock import patch
@@ -5,6 +6,7 @@ from nose.tools import eq_, ok_
 from requests import ConnectionError
 
 from mozillians.common.tests import TestCase
+from mozillians.geo.lookup import set_cached_geocode
 from mozillians.geo.models import Country
 from mozillians.geo.tests import CountryFactory, RegionFactory, CityFactory
 from mozillians.phonebook.forms import LocationForm
@@ -152,6 +154,7 @@ class ProfileEditTests(TestCase):
 
 class LocationEditTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = UserFactory.create(email='latlng@example.com',
                                        userprofile={'geo_country': None,
                                                     'geo_region': None,
@@ -174,19 +177,24 @@ class LocationEditTests(TestCase):
         self.region = RegionFactory.create(country=self.country, mapbox_id='reg1', name='Ontario')
         self.city = CityFactory.create(region=self.region, mapbox_id='city1', name='Toronto')
 
-    @patch('mozillians.geo.lookup.reverse_geocode')
-    def test_location_city_region_optout(self, mock_reverse_geocode):
-        mock_reverse_geocode.return_value = (self.country, self.region, self.city)
+    def test_location_city_region_optout(self):
+        set_cached_geocode(self.data['lat'], self.data['lng'],
+                           self.country, self.region, self.city)
         self.data.update(_get_privacy_fields(MOZILLIANS))
         form = LocationForm(data=self.data)
         eq_(form.is_valid(), True)
+        ok_(not form.geocode_pending)
         eq_(form.instance.geo_country, self.country)
         eq_(form.instance.geo_region, None)
         eq_(form.instance.geo_city, None)
 
+    @patch('mozillians.phonebook.forms.queue_geocode')
     @patch('mozillians.geo.lookup.reverse_geocode')
-    def test_location_api_called_when_latlng_changed(self, mock_reverse_geocode):
+    def test_location_api_called_when_latlng_changed(self, mock_reverse_geocode,
+                                                     mock_queue_geocode):
         mock_reverse_geocode.return_value = (self.country, self.region, self.city)
+        self.user.userprofile.geo_country = self.country
+        self.user.userprofile.save()
         self.data['lat'] = 40
         self.data['lng'] = 20
         self.data.update(_get_privacy_fields(MOZILLIANS))
@@ -195,9 +203,40 @@ class LocationEditTests(TestCase):
             'lng': self.user.userprofile.lng
         }
 
-        form = LocationForm(data=self.data, initial=initial)
+        form = LocationForm(data=self.data, initial=initial, instance=self.user.userprofile)
+        ok_(form.is_valid())
+        # Mapbox is called in the background for profiles with a country.
+        ok_(not mock_reverse_geocode.called)
+        ok_(form.geocode_pending)
+        form.save()
+        mock_queue_geocode.assert_called_with(self.user.userprofile.id, save_region=False,
+                                              save_city=False)
+
+    @patch('mozillians.phonebook.forms.queue_geocode')
+    @patch('mozillians.geo.lookup.reverse_geocode')
+    def test_location_api_called_without_country(self, mock_reverse_geocode,
+                                                 mock_queue_geocode):
+        mock_reverse_geocode.return_value = (self.country, self.region, self.city)
+        self.data.update({'saveregion': True, 'savecity': True})
+        self.data.update(_get_privacy_fields(MOZILLIANS))
+
+        form = LocationForm(data=self.data, instance=self.user.userprofile)
         ok_(form.is_valid())
         ok_(mock_reverse_geocode.called)
+        ok_(not form.geocode_pending)
+        eq_(form.instance.geo_country, self.country)
+        eq_(form.instance.geo_city, self.city)
+        form.save()
+        ok_(not mock_queue_geocode.called)
+
+    @patch('mozillians.geo.lookup.reverse_geocode')
+    def test_location_outside_country_without_country(self, mock_reverse_geocode):
+        mock_reverse_geocode.return_value = (None, None, None)
+        self.data.update(_get_privacy_fields(MOZILLIANS))
+
+        form = LocationForm(data=self.data, instance=self.user.userprofile)
+        ok_(not form.is_valid())
+        ok_('savecountry' in form.errors)
 
     @patch('mozillians.geo.lookup.reverse_geocode')
     def test_location_api_not_called_when_latlang_unchanged(self, mock_reverse_geocode):
@@ -224,9 +263,10 @@ class LocationEditTests(TestCase):
         ok_(not form.is_valid())
         ok_('saveregion' in form.errors)
 
-    @patch('mozillians.geo.lookup.requests')
-    def test_location_profile_save_connectionerror(self, mock_requests):
-        mock_requests.get.return_value.raise_for_status.side_effect = ConnectionError
+    @patch('mozillians.geo.lookup.get_session')
+    def test_location_profile_save_connectionerror(self, mock_get_session):
+        mock_get = mock_get_session.return_value.get
+        mock_get.return_value.raise_for_status.side_effect = ConnectionError
         error_country = Country.objects.create(name='Error', mapbox_id='geo_error')
         self.data.update(_get_privacy_fields(MOZILLIANS))
         url = reverse('phonebook:profile_edit', prefix='/en-US/')
@@ -1,12 +1,16 @@
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from funfactory.helpers import urlparams
 
 from mock import patch
+from mozillians.geo.models import Country
 from mozillians.geo.tests import CountryFactory, RegionFactory, CityFactory
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase, requires_login, requires_vouch
+from mozillians.users.managers import MOZILLIANS, PUBLIC
 from mozillians.users.tests import UserFactory
 
 
@@ -43,11 +47,10 @@ class ListTests(TestCase):
         eq_(response.context['country_name'], country.name)
         eq_(response.context['city_name'], None)
         eq_(response.context['region_name'], None)
-        eq_(response.context['people'].paginator.count, 2)
-        eq_(response.context['people'].paginator.num_pages, 2)
-        eq_(response.context['people'].number, 1)
-        eq_(response.context['people'].object_list[0],
-            user_listed_1.userprofile)
+        eq_(response.context['people'].count, 2)
+        ok_(response.context['people'].next_cursor)
+        eq_(response.context['people'].object_list,
+            [user_listed_1.userprofile])
 
     @patch('mozillians.groups.views.settings.ITEMS_PER_PAGE', 1)
     def test_list_mozillians_in_location_country_second_page(self):
@@ -57,40 +60,72 @@ class ListTests(TestCase):
         user = UserFactory.create()
         with self.login(user) as client:
             url = reverse('phonebook:list_country', kwargs={'country': country.name})
-            url = urlparams(url, page=2)
             response = client.get(url, follow=True)
+            cursor = response.context['people'].next_cursor
+            response = client.get(urlparams(url, cursor=cursor), follow=True)
         eq_(response.status_code, 200)
-        eq_(response.context['people'].paginator.count, 2)
-        eq_(response.context['people'].paginator.num_pages, 2)
-        eq_(response.context['people'].number, 2)
-        eq_(response.context['people'].object_list[0],
-            user_listed_2.userprofile)
+        eq_(response.context['people'].count, 2)
+        eq_(response.context['people'].next_cursor, None)
+        eq_(response.context['people'].object_list,
+            [user_listed_2.userprofile])
 
     @patch('mozillians.groups.views.settings.ITEMS_PER_PAGE', 1)
-    def test_list_mozillians_in_location_country_empty_page(self):
+    def test_list_mozillians_in_location_country_same_names(self):
         country = CountryFactory.create()
-        UserFactory.create(userprofile={'geo_country': country})
-        UserFactory.create(userprofile={'geo_country': country})
+        user_1 = UserFactory.create(userprofile={'geo_country': country,
+                                                 'full_name': 'Same Name'})
+        user_2 = UserFactory.create(userprofile={'geo_country': country,
+                                                 'full_name': 'Same Name'})
         user = UserFactory.create()
         with self.login(user) as client:
             url = reverse('phonebook:list_country', kwargs={'country': country.name})
-            url = urlparams(url, page=20000)
             response = client.get(url, follow=True)
-        eq_(response.status_code, 200)
-        eq_(response.context['people'].number, 2)
+            eq_(response.context['people'].object_list, [user_1.userprofile])
+            cursor = response.context['people'].next_cursor
+            response = client.get(urlparams(url, cursor=cursor), follow=True)
+        eq_(response.context['people'].object_list, [user_2.userprofile])
+        eq_(response.context['people'].next_cursor, None)
 
     @patch('mozillians.groups.views.settings.ITEMS_PER_PAGE', 1)
-    def test_list_mozillians_in_location_country_invalid_page(self):
+    def test_list_mozillians_in_location_country_invalid_cursor(self):
         country = CountryFactory.create()
-        UserFactory.create(userprofile={'geo_country': country})
+        user_listed_1 = UserFactory.create(userprofile={'geo_country': country})
         UserFactory.create(userprofile={'geo_country': country})
         user = UserFactory.create()
         with self.login(user) as client:
             url = reverse('phonebook:list_country', kwargs={'country': country.name})
-            url = urlparams(url, page='invalid')
+            url = urlparams(url, cursor='invalid')
             response = client.get(url, follow=True)
         eq_(response.status_code, 200)
-        eq_(response.context['people'].number, 1)
+        eq_(response.context['people'].object_list,
+            [user_listed_1.userprofile])
+
+    def test_list_mozillians_in_location_stale_count(self):
+        country = CountryFactory.create()
+        user_listed = UserFactory.create(userprofile={'geo_country': country})
+        Country.objects.filter(pk=country.pk).update(vouched_count=0)
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:list_country', kwargs={'country': country.name})
+            response = client.get(url, follow=True)
+        eq_(response.context['people'].object_list, [user_listed.userprofile])
+        eq_(response.context['people'].count, 1)
+        ok_('not-found' not in response.content)
+
+    def test_list_mozillians_in_location_queries(self):
+        country = CountryFactory.create()
+        UserFactory.create_batch(3, userprofile={'geo_country': country})
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:list_country', kwargs={'country': country.name})
+            client.get(url, follow=True)
+            with CaptureQueriesContext(connection) as first:
+                client.get(url, follow=True)
+            UserFactory.create_batch(3, userprofile={'geo_country': country})
+            with CaptureQueriesContext(connection) as second:
+                response = client.get(url, follow=True)
+        eq_(response.context['people'].count, 6)
+        eq_(len(first), len(second))
 
     def test_list_mozillians_in_location_region_vouched(self):
         country = CountryFactory.create()
@@ -117,7 +152,7 @@ class ListTests(TestCase):
         eq_(response.context['country_name'], country.name)
         eq_(response.context['city_name'], None)
         eq_(response.context['region_name'], region.name)
-        eq_(response.context['people'].paginator.count, 1)
+        eq_(response.context['people'].count, 1)
         eq_(response.context['people'].object_list[0], user_listed.userprofile)
 
     def test_list_mozillians_in_location_city_vouched(self):
@@ -144,7 +179,7 @@ class ListTests(TestCase):
         eq_(response.context['country_name'], country.name)
         eq_(response.context['city_name'], city.name)
         eq_(response.context['region_name'], None)
-        eq_(response.context['people'].paginator.count, 1)
+        eq_(response.context['people'].count, 1)
         eq_(response.context['people'].object_list[0], user_listed.userprofile)
 
     def test_list_mozillians_in_location_region_n_city_vouched(self):
@@ -181,7 +216,7 @@ class ListTests(TestCase):
         eq_(response.context['country_name'], country.name)
         eq_(response.context['city_name'], city.name)
         eq_(response.context['region_name'], region.name)
-        eq_(response.context['people'].paginator.count, 1)
+        eq_(response.context['people'].count, 1)
         eq_(response.context['people'].object_list[0], user_listed.userprofile)
 
     def test_list_mozillians_in_location_invalid_country(self):
@@ -194,4 +229,35 @@ class ListTests(TestCase):
         eq_(response.context['country_name'], 'invalid')
         eq_(response.context['city_name'], None)
         eq_(response.context['region_name'], None)
-        eq_(response.context['people'].paginator.count, 0)
+        eq_(response.context['people'].count, 0)
+
+
+class ListCountriesTests(TestCase):
+    def test_list_countries_vouched(self):
+        # Users are in Greece by default.
+        country = CountryFactory.create(name='Spain')
+        country2 = CountryFactory.create(name='Italy')
+        CountryFactory.create(name='Portugal')
+        UserFactory.create_batch(2, userprofile={'geo_country': country})
+        UserFactory.create(userprofile={'geo_country': country2})
+        UserFactory.create(vouched=False, userprofile={'geo_country': country2})
+        user = UserFactory.create()
+        with self.login(user) as client:
+            response = client.get(reverse('phonebook:list_countries'), follow=True)
+        eq_(response.status_code, 200)
+        self.assertTemplateUsed(response, 'phonebook/country_list.html')
+        eq_(response.context['countries'],
+            [('Spain', 2, reverse('phonebook:list_country', args=['Spain'])),
+             ('Greece', 1, reverse('phonebook:list_country', args=['Greece'])),
+             ('Italy', 1, reverse('phonebook:list_country', args=['Italy']))])
+
+    def test_list_countries_anonymous(self):
+        country = CountryFactory.create(name='Spain')
+        country2 = CountryFactory.create(name='Italy')
+        UserFactory.create(userprofile={'geo_country': country,
+                                        'privacy_geo_country': MOZILLIANS})
+        UserFactory.create(userprofile={'geo_country': country2,
+                                        'privacy_geo_country': PUBLIC})
+        response = Client().get(reverse('phonebook:list_countries'), follow=True)
+        eq_(response.status_code, 200)
+        eq_(response.context['countries'], [('Italy', 1, None)])
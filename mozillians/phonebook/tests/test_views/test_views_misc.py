@@ -4,22 +4,56 @@ from datetime import datetime
 from django.contrib.auth.models import User
 from django.contrib.auth.views import logout as logout_view
 from django.core.urlresolvers import reverse
-from django.test.client import Client
+from django.http import QueryDict
+from django.test.client import Client, RequestFactory
 from django.test.utils import override_settings
 
-from mock import patch
+from mock import Mock, patch
 from nose.tools import eq_, ok_
 from waffle import Flag
 
 from mozillians.common.tests import TestCase, requires_login, requires_vouch
 from mozillians.phonebook.models import Invite
 from mozillians.phonebook.tests import InviteFactory, _get_privacy_fields
+from mozillians.phonebook.views import _paginate_search
+from mozillians.users.es import SearchCursorPage
 from mozillians.users.managers import MOZILLIANS, PRIVILEGED, PUBLIC
 from mozillians.users.models import UserProfilePrivacyModel
 from mozillians.users.tests import UserFactory
 
 
 class SearchTests(TestCase):
+    def test_paginate_search_cursor_keeps_parameters(self):
+        profiles = Mock()
+        profiles.cursor_page.return_value = SearchCursorPage([], 30, 'next')
+        request = RequestFactory().get('/search', {'q': 'foo', 'limit': 10, 'page': 2,
+                                                   'groups': ['a', 'b'], 'cursor': 'abc'})
+
+        people, num_people = _paginate_search(request, profiles, 10)
+        profiles.cursor_page.assert_called_with('abc', 10)
+        eq_(num_people, 30)
+        eq_(QueryDict(people.next_url[1:]),
+            QueryDict('q=foo&limit=10&groups=a&groups=b&cursor=next'))
+
+    def test_paginate_search_cursor_by_default(self):
+        profiles = Mock()
+        profiles.cursor_page.return_value = SearchCursorPage([], 30, 'next')
+        request = RequestFactory().get('/search', {'q': 'foo'})
+
+        people, num_people = _paginate_search(request, profiles, 10)
+        profiles.cursor_page.assert_called_with(None, 10)
+        eq_(QueryDict(people.next_url[1:]), QueryDict('q=foo&cursor=next'))
+
+    def test_paginate_search_page_numbers(self):
+        profiles = Mock()
+        profiles.cache_count.return_value = range(30)
+        request = RequestFactory().get('/search', {'q': 'foo', 'page': 2})
+
+        people, num_people = _paginate_search(request, profiles, 10)
+        ok_(not profiles.cursor_page.called)
+        eq_(people.number, 2)
+        eq_(num_people, 30)
+
     def test_search_plugin_anonymous(self):
         client = Client()
         response = client.get(reverse('phonebook:search_plugin'), follow=True)
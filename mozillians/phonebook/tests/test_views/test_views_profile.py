@@ -1,7 +1,8 @@
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from funfactory.helpers import urlparams
 
@@ -10,7 +11,9 @@ from nose.tools import ok_, eq_
 
 from mozillians.common.helpers import redirect
 from mozillians.common.tests import TestCase
+from mozillians.groups.tests import GroupFactory
 from mozillians.users.managers import PUBLIC, MOZILLIANS, EMPLOYEES, PRIVILEGED
+from mozillians.users.models import ExternalAccount
 from mozillians.users.tests import UserFactory
 
 
@@ -62,6 +65,73 @@ class ViewProfileTests(TestCase):
         eq_(response.context['profile']._privacy_level, PUBLIC)
         ok_('vouch_form' not in response.context)
 
+    def test_view_profile_does_not_exist(self):
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:profile_view', kwargs={'username': 'nonexistent'})
+            response = client.get(url, follow=True)
+        eq_(response.status_code, 404)
+
+    def test_view_profile_incomplete(self):
+        lookup_user = UserFactory.create(userprofile={'full_name': '',
+                                                      'privacy_ircname': PUBLIC})
+        client = Client()
+        url = reverse('phonebook:profile_view', kwargs={'username': lookup_user.username})
+        response = client.get(url, follow=True)
+        eq_(response.status_code, 404)
+
+    def test_view_profile_queries_do_not_grow_with_groups(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        url = reverse('phonebook:profile_view', kwargs={'username': lookup_user.username})
+
+        def _num_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            eq_(response.status_code, 200)
+            return len(queries)
+
+        curator = UserFactory.create().userprofile
+        GroupFactory.create(curator=lookup_user.userprofile).add_member(lookup_user.userprofile)
+        num_queries = _num_queries()
+        for group in GroupFactory.create_batch(3, curator=curator):
+            group.add_member(lookup_user.userprofile)
+        eq_(_num_queries(), num_queries)
+
+    def test_view_profile_details_cached(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC,
+                                                      'bio': 'Foo bar'})
+        url = reverse('phonebook:profile_view', kwargs={'username': lookup_user.username})
+
+        def _get():
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            eq_(response.status_code, 200)
+            return response, len(queries)
+
+        response, num_queries = _get()
+        ok_('Foo bar' in response.content)
+        response, cached_num_queries = _get()
+        ok_('Foo bar' in response.content)
+        ok_(cached_num_queries < num_queries)
+
+        lookup_user.userprofile.externalaccount_set.create(
+            type=ExternalAccount.TYPE_AMO, identifier='amoaccount', privacy=PUBLIC)
+        response, num_queries = _get()
+        ok_('amoaccount' in response.content)
+
+    def test_view_profile_details_cached_per_viewer(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        lookup_user.userprofile.externalaccount_set.create(
+            type=ExternalAccount.TYPE_AMO, identifier='amoaccount', privacy=MOZILLIANS)
+        url = reverse('phonebook:profile_view', kwargs={'username': lookup_user.username})
+
+        with self.login(UserFactory.create()) as client:
+            response = client.get(url)
+        ok_('amoaccount' in response.content)
+
+        response = Client().get(url)
+        ok_('amoaccount' not in response.content)
+
     def test_view_vouched_profile_public_unvouched(self):
         lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
         user = UserFactory.create(vouched=False)
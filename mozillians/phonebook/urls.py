@@ -29,6 +29,7 @@ urlpatterns = patterns(
     url(r'^betasearch/$', 'views.betasearch', name='betasearch'),
     url(r'^invite/$', 'views.invite', name='invite'),
     url(r'^invite/(?P<invite_pk>\d+)/delete/$', 'views.delete_invite', name='delete_invite'),
+    url(r'^country/$', 'views.list_countries', name='list_countries'),
     url(r'^country/(?P<country>[A-Za-z0-9 \.]+)/$',
         'views.list_mozillians_in_location', name='list_country'),
     url(r'^country/(?P<country>[A-Za-z0-9 \.]+)/city/(?P<city>.+)/$',
@@ -1,32 +1,49 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 from django.conf import settings
 from django.contrib.auth.views import logout as auth_logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import NoReverseMatch
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
+from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404
 from django.shortcuts import get_object_or_404, render
-from django.utils import timezone
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe
 from django.views.decorators.cache import cache_page, never_cache
 from django.views.decorators.http import require_POST
 
 from funfactory.helpers import urlparams
 from funfactory.urlresolvers import reverse
 from tower import ugettext as _
+from django_statsd.clients import statsd
 from waffle.decorators import waffle_flag
 
 import mozillians.phonebook.forms as forms
 from mozillians.api.models import APIv2App
-from mozillians.common.decorators import allow_public, allow_unvouched
+from mozillians.common.decorators import allow_public, allow_unvouched, instrument_view
 from mozillians.common.helpers import redirect
-from mozillians.common.middleware import LOGIN_MESSAGE, GET_VOUCHED_MESSAGE
+from mozillians.common.middleware import LOGIN_MESSAGE, GET_VOUCHED_MESSAGE, get_privacy_flags
+from mozillians.geo.models import City, Country, Region
 from mozillians.groups.helpers import stringify_groups
 from mozillians.groups.models import Group
 from mozillians.phonebook.models import Invite
 from mozillians.phonebook.utils import redeem_invite
+from mozillians.users.es import SearchCursorPage
 from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC, PRIVILEGED
-from mozillians.users.models import ExternalAccount, UserProfile, UserProfileMappingType
+from mozillians.users.models import (ExternalAccount, UserProfile, UserProfileMappingType,
+                                     get_profile_version)
+
+
+# Upper bound on the staleness of names of related objects in cached
+# profile details.
+PROFILE_DETAILS_CACHE_TIMEOUT = 60 * 60
 
 
 @allow_unvouched
@@ -99,34 +116,35 @@ def view_profile(request, username):
         # own profile
         view_as = request.GET.get('view_as', 'myself')
         privacy_level = privacy_mappings.get(view_as, None)
-        profile = UserProfile.objects.privacy_level(privacy_level).get(user__username=username)
+        profile = (UserProfile.objects.privacy_level(privacy_level)
+                   .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                   .get(user__username=username))
         data['privacy_mode'] = view_as
     else:
-        userprofile_query = UserProfile.objects.filter(user__username=username)
-        public_profile_exists = userprofile_query.public().exists()
-        profile_exists = userprofile_query.exists()
-        profile_complete = userprofile_query.exclude(full_name='').exists()
+        # Fetch the profile once, with whether any of its fields is
+        # public, instead of running an existence query per check.
+        profile = (UserProfile.objects.filter(user__username=username)
+                   .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                   .with_public_flag().first())
 
-        if not public_profile_exists:
+        if not (profile and profile.has_public_field):
             if not request.user.is_authenticated():
                 # you have to be authenticated to continue
                 messages.warning(request, LOGIN_MESSAGE)
                 return (login_required(view_profile, login_url=reverse('phonebook:home'))
                         (request, username))
 
-            if not request.user.userprofile.is_vouched:
+            if not get_privacy_flags(request)[0]:
                 # you have to be vouched to continue
                 messages.error(request, GET_VOUCHED_MESSAGE)
                 return redirect('phonebook:home')
 
-        if not profile_exists or not profile_complete:
+        if not profile or profile.full_name == '':
             raise Http404
 
-        profile = UserProfile.objects.get(user__username=username)
         profile.set_instance_privacy_level(PUBLIC)
         if request.user.is_authenticated():
-            profile.set_instance_privacy_level(
-                request.user.userprofile.privacy_level)
+            profile.set_instance_privacy_level(get_privacy_flags(request)[1])
 
         if (request.user.is_authenticated() and profile.is_vouchable(request.user.userprofile)):
 
@@ -143,15 +161,48 @@ def view_profile(request, username):
 
     data['shown_user'] = profile.user
     data['profile'] = profile
-    data['groups'] = profile.get_annotated_groups()
+    data['profile_details'] = _render_profile_details(request, profile)
+
+    return render(request, 'phonebook/profile.html', data)
+
 
+def _render_profile_details(request, profile):
+    """Render the details section of a profile page, cached.
+
+    The section only depends on the profile, the privacy level it is
+    viewed with and a few properties of the viewer, which together
+    with the profile version make up the cache key. Changes to the
+    profile, its accounts, languages, skills, groups, vouches and the
+    profiles it vouched for or was vouched by bump the version. Names
+    of groups and skills may be stale for up to
+    PROFILE_DETAILS_CACHE_TIMEOUT.
+
+    """
+    user = request.user
+    authenticated = user.is_authenticated()
+    own_profile = authenticated and user.username == profile.user.username
     # Only show pending groups if user is looking at their own profile,
     # or current user is a superuser
-    if not (request.user.is_authenticated() and
-            (request.user.username == username or request.user.is_superuser)):
-        data['groups'] = [grp for grp in data['groups'] if not grp.pending]
-
-    return render(request, 'phonebook/profile.html', data)
+    show_pending = own_profile or (authenticated and user.is_superuser)
+    show_links = authenticated and user.userprofile.is_vouched
+
+    key = 'phonebook:profile_details:{0}:{1}:{2}:{3}{4}{5}:{6}'.format(
+        profile.id, get_profile_version(profile.id), profile._privacy_level,
+        int(own_profile), int(show_pending), int(show_links), translation.get_language())
+    details = cache.get(key)
+    if details is None:
+        groups = profile.get_annotated_groups()
+        if not show_pending:
+            groups = [group for group in groups if not group.pending]
+        details = render_to_string('phonebook/includes/profile_details.html', {
+            'profile': profile,
+            'shown_user': profile.user,
+            'groups': groups,
+            'own_profile': own_profile,
+            'show_links': show_links,
+        })
+        cache.set(key, details, PROFILE_DETAILS_CACHE_TIMEOUT)
+    return mark_safe(details)
 
 
 @allow_unvouched
@@ -327,10 +378,44 @@ def delete(request):
     return logout(request)
 
 
+def _paginate_search(request, profiles, limit):
+    """Paginate search results.
+
+    Returns a tuple of the page of results and the total number of
+    results. Results are paginated with cursors, which fetch the page
+    and the total in a single search and link to the next page. Page
+    numbers are still used for requests with a 'page' parameter and no
+    'cursor' one. Invalid cursors return the first page.
+
+    """
+    if 'cursor' in request.GET or 'page' not in request.GET:
+        people = profiles.cursor_page(request.GET.get('cursor'), limit)
+        if people.next_cursor:
+            # Keep the query, the limit and the filters of the request.
+            params = request.GET.copy()
+            params['cursor'] = people.next_cursor
+            params.pop('page', None)
+            people.next_url = '?' + params.urlencode()
+        return people, people.count
+
+    paginator = Paginator(profiles.cache_count(), limit)
+    page = request.GET.get('page', 1)
+
+    try:
+        people = paginator.page(page)
+    except PageNotAnInteger:
+        people = paginator.page(1)
+    except EmptyPage:
+        people = paginator.page(paginator.num_pages)
+    return people, paginator.count
+
+
 @allow_public
+@instrument_view('phonebook.search')
 def search(request):
     limit = None
     people = []
+    num_people = 0
     show_pagination = False
     form = forms.SearchForm(request.GET)
     groups = None
@@ -340,41 +425,37 @@ def search(request):
         query = form.cleaned_data.get('q', u'')
         limit = form.cleaned_data['limit']
         include_non_vouched = form.cleaned_data['include_non_vouched']
-        page = request.GET.get('page', 1)
         functional_areas = Group.get_functional_areas()
         public = not (request.user.is_authenticated() and
                       request.user.userprofile.is_vouched)
 
         profiles = UserProfileMappingType.search(
-            query, public=public, include_non_vouched=include_non_vouched)
+            query, public=public, include_non_vouched=include_non_vouched).source_only()
+        profiles = profiles.stats_prefix('views.phonebook.search')
         if not public:
             groups = Group.search(query)
 
-        paginator = Paginator(profiles, limit)
-
-        try:
-            people = paginator.page(page)
-        except PageNotAnInteger:
-            people = paginator.page(1)
-        except EmptyPage:
-            people = paginator.page(paginator.num_pages)
+        people, num_people = _paginate_search(request, profiles, limit)
 
-        if profiles.count() == 1 and not groups:
+        if num_people == 1 and not groups:
             return redirect('phonebook:profile_view', people[0].user.username)
 
-        show_pagination = paginator.count > settings.ITEMS_PER_PAGE
+        show_pagination = num_people > settings.ITEMS_PER_PAGE
 
     d = dict(people=people,
+             num_people=num_people,
              search_form=form,
              limit=limit,
              show_pagination=show_pagination,
              groups=groups,
              functional_areas=functional_areas)
 
-    return render(request, 'phonebook/search.html', d)
+    with statsd.timer('views.phonebook.search.render'):
+        return render(request, 'phonebook/search.html', d)
 
 
 @waffle_flag('betasearch')
+@instrument_view('phonebook.betasearch')
 def betasearch(request):
     """This view is for researching new search and data filtering
     options. It will eventually replace the 'search' view.
@@ -389,6 +470,7 @@ def betasearch(request):
     """
     limit = None
     people = []
+    num_people = 0
     show_pagination = False
     form = forms.SearchForm(request.GET)
     filtr = forms.SearchFilter(request.GET)
@@ -396,7 +478,6 @@ def betasearch(request):
     if form.is_valid():
         query = form.cleaned_data.get('q', u'')
         limit = form.cleaned_data['limit']
-        page = request.GET.get('page', 1)
         public = not (request.user.is_authenticated() and
                       request.user.userprofile.is_vouched)
 
@@ -404,26 +485,21 @@ def betasearch(request):
         profiles = UserProfileMappingType.search(query,
                                                  include_non_vouched=True,
                                                  public=public)
-        profiles = profiles.filter(id__in=profiles_matching_filter)
+        profiles = (profiles.filter(id__in=profiles_matching_filter).source_only()
+                    .stats_prefix('views.phonebook.betasearch'))
 
-        paginator = Paginator(profiles, limit)
-
-        try:
-            people = paginator.page(page)
-        except PageNotAnInteger:
-            people = paginator.page(1)
-        except EmptyPage:
-            people = paginator.page(paginator.num_pages)
-
-        show_pagination = paginator.count > settings.ITEMS_PER_PAGE
+        people, num_people = _paginate_search(request, profiles, limit)
+        show_pagination = num_people > settings.ITEMS_PER_PAGE
 
     data = dict(people=people,
+                num_people=num_people,
                 search_form=form,
                 filtr=filtr,
                 limit=limit,
                 show_pagination=show_pagination)
 
-    return render(request, 'phonebook/betasearch.html', data)
+    with statsd.timer('views.phonebook.betasearch.render'):
+        return render(request, 'phonebook/betasearch.html', data)
 
 
 @allow_public
@@ -505,35 +581,101 @@ def delete_apikey(request, api_pk):
     return redirect('phonebook:apikeys')
 
 
-def list_mozillians_in_location(request, country, region=None, city=None):
-    queryset = UserProfile.objects.vouched().filter(geo_country__name__iexact=country)
-    show_pagination = False
+def _encode_location_cursor(profile):
+    return urlsafe_b64encode(json.dumps([profile.full_name, profile.id]))
 
+
+def _decode_location_cursor(cursor):
+    """Return the (full_name, id) of a location list cursor or None."""
+    try:
+        full_name, pk = json.loads(urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        return None
+    if not isinstance(full_name, basestring) or not isinstance(pk, int):
+        return None
+    return full_name, pk
+
+
+def _get_locations(country, region=None, city=None):
+    """Return the queryset of locations matching the location names."""
     if city:
-        queryset = queryset.filter(geo_city__name__iexact=city)
-    if region:
-        queryset = queryset.filter(geo_region__name__iexact=region)
+        locations = City.objects.filter(name__iexact=city, country__name__iexact=country)
+        if region:
+            locations = locations.filter(region__name__iexact=region)
+    elif region:
+        locations = Region.objects.filter(name__iexact=region, country__name__iexact=country)
+    else:
+        locations = Country.objects.filter(name__iexact=country)
+    return locations
 
-    paginator = Paginator(queryset, settings.ITEMS_PER_PAGE)
-    page = request.GET.get('page', 1)
 
-    try:
-        people = paginator.page(page)
-    except PageNotAnInteger:
-        people = paginator.page(1)
-    except EmptyPage:
-        people = paginator.page(paginator.num_pages)
+@instrument_view('phonebook.list_mozillians_in_location')
+def list_mozillians_in_location(request, country, region=None, city=None):
+    """List vouched Mozillians in a location, sorted by name.
 
-    if paginator.count > settings.ITEMS_PER_PAGE:
-        show_pagination = True
+    Pages are fetched with a cursor holding the name and id of the last
+    profile of the previous page, so that deep pages cost the same as
+    the first one. The total shown comes from the member counts of the
+    locations, which are updated in the background.
+    """
+    locations = _get_locations(country, region, city)
+    counts = dict(locations.values_list('id', 'vouched_count'))
+    field = locations.model.profile_field
+
+    queryset = (UserProfile.objects.vouched()
+                .filter(**{'{0}__in'.format(field): counts.keys()})
+                .order_by('full_name', 'id'))
+    cursor = _decode_location_cursor(request.GET.get('cursor', ''))
+    if cursor:
+        full_name, pk = cursor
+        queryset = queryset.filter(Q(full_name__gt=full_name) |
+                                   Q(full_name=full_name, id__gt=pk))
+
+    limit = settings.ITEMS_PER_PAGE
+    profiles = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(profiles) > limit:
+        profiles = profiles[:limit]
+        next_cursor = _encode_location_cursor(profiles[-1])
+    # The counts may lag behind, never show fewer than the listed ones.
+    count = max(sum(counts.values()), len(profiles))
+    people = SearchCursorPage(profiles, count, next_cursor)
 
     data = {'people': people,
             'country_name': country,
             'city_name': city,
-            'region_name': region,
-            'page': page,
-            'show_pagination': show_pagination}
-    return render(request, 'phonebook/location_list.html', data)
+            'region_name': region}
+    with statsd.timer('views.phonebook.list_mozillians_in_location.render'):
+        return render(request, 'phonebook/location_list.html', data)
+
+
+@allow_public
+@instrument_view('phonebook.list_countries')
+def list_countries(request):
+    """List the countries with Mozillians in them.
+
+    Anonymous users see the number of Mozillians who show their country
+    publicly.
+    """
+    if request.user.is_authenticated() and request.user.userprofile.is_vouched:
+        count_field = 'vouched_count'
+    else:
+        count_field = 'public_count'
+    counts = (Country.objects.filter(**{'{0}__gt'.format(count_field): 0})
+              .order_by('-{0}'.format(count_field), 'name')
+              .values_list('name', count_field))
+
+    countries = []
+    for name, count in counts:
+        country_url = None
+        # Mozillians in a country are listed to vouched users only.
+        if count_field == 'vouched_count':
+            try:
+                country_url = reverse('phonebook:list_country', args=[name])
+            except NoReverseMatch:
+                pass
+        countries.append((name, count, country_url))
+    return render(request, 'phonebook/country_list.html', {'countries': countries})
 
 
 @allow_unvouched
@@ -238,6 +238,9 @@ ES_URLS = ['http://127.0.0.1:9200']
 ES_INDEXES = {'default': 'mozillians',
               'public': 'mozillians-public'}
 ES_INDEXING_TIMEOUT = 10
+ES_INDEX_REPLICAS = 1
+# Search queries slower than this (in milliseconds) are logged.
+ES_SLOW_QUERY_THRESHOLD = 500
 
 # Sorl settings
 THUMBNAIL_DUMMY = True
@@ -307,6 +310,9 @@ HUMANSTXT_URL = urljoin(STATIC_URL, 'humans.txt')
 MAPBOX_MAP_ID = 'examples.map-zr0njcqy'
 # This is the token for the edit profile page alone.
 MAPBOX_PROFILE_ID = MAPBOX_MAP_ID
+# Reverse geocoding API, and seconds to wait for it to respond.
+MAPBOX_API_URL = 'http://api.tiles.mapbox.com'
+MAPBOX_TIMEOUT = 5
 
 
 def _browserid_request_args():
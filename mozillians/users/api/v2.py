@@ -1,10 +1,15 @@
+import json
+
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 import django_filters
 from funfactory.urlresolvers import reverse
 from rest_framework import viewsets, serializers
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
 
 from mozillians.common.helpers import absolutify, markdown
 from mozillians.users.managers import PUBLIC
@@ -159,6 +164,52 @@ class UserProfileDetailedSerializer(serializers.HyperlinkedModelSerializer):
         }
 
 
+class UserProfilePrefetchedSerializer(UserProfileDetailedSerializer):
+    """UserProfileDetailedSerializer for profiles with prefetched relations.
+
+    Accounts, alternate emails, websites and languages are filtered by
+    type and privacy in Python, out of the prefetched
+    externalaccount_set and language_set, instead of with one query
+    per relation and profile. Profiles must be fetched without a
+    privacy level and get their privacy level set per instance.
+    """
+    alternate_emails = serializers.SerializerMethodField('get_alternate_emails')
+    external_accounts = serializers.SerializerMethodField('get_external_accounts')
+    languages = serializers.SerializerMethodField('get_languages')
+    websites = serializers.SerializerMethodField('get_websites')
+
+    def _get_accounts(self, obj, types=None, excluded_types=()):
+        privacy_level = obj._privacy_level
+        accounts = []
+        for account in obj.externalaccount_set.all():
+            if types is not None and account.type not in types:
+                continue
+            if account.type in excluded_types:
+                continue
+            if privacy_level and account.privacy < privacy_level:
+                continue
+            accounts.append(account)
+        return accounts
+
+    def get_alternate_emails(self, obj):
+        accounts = self._get_accounts(obj, types=[ExternalAccount.TYPE_EMAIL])
+        return AlternateEmailSerializer(accounts, many=True).data
+
+    def get_external_accounts(self, obj):
+        excluded_types = [ExternalAccount.TYPE_WEBSITE, ExternalAccount.TYPE_EMAIL]
+        accounts = self._get_accounts(obj, excluded_types=excluded_types)
+        return ExternalAccountSerializer(accounts, many=True).data
+
+    def get_websites(self, obj):
+        accounts = self._get_accounts(obj, types=[ExternalAccount.TYPE_WEBSITE])
+        return WebsiteSerializer(accounts, many=True).data
+
+    def get_languages(self, obj):
+        if obj._privacy_level > obj.privacy_languages:
+            return []
+        return LanguageSerializer(obj.language_set.all(), many=True).data
+
+
 # Filters
 class UserProfileFilter(django_filters.FilterSet):
     city = django_filters.CharFilter(name='geo_city__name')
@@ -194,13 +245,22 @@ class UserProfileFilter(django_filters.FilterSet):
 class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Returns a list of Mozillians respecting authorization levels
-    and privacy settings.
+    and privacy settings. Pass detailed=1 to list detailed profiles.
     """
     serializer_class = UserProfileSerializer
     model = UserProfile
     filter_class = UserProfileFilter
     ordering = ('user__username',)
 
+    def is_detailed(self):
+        """Return True if a list of detailed profiles is requested."""
+        return self.request.QUERY_PARAMS.get('detailed') in ('1', 'true')
+
+    def get_serializer_class(self):
+        if self.is_detailed():
+            return UserProfilePrefetchedSerializer
+        return super(UserProfileViewSet, self).get_serializer_class()
+
     def get_queryset(self):
         queryset = UserProfile.objects.complete()
         privacy_level = self.request.privacy_level
@@ -208,9 +268,53 @@ class UserProfileViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.public()
 
         queryset = queryset.privacy_level(privacy_level)
+        if self.is_detailed():
+            queryset = (queryset
+                        .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                        .prefetch_related('externalaccount_set', 'language_set'))
         return queryset
 
     def retrieve(self, request, pk):
         user = get_object_or_404(self.get_queryset(), pk=pk)
         serializer = UserProfileDetailedSerializer(user, context={'request': self.request})
         return Response(serializer.data)
+
+
+class UserProfileExportView(APIView):
+    """
+    Streams all Mozillians as newline delimited JSON, one detailed
+    profile per line, respecting authorization levels and privacy
+    settings.
+    """
+    batch_size = 500
+
+    def get_queryset(self):
+        queryset = UserProfile.objects.complete()
+        if self.request.privacy_level == PUBLIC:
+            queryset = queryset.public()
+        return queryset
+
+    def get(self, request):
+        return StreamingHttpResponse(self.export(), content_type='application/x-ndjson')
+
+    def export(self):
+        """Yield profiles as JSON lines walking them in batches by id.
+
+        Each batch is fetched with its related objects in a fixed
+        number of queries and only one batch is kept in memory.
+        """
+        privacy_level = self.request.privacy_level
+        context = {'request': self.request}
+        queryset = (self.get_queryset().privacy_level(None).order_by('id')
+                    .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                    .prefetch_related('externalaccount_set', 'language_set'))
+        last_id = 0
+        while True:
+            profiles = list(queryset.filter(id__gt=last_id)[:self.batch_size])
+            if not profiles:
+                return
+            for profile in profiles:
+                profile.set_instance_privacy_level(privacy_level)
+                serializer = UserProfilePrefetchedSerializer(profile, context=context)
+                yield json.dumps(serializer.data, cls=JSONEncoder) + '\n'
+            last_id = profiles[-1].id
@@ -1,37 +1,52 @@
+from datetime import datetime
+
 from django.conf import settings
+from django.utils import timezone
 
 import cronjobs
 
-from celery.task.sets import TaskSet
+from celery.task import chord
 from celeryutils import chunked
 from elasticutils.contrib.django import get_es
 
-from mozillians.users.tasks import index_objects
+from mozillians.users.tasks import index_objects_private_and_public, swap_index_aliases
 from mozillians.users.models import UserProfile, UserProfileMappingType
 
 
 @cronjobs.register
 def index_all_profiles():
-    # Get an es object, delete index and re-create it
-    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
-    mappings = {'mappings':
-                {UserProfileMappingType.get_mapping_type_name():
-                 UserProfileMappingType.get_mapping()}}
-
-    def _recreate_index(index):
-        es.indices.delete(index=index, ignore=[400, 404])
-        es.indices.create(index, body=mappings)
+    """Rebuild the profile search indexes without downtime.
 
-    _recreate_index(settings.ES_INDEXES['default'])
-    _recreate_index(settings.ES_INDEXES['public'])
+    Profiles are indexed into new timestamped indexes while searches
+    keep hitting the current ones. Once every chunk has been indexed,
+    changes made in the meantime are replayed and the ES_INDEXES
+    aliases are swapped to the new indexes. A failed chunk cancels the
+    swap.
 
-    # mozillians index
-    ids = UserProfile.objects.complete().values_list('id', flat=True)
-    ts = [index_objects.subtask(args=[UserProfileMappingType, chunk, 150, False])
-          for chunk in chunked(sorted(list(ids)), 150)]
-
-    # public index
-    ts += [index_objects.subtask(args=[UserProfileMappingType, chunk, 150, True])
-           for chunk in chunked(sorted(list(ids)), 150)]
-
-    TaskSet(ts).apply_async()
+    """
+    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+    # New indexes are created with bulk settings, the regular ones are
+    # restored in swap_index_aliases.
+    body = {'settings': {'index': UserProfileMappingType.get_index_settings(bulk=True)},
+            'mappings': {UserProfileMappingType.get_mapping_type_name():
+                         UserProfileMappingType.get_mapping()}}
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    aliases = {'default': UserProfileMappingType.get_index(False),
+               'public': UserProfileMappingType.get_index(True)}
+    new_indexes = dict((key, '{0}-{1}'.format(alias, timestamp))
+                       for key, alias in aliases.items())
+    for index in new_indexes.values():
+        es.indices.create(index, body=body)
+
+    # Profiles updated from now on are indexed again before the swap.
+    started = timezone.now()
+    ids = sorted(UserProfile.objects.complete().values_list('id', flat=True))
+    ts = [index_objects_private_and_public.subtask(args=[UserProfileMappingType, chunk, 150],
+                                                   kwargs={'indexes': new_indexes})
+          for chunk in chunked(ids, 150)]
+
+    swap = dict((aliases[key], new_indexes[key]) for key in aliases)
+    chord(ts)(swap_index_aliases.subtask(args=[UserProfileMappingType, swap],
+                                         kwargs={'started': started,
+                                                 'new_indexes': new_indexes}))
@@ -1,5 +1,14 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from hashlib import md5
+
 from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
 
+from django_statsd.clients import statsd
 from elasticsearch import TransportError
 from elasticsearch.exceptions import NotFoundError
 from elasticutils.contrib.django import Indexable, MappingType, S, get_es
@@ -7,7 +16,111 @@ from elasticutils.contrib.django import Indexable, MappingType, S, get_es
 from mozillians.phonebook.helpers import langcode_to_name
 from mozillians.users.managers import MOZILLIANS, PUBLIC
 
+logger = logging.getLogger(__name__)
+
 ES_MAPPING_TYPE_NAME = 'user-profile'
+SEARCH_CURSOR_SALT = 'mozillians.users.es.cursor'
+SEARCH_CURSOR_MAX_AGE = 60 * 60 * 24  # seconds
+SEARCH_CARD_PHOTO_GEOMETRY = '70x70'
+SEARCH_GENERATION_KEY = 'search:generation'
+
+
+def get_search_generation():
+    """Return the current generation of the search indexes.
+
+    Cached search data is keyed on the generation, so bumping it
+    invalidates everything cached before.
+
+    """
+    cache.add(SEARCH_GENERATION_KEY, 1, None)
+    return cache.get(SEARCH_GENERATION_KEY, 1)
+
+
+def bump_search_generation():
+    """Invalidate cached search data after writing to the indexes."""
+    try:
+        cache.incr(SEARCH_GENERATION_KEY)
+    except ValueError:
+        cache.add(SEARCH_GENERATION_KEY, 1, None)
+
+
+class SearchResultCard(object):
+    """A search result rendered from the card stored in the index.
+
+    Provides the attributes of UserProfile used by the search_result
+    helper, with the privacy level of the index already applied.
+
+    """
+
+    def __init__(self, card):
+        self.id = self.pk = card['id']
+        self.display_name = card['display_name']
+        self.email = card['email']
+        self.ircname = card['ircname']
+        self.photo_url = card['photo_url']
+        self.user = SearchResultCardUser(card['username'])
+
+    def get_photo_url(self, geometry=SEARCH_CARD_PHOTO_GEOMETRY, **kwargs):
+        """Return the photo url stored in the card.
+
+        Only SEARCH_CARD_PHOTO_GEOMETRY is stored in the index.
+
+        """
+        if geometry != SEARCH_CARD_PHOTO_GEOMETRY:
+            raise ValueError('Search cards only store {0} photos.'
+                             .format(SEARCH_CARD_PHOTO_GEOMETRY))
+        return self.photo_url
+
+
+class SearchResultCardUser(object):
+
+    def __init__(self, username):
+        self.username = username
+
+
+class SearchCursorPage(object):
+    """A page of search results fetched with a cursor.
+
+    next_cursor is None on the last page, count is the total number of
+    hits of the search. next_url optionally links to the next page,
+    keeping the other parameters of the request.
+
+    """
+
+    def __init__(self, object_list, count, next_cursor):
+        self.object_list = object_list
+        self.count = count
+        self.next_cursor = next_cursor
+        self.next_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def _is_descending(sort_key):
+    """Return whether an Elasticsearch sort key sorts in descending order."""
+    if isinstance(sort_key, dict):
+        order = sort_key.values()[0]
+        if isinstance(order, dict):
+            order = order.get('order', 'asc')
+        return order == 'desc'
+    # Scores sort from the highest, fields from the lowest.
+    return sort_key == '_score'
+
+
+def _compare_sort_values(values, other, descending):
+    """Compare the sort values of two hits, like cmp."""
+    for value, other_value, desc in zip(values, other, descending):
+        result = cmp(value, other_value)
+        if result:
+            return -result if desc else result
+    return 0
 
 
 class PrivacyAwareS(S):
@@ -17,21 +130,222 @@ class PrivacyAwareS(S):
         self._privacy_level = level
         return self
 
+    def source_only(self):
+        """Return results rendered from the index without using the database.
+
+        Results are SearchResultCard objects. Hits indexed before
+        cards were stored in the index are loaded from the database.
+
+        """
+        self._source_only = True
+        return self
+
+    def stats_prefix(self, prefix):
+        """Send the timings of the query set to statsd under prefix."""
+        self._stats_prefix = prefix
+        return self
+
+    @contextmanager
+    def _timer(self, stage, body=None):
+        """Time a stage of the search and send it to statsd.
+
+        Elasticsearch requests, i.e. stages with a body, that take
+        longer than ES_SLOW_QUERY_THRESHOLD milliseconds are logged
+        along with their body.
+
+        """
+        start = time.time()
+        yield
+        elapsed = int((time.time() - start) * 1000)
+        statsd.timing('{0}.{1}'.format(getattr(self, '_stats_prefix', 'search'), stage),
+                      elapsed)
+        if body is not None and elapsed >= settings.ES_SLOW_QUERY_THRESHOLD:
+            logger.warning('Slow search query (%dms): %s', elapsed,
+                           json.dumps(body, sort_keys=True))
+
+    def cache_count(self, timeout=60):
+        """Cache the total count of the query set for timeout seconds."""
+        self._count_timeout = timeout
+        return self
+
+    def cache_results(self, timeout=60):
+        """Cache the hits of each page of the query set for timeout seconds.
+
+        Cached hits are dropped whenever profiles are indexed or
+        unindexed, once the changes are searchable.
+
+        """
+        self._results_timeout = timeout
+        return self
+
+    def _cache_key(self, prefix, s):
+        """Return a cache key for the query of s.
+
+        The key covers the indexes, the query with its filters, sorting
+        and page, the privacy level and the search generation.
+
+        """
+        query = json.dumps([self.get_indexes(), s._build_query(),
+                            getattr(self, '_privacy_level', None)], sort_keys=True)
+        return 'search:{0}:{1}:{2}'.format(prefix, get_search_generation(),
+                                           md5(query).hexdigest())
+
     def _clone(self, *args, **kwargs):
         new = super(PrivacyAwareS, self)._clone(*args, **kwargs)
         new._privacy_level = getattr(self, '_privacy_level', None)
+        new._count_timeout = getattr(self, '_count_timeout', None)
+        new._source_only = getattr(self, '_source_only', False)
+        new._results_timeout = getattr(self, '_results_timeout', None)
+        new._stats_prefix = getattr(self, '_stats_prefix', 'search')
         return new
 
+    def _count(self):
+        with self._timer('es.count', self[:0]._build_query()):
+            return super(PrivacyAwareS, self).count()
+
+    def count(self):
+        total = getattr(self, '_hits_cache', None) and self._hits_cache[1]
+        if total is not None:
+            return total
+
+        timeout = getattr(self, '_count_timeout', None)
+        if not timeout:
+            return self._count()
+
+        key = self._cache_key('count', self[:0])
+        count = cache.get(key)
+        if count is None:
+            count = self._count()
+            cache.set(key, count, timeout)
+        return count
+
+    def cursor_page(self, cursor=None, size=None):
+        """Return a SearchCursorPage of results.
+
+        Without a cursor the first page is returned, otherwise the page
+        following the one that returned the cursor. Cursors are signed
+        and hold the offset and the sort values of the last hit of their
+        page. They are only valid for the same indexes, privacy level
+        and query, any other cursor returns the first page. Hits that
+        sort before the last hit are skipped, so profiles indexed in
+        the meantime do not show up twice.
+
+        """
+        size = size or settings.ITEMS_PER_PAGE
+        query = self._build_query()
+        query.pop('from', None)
+        # Sort by id last, so that every hit has a distinct sort key.
+        query['sort'] = query.get('sort', []) + ['id']
+        scope = md5(json.dumps([self.get_indexes(), query,
+                                getattr(self, '_privacy_level', None)],
+                               sort_keys=True)).hexdigest()
+
+        offset, last_key = 0, None
+        if cursor:
+            try:
+                data = signing.loads(cursor, salt=SEARCH_CURSOR_SALT,
+                                     max_age=SEARCH_CURSOR_MAX_AGE)
+            except signing.BadSignature:
+                data = {}
+            if data.get('scope') == scope:
+                offset, last_key = data['offset'], data['key']
+
+        # Fetch from the last hit of the previous page, to notice hits
+        # shifting forward.
+        start = max(0, offset - 1)
+        query['from'] = start
+        query['size'] = size + offset - start
+        with self._timer('es', query):
+            response = self.get_es().search(body=query, index=self.get_indexes(),
+                                            doc_type=self.get_doctypes())
+
+        hits = list(enumerate(response['hits']['hits'], start))
+        if last_key is not None:
+            descending = [_is_descending(key) for key in query['sort']]
+            hits = [(position, hit) for position, hit in hits
+                    if _compare_sort_values(hit['sort'], last_key, descending) > 0]
+        hits = hits[:size]
+
+        total = response['hits']['total']
+        next_cursor = None
+        if hits and hits[-1][0] + 1 < total:
+            next_cursor = signing.dumps({'scope': scope, 'offset': hits[-1][0] + 1,
+                                         'key': hits[-1][1]['sort']},
+                                        salt=SEARCH_CURSOR_SALT, compress=True)
+        objs = self._get_results([(int(hit['_id']), hit['_source'].get('card'))
+                                  for position, hit in hits])
+        return SearchCursorPage(objs, total, next_cursor)
+
+    def _get_results(self, hits):
+        """Return the results of a list of (id, card) tuples.
+
+        In source only mode results are built from the cards, otherwise
+        they are loaded from the database.
+
+        """
+        if not getattr(self, '_source_only', False):
+            return self._get_objects([id_ for id_, card in hits])
+
+        objs = self._get_objects([id_ for id_, card in hits if not card])
+        objs = dict((obj.id, obj) for obj in objs)
+        result = []
+        for id_, card in hits:
+            if card:
+                result.append(SearchResultCard(card))
+            elif id_ in objs:
+                result.append(objs[id_])
+        return result
+
+    def _get_objects(self, ids):
+        """Return the objects with ids in one query, in the order of ids.
+
+        Objects that no longer exist in the database are skipped.
+
+        """
+        with self._timer('hydrate'):
+            objs = (self.type.get_model().objects
+                    .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                    .in_bulk(ids))
+        privacy_level = getattr(self, '_privacy_level', None)
+        result = []
+        for id_ in ids:
+            if id_ in objs:
+                objs[id_]._privacy_level = privacy_level
+                result.append(objs[id_])
+        return result
+
+    def _get_hits(self):
+        """Return the hits as (id, card) tuples and the total hit count."""
+        with self._timer('es', self._build_query()):
+            mapped_objs = list(super(PrivacyAwareS, self).__iter__())
+        hits = [(int(mapped_obj._id), getattr(mapped_obj, 'card', None))
+                for mapped_obj in mapped_objs]
+        return hits, getattr(self._results_cache, 'count', None)
+
+    def _get_cached_results(self):
+        """Return the results of the query set.
+
+        Results are fetched once per query set. With cache_results, the
+        hits are also shared through the cache.
+
+        """
+        if getattr(self, '_objects_cache', None) is None:
+            timeout = getattr(self, '_results_timeout', None)
+            key = self._cache_key('hits', self) if timeout else None
+            hits = cache.get(key) if key else None
+            if hits is None:
+                hits = self._get_hits()
+                if key:
+                    cache.set(key, hits, timeout)
+            self._hits_cache = hits
+            self._objects_cache = self._get_results(hits[0])
+        return self._objects_cache
+
     def __iter__(self):
-        self._iterator = super(PrivacyAwareS, self).__iter__()
+        return iter(self._get_cached_results())
 
-        def _generator():
-            while True:
-                mapped_obj = self._iterator.next()
-                obj = mapped_obj.get_object()
-                obj._privacy_level = getattr(self, '_privacy_level', None)
-                yield obj
-        return _generator()
+    def __len__(self):
+        return len(self._get_cached_results())
 
 
 class UserProfileMappingType(MappingType, Indexable):
@@ -78,10 +392,25 @@ class UserProfileMappingType(MappingType, Indexable):
                 'allows_community_sites': {'type': 'boolean'},
                 'photo': {'type': 'boolean'},
                 'last_updated': {'type': 'date'},
-                'date_joined': {'type': 'date'}
+                'date_joined': {'type': 'date'},
+                'card': {'type': 'object', 'enabled': False}
             }
         }
 
+    @classmethod
+    def get_index_settings(cls, bulk=False):
+        """Returns ElasticSearch index settings.
+
+        Bulk settings disable refreshing and replication, to speed up
+        loading a new index. The regular settings must be restored
+        once loading is done.
+
+        """
+        if bulk:
+            return {'refresh_interval': '-1', 'number_of_replicas': 0}
+        return {'refresh_interval': '1s',
+                'number_of_replicas': settings.ES_INDEX_REPLICAS}
+
     @classmethod
     def index(cls, document, id_=None, overwrite_existing=False, es=None,
               public_index=False):
@@ -150,21 +479,92 @@ class UserProfileMappingType(MappingType, Indexable):
         doc.update(dict(bio=obj.bio))
         doc.update(dict(has_photo=bool(obj.photo)))
 
+        # Iterate over .all() so that prefetched groups, skills,
+        # aliases and languages are used when available.
         for attribute in ['groups', 'skills']:
             groups = []
             for g in getattr(obj, attribute).all():
-                groups.extend(g.aliases.values_list('name', flat=True))
+                groups.extend([alias.name for alias in g.aliases.all()])
             doc[attribute] = groups
         # Add to search index language code, language name in English
         # native lanugage name.
         languages = []
-        for code in obj.languages.values_list('code', flat=True):
+        for code in [language.code for language in obj.languages.all()]:
             languages.append(code)
             languages.append(langcode_to_name(code, 'en_US').lower())
             languages.append(langcode_to_name(code, code).lower())
         doc['languages'] = list(set(languages))
+        doc['card'] = cls.extract_card(obj)
         return doc
 
+    @classmethod
+    def extract_card(cls, obj):
+        """Extract the fields needed to render obj as a search result.
+
+        The values respect the privacy level of obj, so the card of a
+        document is as private as the document itself.
+
+        """
+        return {
+            'id': obj.id,
+            'username': obj.user.username,
+            'display_name': obj.display_name,
+            'email': obj.email,
+            'ircname': obj.ircname,
+            'photo_url': obj.get_photo_url(SEARCH_CARD_PHOTO_GEOMETRY)
+        }
+
+    @classmethod
+    def extract_documents(cls, obj_ids, objs=None):
+        """Extract documents for a batch of objects.
+
+        Related data is fetched with a fixed number of bulk queries
+        instead of a handful of queries per profile. If objs is
+        given, it must be a UserProfile queryset; its privacy level
+        is applied to every extracted document.
+
+        """
+        if objs is None:
+            objs = cls.get_model().objects.filter(id__in=obj_ids)
+
+        privacy_level = getattr(objs, '_privacy_level', None)
+        documents = []
+        for obj in cls._prefetch_for_extraction(objs):
+            obj.set_instance_privacy_level(privacy_level)
+            documents.append(cls.extract_document(obj.id, obj))
+        return documents
+
+    @classmethod
+    def extract_private_and_public_documents(cls, obj_ids, objs=None):
+        """Extract documents for both the default and the public index.
+
+        Every object is loaded once. Returns a tuple of the list of
+        documents for the default index and the list of privacy
+        filtered documents for the public indexable objects.
+
+        """
+        if objs is None:
+            objs = cls.get_model().objects.filter(id__in=obj_ids)
+
+        documents = []
+        public_documents = []
+        for obj in cls._prefetch_for_extraction(objs):
+            obj.set_instance_privacy_level(None)
+            documents.append(cls.extract_document(obj.id, obj))
+            if obj.is_complete and obj.is_public_indexable:
+                obj.set_instance_privacy_level(PUBLIC)
+                public_documents.append(cls.extract_document(obj.id, obj))
+        return documents, public_documents
+
+    @classmethod
+    def _prefetch_for_extraction(cls, objs):
+        # Prefetching through privacy aware attributes is not
+        # possible, so fetch without privacy. Callers must set the
+        # privacy level on every object before extracting its document.
+        return (objs.privacy_level(None)
+                .select_related('user', 'geo_country', 'geo_region', 'geo_city')
+                .prefetch_related('groups__aliases', 'skills__aliases', 'language_set'))
+
     @classmethod
     def get_indexable(cls):
         model = cls.get_model()
@@ -196,7 +596,7 @@ class UserProfileMappingType(MappingType, Indexable):
                                    fullname__fuzzy=2, bio__match=2)
                       .query(or_=query_dict))
 
-        search = search.order_by('_score', 'name')
+        search = search.order_by('_score', 'name').cache_results()
 
         if not include_non_vouched:
             search = search.filter(is_vouched=True)
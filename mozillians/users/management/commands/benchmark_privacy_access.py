@@ -0,0 +1,83 @@
+"""
+Measure the cost of attribute access on privacy aware UserProfiles.
+
+Compares plain attribute lookups, the previous implementation of
+UserProfile.__getattribute__ and the current one, on an unsaved
+profile so that no database access is involved.
+"""
+from optparse import make_option
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+
+from mozillians.users.managers import MOZILLIANS, PUBLIC
+from mozillians.users.models import UserProfile
+
+
+# Mix of attributes read while rendering a profile: privacy
+# controlled fields, plain fields and Django internals.
+ATTRIBUTES = ['full_name', 'ircname', 'bio', 'timezone', 'tshirt', 'id', 'is_vouched',
+              'user_id', 'privacy_full_name', '_meta', '_state', 'pk']
+
+
+def legacy_getattribute(self, attrname):
+    """UserProfile.__getattribute__ before privacy lookups were streamlined."""
+    _getattr = (lambda x: object.__getattribute__(self, x))
+    privacy_fields = UserProfile.privacy_fields()
+    privacy_level = _getattr('_privacy_level')
+    special_functions = {
+        'accounts': '_accounts',
+        'alternate_emails': '_alternate_emails',
+        'email': '_primary_email',
+        'is_public_indexable': '_is_public_indexable',
+        'languages': '_languages',
+        'vouches_made': '_vouches_made',
+        'vouches_received': '_vouches_received',
+        'vouched_by': '_vouched_by',
+        'websites': '_websites'
+    }
+
+    if attrname in special_functions:
+        return _getattr(special_functions[attrname])
+
+    if not privacy_level or attrname not in privacy_fields:
+        return _getattr(attrname)
+
+    field_privacy = _getattr('privacy_%s' % attrname)
+    if field_privacy < privacy_level:
+        return privacy_fields.get(attrname)
+
+    return _getattr(attrname)
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Measures the cost of privacy aware attribute access on UserProfile'
+
+    option_list = list(BaseCommand.option_list) + [
+        make_option('--number',
+                    dest='number',
+                    type='int',
+                    default=20000,
+                    help='Number of passes over the attributes per measurement.'),
+    ]
+
+    def handle(self, *args, **options):
+        number = options.get('number')
+        profile = UserProfile(full_name='Foo Bar', ircname='foobar', bio='Bio',
+                              privacy_full_name=PUBLIC, privacy_bio=MOZILLIANS)
+        accesses = number * len(ATTRIBUTES)
+
+        implementations = [
+            ('object', lambda attrname: object.__getattribute__(profile, attrname)),
+            ('legacy', lambda attrname: legacy_getattribute(profile, attrname)),
+            ('current', lambda attrname: getattr(profile, attrname)),
+        ]
+
+        for privacy_level in [None, PUBLIC]:
+            profile.set_instance_privacy_level(privacy_level)
+            for name, lookup in implementations:
+                timer = Timer(lambda: [lookup(attrname) for attrname in ATTRIBUTES])
+                elapsed = min(timer.repeat(repeat=3, number=number))
+                self.stdout.write('privacy_level=%s %-8s %8.1f ns/access\n'
+                                  % (privacy_level, name, elapsed * 1e9 / accesses))
@@ -0,0 +1,84 @@
+"""
+Geocode the location of profiles again, from their lat and lng.
+
+Profiles are processed in batches by id, so an interrupted run can be
+resumed with --start-id. Every batch looks up each geocoding cell
+once and calls Mapbox at most --rate times per second for the cells
+that are not cached. Profiles keep their choice of showing a region
+and a city, or use the one they were queued with by queue_geocode.
+Queued profiles count as missing and are removed from the queue once
+geocoded.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from mozillians.geo.models import PendingGeocode
+from mozillians.geo.tasks import geocode_profiles
+from mozillians.users.models import UserProfile
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Geocodes the location of profiles from their lat and lng'
+
+    option_list = list(BaseCommand.option_list) + [
+        make_option('--batch-size',
+                    dest='batch_size',
+                    type='int',
+                    default=500,
+                    help='Number of profiles geocoded per batch.'),
+        make_option('--rate',
+                    dest='rate',
+                    type='float',
+                    default=2,
+                    help='Maximum number of Mapbox requests per second.'),
+        make_option('--start-id',
+                    dest='start_id',
+                    type='int',
+                    default=0,
+                    help='Geocode profiles with an id larger than this.'),
+        make_option('--missing',
+                    dest='missing',
+                    action='store_true',
+                    default=False,
+                    help='Geocode only profiles without a known country or queued ones.'),
+    ]
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size')
+        rate = options.get('rate')
+        if batch_size < 1 or rate <= 0:
+            raise CommandError('Options --batch-size and --rate must be positive')
+
+        profiles = (UserProfile.objects.exclude(lat__isnull=True).exclude(lng__isnull=True)
+                    .order_by('id'))
+        if options.get('missing'):
+            profiles = profiles.filter(Q(geo_country__isnull=True) |
+                                       Q(geo_country__mapbox_id='geo_error') |
+                                       Q(pending_geocode__isnull=False))
+
+        last_id = options.get('start_id')
+        total = changed = 0
+        while True:
+            started = timezone.now()
+            batch = list(profiles.filter(id__gt=last_id)
+                         .values_list('id', 'geo_region', 'geo_city',
+                                      'pending_geocode__save_region',
+                                      'pending_geocode__save_city')[:batch_size])
+            if not batch:
+                break
+            profile_options = {}
+            for pk, region, city, save_region, save_city in batch:
+                if save_region is None:
+                    save_region, save_city = region is not None, city is not None
+                profile_options[pk] = (save_region, save_city)
+            changed += len(geocode_profiles(profile_options, min_interval=1.0 / rate))
+            PendingGeocode.objects.filter(profile__in=profile_options.keys(),
+                                          updated__lte=started).delete()
+            total += len(batch)
+            last_id = batch[-1][0]
+            self.stdout.write('{0} profiles geocoded, {1} changed, last id {2}\n'
+                              .format(total, changed, last_id))
@@ -1,5 +1,9 @@
+from itertools import islice, izip
+
+from django.db import connections
 from django.db.models import Q, Manager, get_model
 from django.db.models.query import QuerySet, ValuesQuerySet
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
 
 from tower import ugettext_lazy as _lazy
 
@@ -38,16 +42,34 @@ class UserProfileValuesQuerySet(ValuesQuerySet):
 
         model_privacy_fields = self.model.privacy_fields()
 
-        privacy_fields = [
-            (names.index('privacy_%s' % field), names.index(field), field)
-            for field in set(model_privacy_fields) & set(names)]
-
-        for row in self.query.get_compiler(self.db).results_iter():
-            row = list(row)
-            for levelindex, fieldindex, field in privacy_fields:
-                if row[levelindex] < self._privacy_level:
-                    row[fieldindex] = model_privacy_fields[field]
-            yield dict(zip(names, row))
+        privacy_fields = []
+        for field in set(model_privacy_fields) & set(names):
+            privacy_name = 'privacy_%s' % field
+            if privacy_name not in names:
+                raise ValueError('%s must be selected along with %s' % (privacy_name, field))
+            privacy_fields.append((names.index(privacy_name), names.index(field),
+                                   model_privacy_fields[field]))
+
+        privacy_level = self._privacy_level
+        results = self.query.get_compiler(self.db).results_iter()
+        if not privacy_level or not privacy_fields:
+            for row in results:
+                yield dict(zip(names, row))
+            return
+
+        # Mask a fetched chunk at a time, one column per privacy field,
+        # instead of checking every field of every row.
+        while True:
+            rows = list(islice(results, GET_ITERATOR_CHUNK_SIZE))
+            if not rows:
+                return
+            columns = zip(*rows)
+            for privacy_index, index, default in privacy_fields:
+                columns[index] = [value if privacy >= privacy_level else default
+                                  for value, privacy in izip(columns[index],
+                                                             columns[privacy_index])]
+            for row in izip(*columns):
+                yield dict(izip(names, row))
 
 
 class UserProfileQuerySet(QuerySet):
@@ -79,6 +101,21 @@ class UserProfileQuerySet(QuerySet):
         """Return profiles with at least one PUBLIC field."""
         return self.filter(self.public_q)
 
+    def with_public_flag(self):
+        """Select has_public_field, true for profiles with at least one PUBLIC field.
+
+        This is the per profile equivalent of public(), for callers
+        that need to fetch the profile regardless.
+
+        """
+        quote_name = connections[self.db].ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        columns = ['%s.%s' % (table, quote_name('privacy_%s' % field))
+                   for field in sorted(self.model.privacy_fields())]
+        sql = '(%s)' % ' OR '.join('%s = %%s' % column for column in columns)
+        return self.extra(select={'has_public_field': sql},
+                          select_params=[PUBLIC] * len(columns))
+
     def vouched(self):
         """Return complete and vouched profiles."""
         return self.complete().filter(is_vouched=True)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0001_initial'),
+        ('users', '0002_auto_20150827_0822'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='userprofile',
+            index_together=set([('geo_region', 'full_name'), ('geo_country', 'full_name'), ('geo_city', 'full_name')]),
+        ),
+    ]
@@ -2,15 +2,18 @@ import logging
 import os
 import uuid
 from datetime import datetime
+from operator import itemgetter
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db import models
-from django.db.models import signals as dbsignals, ManyToManyField
+from django.db import connection, models
+from django.db.models import signals as dbsignals, ManyToManyField, Q
 from django.dispatch import receiver
 from django.utils.encoding import iri_to_uri
 from django.utils.http import urlquote
+from django.utils.timezone import now
 from django.template.loader import get_template
 
 
@@ -24,8 +27,11 @@ from funfactory import utils
 
 from mozillians.common.helpers import absolutify, gravatar
 from mozillians.common.helpers import offset_of_timezone
-from mozillians.groups.models import (Group, GroupAlias, GroupMembership,
+from mozillians.common.middleware import invalidate_vouched_flag
+from mozillians.geo.tasks import update_location_counts
+from mozillians.groups.models import (Group, GroupAlias, GroupCommonSkill, GroupMembership,
                                       Skill, SkillAlias)
+from mozillians.groups.tasks import email_membership_change, schedule_common_skills_update
 from mozillians.phonebook.validators import (validate_email, validate_twitter,
                                              validate_website, validate_username_not_url,
                                              validate_phone_number)
@@ -35,7 +41,7 @@ from mozillians.users.managers import (EMPLOYEES,
                                        MOZILLIANS, PRIVACY_CHOICES, PRIVILEGED,
                                        PUBLIC, PUBLIC_INDEXABLE_FIELDS,
                                        UserProfileManager, UserProfileQuerySet)
-from mozillians.users.tasks import (index_objects, unsubscribe_from_basket_task,
+from mozillians.users.tasks import (queue_index_update, unsubscribe_from_basket_task,
                                     update_basket_task, unindex_objects)
 
 
@@ -44,6 +50,27 @@ AVATAR_SIZE = (300, 300)
 logger = logging.getLogger(__name__)
 
 
+def _profile_version_key(profile_id):
+    return 'users:profile_version:{0}'.format(profile_id)
+
+
+def get_profile_version(profile_id):
+    """Return the current version of the data shown on a profile page.
+
+    The version changes whenever invalidate_profile_version is called
+    for the profile or the cache entry is evicted.
+
+    """
+    key = _profile_version_key(profile_id)
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key)
+
+
+def invalidate_profile_version(profile_id):
+    """Make cached renderings of a profile page stale."""
+    cache.delete(_profile_version_key(profile_id))
+
+
 def _calculate_photo_filename(instance, filename):
     """Generate a unique filename for uploaded photo."""
     return os.path.join(settings.USER_AVATAR_DIR, str(uuid.uuid4()) + '.jpg')
@@ -58,6 +85,24 @@ class PrivacyField(models.PositiveSmallIntegerField):
         super(PrivacyField, self).__init__(*args, **myargs)
 
 
+# Attributes of UserProfile whose privacy aware values are computed by
+# the properties they map to.
+PRIVACY_SPECIAL_FUNCTIONS = {
+    'accounts': '_accounts',
+    'alternate_emails': '_alternate_emails',
+    'email': '_primary_email',
+    'is_public_indexable': '_is_public_indexable',
+    'languages': '_languages',
+    'vouches_made': '_vouches_made',
+    'vouches_received': '_vouches_received',
+    'vouched_by': '_vouched_by',
+    'websites': '_websites'
+}
+
+# Attribute lookup without privacy masking.
+_getattribute = object.__getattribute__
+
+
 class UserProfilePrivacyModel(models.Model):
     _privacy_level = None
 
@@ -212,6 +257,12 @@ class UserProfile(UserProfilePrivacyModel):
     class Meta:
         db_table = 'profile'
         ordering = ['full_name']
+        # Serve the keyset paginated lists of Mozillians in a location.
+        index_together = [
+            ('geo_country', 'full_name'),
+            ('geo_region', 'full_name'),
+            ('geo_city', 'full_name'),
+        ]
 
     def __getattribute__(self, attrname):
         """Special privacy aware __getattribute__ method.
@@ -223,36 +274,30 @@ class UserProfile(UserProfilePrivacyModel):
         Otherwise it returns a default privacy respecting value for
         the attribute, as defined in the privacy_fields dictionary.
 
-        special_functions provides methods that privacy safe their
-        respective properties, where the privacy modifications are
-        more complex.
+        PRIVACY_SPECIAL_FUNCTIONS provides methods that privacy safe
+        their respective properties, where the privacy modifications
+        are more complex.
+
+        This runs on every attribute access, including the ones made
+        by Django itself, so it avoids any work that is not needed to
+        answer the lookup at hand.
         """
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        privacy_fields = UserProfile.privacy_fields()
-        privacy_level = _getattr('_privacy_level')
-        special_functions = {
-            'accounts': '_accounts',
-            'alternate_emails': '_alternate_emails',
-            'email': '_primary_email',
-            'is_public_indexable': '_is_public_indexable',
-            'languages': '_languages',
-            'vouches_made': '_vouches_made',
-            'vouches_received': '_vouches_received',
-            'vouched_by': '_vouched_by',
-            'websites': '_websites'
-        }
-
-        if attrname in special_functions:
-            return _getattr(special_functions[attrname])
-
-        if not privacy_level or attrname not in privacy_fields:
-            return _getattr(attrname)
-
-        field_privacy = _getattr('privacy_%s' % attrname)
-        if field_privacy < privacy_level:
-            return privacy_fields.get(attrname)
-
-        return _getattr(attrname)
+        if attrname in PRIVACY_SPECIAL_FUNCTIONS:
+            return _getattribute(self, PRIVACY_SPECIAL_FUNCTIONS[attrname])
+
+        privacy_level = _getattribute(self, '_privacy_level')
+        if not privacy_level:
+            return _getattribute(self, attrname)
+
+        privacy_fields = (UserProfile.CACHED_PRIVACY_FIELDS or
+                          UserProfile.privacy_fields())
+        if attrname not in privacy_fields:
+            return _getattribute(self, attrname)
+
+        if _getattribute(self, 'privacy_%s' % attrname) < privacy_level:
+            return privacy_fields[attrname]
+
+        return _getattribute(self, attrname)
 
     def _filter_accounts_privacy(self, accounts):
         if self._privacy_level:
@@ -261,15 +306,14 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def _accounts(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         excluded_types = [ExternalAccount.TYPE_WEBSITE, ExternalAccount.TYPE_EMAIL]
-        accounts = _getattr('externalaccount_set').exclude(type__in=excluded_types)
+        accounts = _getattribute(self, 'externalaccount_set').exclude(type__in=excluded_types)
         return self._filter_accounts_privacy(accounts)
 
     @property
     def _alternate_emails(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_EMAIL)
+        accounts = _getattribute(self, 'externalaccount_set')
+        accounts = accounts.filter(type=ExternalAccount.TYPE_EMAIL)
         return self._filter_accounts_privacy(accounts)
 
     @property
@@ -281,19 +325,17 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def _languages(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        if self._privacy_level > _getattr('privacy_languages'):
-            return _getattr('language_set').none()
-        return _getattr('language_set').all()
+        if self._privacy_level > _getattribute(self, 'privacy_languages'):
+            return _getattribute(self, 'language_set').none()
+        return _getattribute(self, 'language_set').all()
 
     @property
     def _primary_email(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         privacy_fields = UserProfile.privacy_fields()
-        if self._privacy_level and _getattr('privacy_email') < self._privacy_level:
+        if self._privacy_level and _getattribute(self, 'privacy_email') < self._privacy_level:
             email = privacy_fields['email']
             return email
-        return _getattr('user').email
+        return _getattribute(self, 'user').email
 
     @property
     def _vouched_by(self):
@@ -314,36 +356,33 @@ class UserProfile(UserProfilePrivacyModel):
         return None
 
     def _vouches(self, type):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
 
         vouch_ids = []
-        for vouch in _getattr(type).all():
+        for vouch in _getattribute(self, type).all():
             vouch.vouchee.set_instance_privacy_level(self._privacy_level)
             for field in UserProfile.privacy_fields():
                 if getattr(vouch.vouchee, 'privacy_%s' % field, 0) >= self._privacy_level:
                     vouch_ids.append(vouch.id)
-        vouches = _getattr(type).filter(pk__in=vouch_ids)
+        vouches = _getattribute(self, type).filter(pk__in=vouch_ids)
 
         return vouches
 
     @property
     def _vouches_made(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         if self._privacy_level:
             return self._vouches('vouches_made')
-        return _getattr('vouches_made')
+        return _getattribute(self, 'vouches_made')
 
     @property
     def _vouches_received(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         if self._privacy_level:
             return self._vouches('vouches_received')
-        return _getattr('vouches_received')
+        return _getattribute(self, 'vouches_received')
 
     @property
     def _websites(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_WEBSITE)
+        accounts = _getattribute(self, 'externalaccount_set')
+        accounts = accounts.filter(type=ExternalAccount.TYPE_WEBSITE)
         return self._filter_accounts_privacy(accounts)
 
     @property
@@ -403,7 +442,12 @@ class UserProfile(UserProfilePrivacyModel):
             self.save()
 
     def set_membership(self, model, membership_list):
-        """Alters membership to Groups and Skills."""
+        """Alters membership to Groups and Skills.
+
+        Names and aliases are resolved with a single query and
+        memberships are added in bulk.
+
+        """
         if model is Group:
             m2mfield = self.groups
             alias_model = GroupAlias
@@ -420,22 +464,64 @@ class UserProfile(UserProfilePrivacyModel):
                               if g.name not in membership_list and g.is_visible])
 
         # Add/create the rest of the groups
+        aliases = alias_model.objects.filter(name__in=membership_list).select_related('alias')
+        groups = dict((alias.name.lower(), alias.alias) for alias in aliases)
         groups_to_add = []
         for g in membership_list:
-            if alias_model.objects.filter(name=g).exists():
-                group = alias_model.objects.get(name=g).alias
-            else:
-                group = model.objects.create(name=g)
+            group = groups.get(g.lower())
+            if group is None:
+                # Creating a group also creates its alias, so this
+                # can't be done in bulk.
+                group = groups[g.lower()] = model.objects.create(name=g)
 
-            if group.is_visible:
+            if group.is_visible and group not in groups_to_add:
                 groups_to_add.append(group)
 
         if model is Group:
-            for group in groups_to_add:
-                group.add_member(self)
+            self._add_to_groups(groups_to_add)
         else:
             m2mfield.add(*groups_to_add)
 
+    def _add_to_groups(self, groups):
+        """Add the profile as a member to groups, in bulk.
+
+        Works like Group.add_member for every group: pending
+        memberships are accepted and full memberships are kept.
+
+        """
+        groups = dict((group.id, group) for group in groups)
+        memberships = GroupMembership.objects.filter(userprofile=self, group__in=groups.keys())
+        existing_ids = set()
+        accepted = []
+        for membership in memberships:
+            existing_ids.add(membership.group_id)
+            if membership.status == GroupMembership.PENDING:
+                accepted.append(membership)
+
+        new_ids = [group_id for group_id in groups if group_id not in existing_ids]
+        GroupMembership.objects.bulk_create([
+            GroupMembership(userprofile=self, group_id=group_id,
+                            status=GroupMembership.MEMBER, date_joined=now())
+            for group_id in new_ids])
+        if accepted:
+            (GroupMembership.objects.filter(id__in=[membership.id for membership in accepted])
+             .update(status=GroupMembership.MEMBER))
+
+        # bulk_create() and update() don't send the signals that
+        # maintain the member counts and common skills.
+        joined_ids = new_ids + [membership.group_id for membership in accepted]
+        Group.update_member_count(new_ids, 1)
+        schedule_common_skills_update(joined_ids)
+        if joined_ids:
+            invalidate_profile_version(self.id)
+            invalidate_vouched_flag(self.user_id)
+
+        if any(groups[group_id].functional_area for group_id in joined_ids):
+            update_basket_task.delay(self.id)
+        for membership in accepted:
+            email_membership_change.delay(membership.group_id, self.user.pk,
+                                          GroupMembership.PENDING, GroupMembership.MEMBER)
+
     def get_photo_thumbnail(self, geometry='160x160', **kwargs):
         if 'crop' not in kwargs:
             kwargs['crop'] = 'center'
@@ -545,18 +631,16 @@ class UserProfile(UserProfilePrivacyModel):
         membership. The groups pending membership will have a .pending attribute
         set to True, others will have it set False.
         """
+        # Privacy is checked here, as self.groups would, so that groups
+        # and membership status come from a single membership query.
+        privacy_level = self._privacy_level
+        if privacy_level and self.privacy_groups < privacy_level:
+            return []
+
         groups = []
-        # Query this way so we only get the groups that the privacy controls allow the
-        # current user to see. We have to force evaluation of this query first, otherwise
-        # Django combines the whole thing into one query and loses the privacy control.
-        groups_manager = self.groups
-        # checks to avoid AttributeError exception b/c self.groups may returns
-        # EmptyQuerySet instead of the default manager due to privacy controls
-        if hasattr(groups_manager, 'visible'):
-            user_group_ids = list(groups_manager.visible().values_list('id', flat=True))
-        else:
-            user_group_ids = []
-        for membership in self.groupmembership_set.filter(group_id__in=user_group_ids):
+        memberships = (self.groupmembership_set.filter(group__visible=True)
+                       .select_related('group'))
+        for membership in memberships:
             group = membership.group
             group.pending = (membership.status == GroupMembership.PENDING)
             groups.append(group)
@@ -582,35 +666,38 @@ class UserProfile(UserProfilePrivacyModel):
         if autovouch:
             self.auto_vouch()
 
-    def reverse_geocode(self):
+    def reverse_geocode(self, lookup=False):
         """
-        Use the user's lat and lng to set their city, region, and country.
-        Does not save the profile.
+        Use the user's lat and lng to set their city, region, and country
+        from the geocoding cache. Does not save the profile.
+
+        Returns False if the location is not cached. It has to be looked
+        up with mozillians.geo.tasks.queue_geocode after saving the
+        profile then. If lookup is True, a location that is not cached
+        is looked up from mapbox right away instead, and False is only
+        returned if that fails.
         """
         if self.lat is None or self.lng is None:
-            return
+            return True
 
         from mozillians.geo.models import Country
-        from mozillians.geo.lookup import reverse_geocode, GeoLookupException
-        try:
-            result = reverse_geocode(self.lat, self.lng)
-        except GeoLookupException:
-            if self.geo_country:
-                # If self.geo_country is already set, just give up.
-                pass
-            else:
-                # No country set, we need to at least set the placeholder one.
-                self.geo_country = Country.objects.get(mapbox_id='geo_error')
-                self.geo_region = None
-                self.geo_city = None
+        from mozillians.geo.lookup import GeoLookupException, get_cached_geocode, reverse_geocode
+        if not lookup:
+            result = get_cached_geocode(self.lat, self.lng)
+            if result is None:
+                return False
         else:
-            if result:
-                country, region, city = result
-                self.geo_country = country
-                self.geo_region = region
-                self.geo_city = city
-            else:
-                logger.error('Got back NONE from reverse_geocode on %s, %s' % (self.lng, self.lat))
+            try:
+                result = reverse_geocode(self.lat, self.lng)
+            except GeoLookupException:
+                if not self.geo_country_id:
+                    # No country set, we need to at least set the placeholder one.
+                    self.geo_country = Country.objects.get(mapbox_id='geo_error')
+                    self.geo_region = None
+                    self.geo_city = None
+                return False
+        self.geo_country, self.geo_region, self.geo_city = result
+        return True
 
 
 @receiver(dbsignals.post_save, sender=User,
@@ -636,11 +723,144 @@ def update_basket(sender, instance, **kwargs):
           dispatch_uid='update_search_index_sig')
 def update_search_index(sender, instance, **kwargs):
     if instance.is_complete:
-        index_objects.delay(UserProfileMappingType, [instance.id], public_index=False)
-        if instance.is_public_indexable:
-            index_objects.delay(UserProfileMappingType, [instance.id], public_index=True)
-        else:
-            unindex_objects.delay(UserProfileMappingType, [instance.id], public_index=True)
+        queue_index_update(instance.id)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='invalidate_vouched_flag_sig')
+def invalidate_vouched_flag_sig(sender, instance, **kwargs):
+    # update_vouch_flags saves the profile, as does any other change of
+    # is_vouched.
+    invalidate_vouched_flag(instance.user_id)
+
+
+@receiver(dbsignals.post_save, sender=User,
+          dispatch_uid='invalidate_vouched_flag_user_sig')
+def invalidate_vouched_flag_user_sig(sender, instance, raw, **kwargs):
+    # The privacy level depends on is_superuser.
+    if not raw:
+        invalidate_vouched_flag(instance.id)
+
+
+@receiver(dbsignals.m2m_changed, sender=User.groups.through,
+          dispatch_uid='invalidate_vouched_flag_user_groups_sig')
+def invalidate_vouched_flag_user_groups_sig(sender, instance, action, reverse, pk_set, **kwargs):
+    # The privacy level depends on the Managers group.
+    if not reverse:
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            invalidate_vouched_flag(instance.id)
+        return
+    if action == 'pre_clear':
+        pk_set = instance.user_set.values_list('id', flat=True)
+    elif action not in ['post_add', 'post_remove']:
+        return
+    for user_id in pk_set:
+        invalidate_vouched_flag(user_id)
+
+
+@receiver(dbsignals.post_save, sender=GroupMembership,
+          dispatch_uid='invalidate_vouched_flag_membership_sig')
+@receiver(dbsignals.post_delete, sender=GroupMembership,
+          dispatch_uid='invalidate_vouched_flag_membership_delete_sig')
+def invalidate_vouched_flag_membership_sig(sender, instance, **kwargs):
+    # The privacy level depends on the staff group.
+    if not kwargs.get('raw'):
+        invalidate_vouched_flag(instance.userprofile.user_id)
+
+
+LOCATION_FIELDS = ['geo_country', 'geo_region', 'geo_city']
+LOCATION_STATE_FIELDS = (['is_vouched', 'full_name'] + LOCATION_FIELDS +
+                         ['privacy_{0}'.format(field) for field in LOCATION_FIELDS])
+LOCATION_STATE_ATTNAMES = [name + '_id' if name in LOCATION_FIELDS else name
+                           for name in LOCATION_STATE_FIELDS]
+_location_values_getter = itemgetter(*LOCATION_STATE_ATTNAMES)
+LOCATION_COUNTS_DELAY = 10  # seconds
+
+
+def _get_location_state(values):
+    """Return how a profile counts towards the members of its locations.
+
+    values holds the LOCATION_STATE_FIELDS of a profile in order, with
+    ids for the location fields. For every location field the result
+    holds None if the profile is not counted, otherwise the location id
+    and whether the location is public.
+    """
+    is_vouched, full_name = values[:2]
+    if not is_vouched or not full_name:
+        return [None] * len(LOCATION_FIELDS)
+    return [(pk, privacy == PUBLIC) if pk else None
+            for pk, privacy in zip(values[2:5], values[5:8])]
+
+
+def _get_instance_location_values(instance):
+    return tuple(_getattribute(instance, name) for name in LOCATION_STATE_ATTNAMES)
+
+
+def _schedule_location_counts_update(old_state, new_state):
+    ids = [set() for field in LOCATION_FIELDS]
+    for location_ids, old, new in zip(ids, old_state, new_state):
+        if old != new:
+            location_ids.update(state[0] for state in [old, new] if state)
+    if not any(ids):
+        return
+    args = [list(location_ids) for location_ids in ids]
+    if connection.in_atomic_block:
+        # Signals are sent once the save is committed, unless it is part
+        # of a larger transaction. Recount once that is committed too,
+        # update_all_location_counts fixes the counts if it took longer.
+        update_location_counts.apply_async(args, countdown=LOCATION_COUNTS_DELAY)
+    else:
+        update_location_counts.delay(*args)
+
+
+@receiver(dbsignals.post_init, sender=UserProfile,
+          dispatch_uid='store_location_state_sig')
+def store_location_state(sender, instance, **kwargs):
+    # Remember the loaded values of the fields counting towards the
+    # members of locations, to recount the locations the profile
+    # leaves. Profiles loaded with deferred fields are looked up in
+    # pre_save instead.
+    try:
+        instance._location_values = _location_values_getter(instance.__dict__)
+    except KeyError:
+        pass
+
+
+@receiver(dbsignals.pre_save, sender=UserProfile,
+          dispatch_uid='store_deferred_location_state_sig')
+def store_deferred_location_state(sender, instance, raw, **kwargs):
+    if raw or not instance.pk or hasattr(instance, '_location_values'):
+        return
+    values = (UserProfile.objects.filter(pk=instance.pk)
+              .values_list(*LOCATION_STATE_FIELDS).first())
+    if values:
+        instance._location_values = values
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='update_location_counts_sig')
+def update_location_counts_sig(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old_values = getattr(instance, '_location_values', None)
+    new_values = _get_instance_location_values(instance)
+    instance._location_values = new_values
+    if old_values == new_values and not created:
+        return
+    old_state = [None] * len(LOCATION_FIELDS)
+    if old_values is not None and not created:
+        old_state = _get_location_state(old_values)
+    _schedule_location_counts_update(old_state, _get_location_state(new_values))
+
+
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='update_location_counts_delete_sig')
+def update_location_counts_delete_sig(sender, instance, **kwargs):
+    old_values = getattr(instance, '_location_values', None)
+    if old_values is None:
+        old_values = _get_instance_location_values(instance)
+    _schedule_location_counts_update(_get_location_state(old_values),
+                                     [None] * len(LOCATION_FIELDS))
 
 
 @receiver(dbsignals.pre_delete, sender=UserProfile,
@@ -663,6 +883,47 @@ def delete_user_obj_sig(sender, instance, **kwargs):
         instance.user.delete()
 
 
+@receiver(dbsignals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='increase_skill_member_count_sig')
+def increase_skill_member_count(sender, instance, action, reverse, pk_set, **kwargs):
+    # pk_set only holds the newly added relations.
+    if action != 'post_add':
+        return
+    if reverse:
+        Skill.update_member_count([instance.pk], len(pk_set))
+    else:
+        Skill.update_member_count(pk_set, 1)
+
+
+@receiver(dbsignals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='update_common_skills_sig')
+def update_common_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if not reverse:
+        profile_ids = [instance.pk]
+    elif pk_set:
+        profile_ids = pk_set
+    else:
+        # All members of the skill were removed.
+        group_ids = GroupCommonSkill.objects.filter(skill=instance).values_list('group_id',
+                                                                                flat=True)
+        schedule_common_skills_update(group_ids)
+        return
+    group_ids = (GroupMembership.objects
+                 .filter(userprofile__in=profile_ids, status=GroupMembership.MEMBER)
+                 .values_list('group_id', flat=True))
+    schedule_common_skills_update(group_ids)
+
+
+@receiver(dbsignals.post_delete, sender=UserProfile.skills.through,
+          dispatch_uid='decrease_skill_member_count_sig')
+def decrease_skill_member_count(sender, instance, **kwargs):
+    # Removing and clearing skills deletes through rows one by one
+    # when there are post_delete receivers.
+    Skill.update_member_count([instance.skill_id], -1)
+
+
 class Vouch(models.Model):
     vouchee = models.ForeignKey(UserProfile, related_name='vouches_received')
     voucher = models.ForeignKey(UserProfile, related_name='vouches_made',
@@ -892,3 +1153,70 @@ class Language(models.Model):
         if (model_class == type(self) and unique_check == ('code', 'userprofile')):
             return _('This language has already been selected.')
         return super(Language, self).unique_error_message(model_class, unique_check)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='invalidate_profile_version_sig')
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='invalidate_profile_version_delete_sig')
+def invalidate_profile_version_sig(sender, instance, **kwargs):
+    invalidate_profile_version(instance.id)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='invalidate_vouch_profile_versions_sig')
+def invalidate_vouch_profile_versions_sig(sender, instance, created, raw, **kwargs):
+    # The name and photo of a profile show on the pages of the profiles
+    # it vouched for and of its vouchers.
+    if created or raw:
+        return
+    vouches = (Vouch.objects.filter(Q(voucher=instance) | Q(vouchee=instance))
+               .values_list('voucher', 'vouchee'))
+    profile_ids = set(profile_id for vouch in vouches for profile_id in vouch)
+    profile_ids.discard(instance.id)
+    profile_ids.discard(None)
+    for profile_id in profile_ids:
+        invalidate_profile_version(profile_id)
+
+
+@receiver(dbsignals.post_save, sender=ExternalAccount,
+          dispatch_uid='invalidate_profile_version_account_sig')
+@receiver(dbsignals.post_delete, sender=ExternalAccount,
+          dispatch_uid='invalidate_profile_version_account_delete_sig')
+def invalidate_profile_version_account_sig(sender, instance, **kwargs):
+    invalidate_profile_version(instance.user_id)
+
+
+@receiver(dbsignals.post_save, sender=Language,
+          dispatch_uid='invalidate_profile_version_language_sig')
+@receiver(dbsignals.post_delete, sender=Language,
+          dispatch_uid='invalidate_profile_version_language_delete_sig')
+@receiver(dbsignals.post_save, sender=GroupMembership,
+          dispatch_uid='invalidate_profile_version_membership_sig')
+@receiver(dbsignals.post_delete, sender=GroupMembership,
+          dispatch_uid='invalidate_profile_version_membership_delete_sig')
+def invalidate_profile_version_userprofile_sig(sender, instance, **kwargs):
+    invalidate_profile_version(instance.userprofile_id)
+
+
+@receiver(dbsignals.post_save, sender=Vouch,
+          dispatch_uid='invalidate_profile_version_vouch_sig')
+@receiver(dbsignals.post_delete, sender=Vouch,
+          dispatch_uid='invalidate_profile_version_vouch_delete_sig')
+def invalidate_profile_version_vouch_sig(sender, instance, **kwargs):
+    # Vouches show on the pages of both the vouchee and the voucher.
+    invalidate_profile_version(instance.vouchee_id)
+    if instance.voucher_id:
+        invalidate_profile_version(instance.voucher_id)
+
+
+@receiver(dbsignals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='invalidate_profile_version_skills_sig')
+def invalidate_profile_version_skills_sig(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if not reverse:
+        invalidate_profile_version(instance.id)
+    elif pk_set:
+        for profile_id in pk_set:
+            invalidate_profile_version(profile_id)
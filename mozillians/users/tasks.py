@@ -1,8 +1,11 @@
 from datetime import datetime, timedelta
 import logging
 import os
+import re
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db.models import get_model
 
@@ -10,9 +13,11 @@ import basket
 import requests
 from celery.task import task
 from celery.exceptions import MaxRetriesExceededError
+from elasticsearch.exceptions import NotFoundError
 from elasticutils.contrib.django import get_es
 from elasticutils.utils import chunked
 
+from mozillians.users.es import bump_search_generation
 from mozillians.users.managers import PUBLIC
 
 
@@ -25,6 +30,10 @@ BASKET_NEWSLETTER = getattr(settings, 'BASKET_NEWSLETTER', False)
 BASKET_API_KEY = os.environ.get('BASKET_API_KEY', getattr(settings, 'BASKET_API_KEY', False))
 BASKET_ENABLED = all([BASKET_URL, BASKET_NEWSLETTER, BASKET_API_KEY])
 INCOMPLETE_ACC_MAX_DAYS = 7
+INDEX_QUEUE_DELAY = 10  # seconds
+INDEX_QUEUE_KEY = 'users:index_queue'
+INDEX_QUEUE_MAX_BATCH = 1000
+INDEX_QUEUE_MISSING_TIMEOUT = 60  # seconds
 
 
 def _email_basket_managers(action, email, error_message):
@@ -219,25 +228,63 @@ def unsubscribe_from_basket_task(email, basket_token):
 
 
 @task
-def index_objects(mapping_type, ids, chunk_size=100, public_index=False, **kwargs):
+def index_objects(mapping_type, ids, chunk_size=100, public_index=False, index=None,
+                  **kwargs):
+    """Index objects in ES.
+
+    Documents are written to the default or the public index, or to
+    `index` when it is given (e.g. while building a new index).
+
+    """
     if getattr(settings, 'ES_DISABLED', False):
         return
 
     es = get_es()
     model = mapping_type.get_model()
+    if index is None:
+        index = mapping_type.get_index(public_index)
 
     for id_list in chunked(ids, chunk_size):
-        documents = []
         qs = model.objects.filter(id__in=id_list)
-        index = mapping_type.get_index(public_index)
         if public_index:
             qs = qs.public_indexable().privacy_level(PUBLIC)
 
-        for item in qs:
-            documents.append(mapping_type.extract_document(item.id, item))
-
+        documents = mapping_type.extract_documents(id_list, qs)
+        # Don't refresh here. Incremental updates become searchable
+        # within the refresh interval and full rebuilds refresh once
+        # in swap_index_aliases.
         mapping_type.bulk_index(documents, id_field='id', es=es, index=index)
-        mapping_type.refresh_index(es)
+
+
+@task
+def index_objects_private_and_public(mapping_type, ids, chunk_size=100, indexes=None,
+                                     **kwargs):
+    """Index objects in both the default and the public index.
+
+    Every object is read once and sent to the default index; public
+    indexable objects are also sent, privacy filtered, to the public
+    index. `indexes` optionally maps 'default' and 'public' to the
+    index names to write to. Returns the ids, so that index rebuilds
+    know what was indexed.
+
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+
+    es = get_es()
+    model = mapping_type.get_model()
+    indexes = indexes or {'default': mapping_type.get_index(False),
+                          'public': mapping_type.get_index(True)}
+
+    for id_list in chunked(ids, chunk_size):
+        qs = model.objects.filter(id__in=id_list)
+        documents, public_documents = (
+            mapping_type.extract_private_and_public_documents(id_list, qs))
+        mapping_type.bulk_index(documents, id_field='id', es=es, index=indexes['default'])
+        if public_documents:
+            mapping_type.bulk_index(public_documents, id_field='id', es=es,
+                                    index=indexes['public'])
+    return list(ids)
 
 
 @task
@@ -248,6 +295,212 @@ def unindex_objects(mapping_type, ids, public_index, **kwargs):
     es = get_es()
     for id_ in ids:
         mapping_type.unindex(id_, es=es, public_index=public_index)
+    # Cached searches must not keep showing unindexed profiles.
+    mapping_type.refresh_index(es=es, public_index=public_index)
+    bump_search_generation()
+
+
+def queue_index_update(profile_id):
+    """Queue a profile to be (re)indexed.
+
+    Profile ids are collected in the cache and flushed by
+    flush_index_queue at most every INDEX_QUEUE_DELAY seconds, so that
+    repeated saves of the same profile result in a single bulk update.
+
+    """
+    cache.add(INDEX_QUEUE_KEY + ':tail', 0, None)
+    slot = cache.incr(INDEX_QUEUE_KEY + ':tail')
+    cache.set('{0}:{1}'.format(INDEX_QUEUE_KEY, slot), profile_id, None)
+
+    if cache.add(INDEX_QUEUE_KEY + ':scheduled', True, INDEX_QUEUE_DELAY):
+        flush_index_queue.apply_async(countdown=INDEX_QUEUE_DELAY)
+
+
+@task(ignore_result=True)
+def flush_index_queue():
+    """Index or unindex profiles queued by queue_index_update.
+
+    The queue is read in order up to the first empty slot. A slot is
+    empty while queue_index_update is between taking it and writing
+    it, so the flush stops there and a later flush continues. A slot
+    that stays empty for INDEX_QUEUE_MISSING_TIMEOUT seconds was
+    evicted and is skipped. At most INDEX_QUEUE_MAX_BATCH slots are
+    read per flush.
+
+    """
+    # Saves from now on schedule a new flush.
+    cache.delete(INDEX_QUEUE_KEY + ':scheduled')
+
+    tail = cache.get(INDEX_QUEUE_KEY + ':tail', 0)
+    head = cache.get(INDEX_QUEUE_KEY + ':head')
+    if head is None:
+        # Evicted, only the latest slots can still be in the cache.
+        head = max(0, tail - INDEX_QUEUE_MAX_BATCH)
+    if tail <= head:
+        return
+
+    end = min(tail, head + INDEX_QUEUE_MAX_BATCH)
+    keys = ['{0}:{1}'.format(INDEX_QUEUE_KEY, slot) for slot in range(head + 1, end + 1)]
+    queued = cache.get_many(keys)
+
+    ids = set()
+    new_head = head
+    for slot, key in zip(range(head + 1, end + 1), keys):
+        if key in queued:
+            ids.add(queued[key])
+        elif not _index_queue_slot_lost(slot):
+            break
+        new_head = slot
+
+    if new_head > head:
+        cache.set(INDEX_QUEUE_KEY + ':head', new_head, None)
+        cache.delete_many(keys[:new_head - head])
+    if ids:
+        reindex_profiles(ids)
+    if new_head == end < tail:
+        # More than a batch was queued.
+        if cache.add(INDEX_QUEUE_KEY + ':scheduled', True, INDEX_QUEUE_DELAY):
+            flush_index_queue.apply_async(countdown=INDEX_QUEUE_DELAY)
+
+
+def _index_queue_slot_lost(slot):
+    """Return whether an empty slot of the index queue was evicted.
+
+    The first flush to find the slot empty records the time, and the
+    slot counts as lost once it stays empty for
+    INDEX_QUEUE_MISSING_TIMEOUT seconds.
+
+    """
+    now = time.time()
+    missing = cache.get(INDEX_QUEUE_KEY + ':missing')
+    if missing and missing[0] == slot:
+        if now - missing[1] < INDEX_QUEUE_MISSING_TIMEOUT:
+            return False
+        logger.warning('Index queue slot %d was evicted before being indexed.', slot)
+        return True
+    cache.set(INDEX_QUEUE_KEY + ':missing', (slot, now), None)
+    return False
+
+
+def reindex_profiles(ids):
+    """Index or unindex profiles with a bulk update per index."""
+    # Avoid circular dependencies
+    from mozillians.users.models import UserProfile, UserProfileMappingType
+
+    profiles = UserProfile.objects.filter(id__in=ids)
+    index_ids = list(profiles.complete().values_list('id', flat=True))
+    non_public_ids = list(profiles.not_public_indexable().values_list('id', flat=True))
+
+    if index_ids:
+        index_objects_private_and_public(UserProfileMappingType, index_ids)
+    if non_public_ids:
+        unindex_objects(UserProfileMappingType, non_public_ids, public_index=True)
+
+    if index_ids and not getattr(settings, 'ES_DISABLED', False):
+        # Make the updates searchable before dropping cached searches,
+        # so that stale hits are not cached again.
+        es = get_es()
+        for public_index in [False, True]:
+            UserProfileMappingType.refresh_index(es=es, public_index=public_index)
+        bump_search_generation()
+
+
+def _delete_document(es, mapping_type, index, id_):
+    try:
+        es.delete(index=index, doc_type=mapping_type.get_mapping_type_name(), id=id_)
+    except NotFoundError:
+        pass
+
+
+def _replay_index_changes(es, mapping_type, results, started, indexes):
+    """Bring rebuilt indexes up to date with changes made during the rebuild.
+
+    Updates made while the rebuild ran went to the old indexes only,
+    and chunks may have read a profile before it changed. Profiles
+    updated since `started` are indexed again, and profiles that were
+    indexed but were deleted or became incomplete since are removed.
+    `results` are the ids returned by the index chunks.
+
+    """
+    model = mapping_type.get_model()
+    indexed = set()
+    for result in results:
+        indexed.update(result or [])
+    changed = set(model.objects.filter(last_updated__gte=started)
+                  .values_list('id', flat=True))
+
+    complete, public = set(), set()
+    for id_list in chunked(sorted(indexed | changed), 1000):
+        profiles = model.objects.filter(id__in=id_list)
+        complete.update(profiles.complete().values_list('id', flat=True))
+        public.update(profiles.public_indexable().values_list('id', flat=True))
+
+    reindex_ids = sorted(changed & complete)
+    if reindex_ids:
+        index_objects_private_and_public(mapping_type, reindex_ids, indexes=indexes)
+    for id_ in (indexed | changed) - complete:
+        _delete_document(es, mapping_type, indexes['default'], id_)
+        _delete_document(es, mapping_type, indexes['public'], id_)
+    for id_ in changed & (complete - public):
+        _delete_document(es, mapping_type, indexes['public'], id_)
+
+
+@task
+def swap_index_aliases(results, mapping_type, indexes, started=None, new_indexes=None,
+                       **kwargs):
+    """Point search aliases to freshly built indexes.
+
+    `indexes` maps alias names to the names of the new indexes. This
+    runs as the callback of the index_all_profiles chord, i.e. after
+    the new indexes have been fully populated. `results` holds the
+    return values of the index chunks; if any chunk failed the new
+    indexes are deleted and the aliases are left alone. Otherwise
+    changes made since `started` are replayed into `new_indexes`,
+    which maps 'default' and 'public' to the new index names. The
+    regular index settings are restored and each index is refreshed
+    before the swap. Older generations of each index are deleted
+    afterwards.
+
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+
+    es = get_es(timeout=settings.ES_INDEXING_TIMEOUT)
+    # The chord collects results without propagating failures.
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.error('Not swapping search indexes, %d of %d chunks failed: %r',
+                     len(failures), len(results), failures[0])
+        for index in indexes.values():
+            es.indices.delete(index=index, ignore=404)
+        return
+
+    if started is not None and new_indexes:
+        _replay_index_changes(es, mapping_type, results, started, new_indexes)
+
+    actions = []
+    for alias, index in indexes.items():
+        es.indices.put_settings(index=index, body={'index': mapping_type.get_index_settings()})
+        es.indices.refresh(index=index)
+        if es.indices.exists_alias(name=alias):
+            for old_index in es.indices.get_alias(name=alias).keys():
+                actions.append({'remove': {'index': old_index, 'alias': alias}})
+        elif es.indices.exists(index=alias):
+            # Left over from before indexes were aliased. An alias
+            # cannot share its name with an index, so drop it.
+            es.indices.delete(index=alias)
+        actions.append({'add': {'index': index, 'alias': alias}})
+
+    # All aliases are swapped in a single atomic request. The new
+    # indexes were refreshed above, so cached searches can be dropped.
+    es.indices.update_aliases(body={'actions': actions})
+    bump_search_generation()
+
+    for alias, index in indexes.items():
+        generation_re = re.compile(r'^{0}-\d{{14}}$'.format(re.escape(alias)))
+        for old_index in es.indices.get_settings(index='{0}-*'.format(alias)).keys():
+            if old_index != index and generation_re.match(old_index):
+                es.indices.delete(index=old_index)
 
 
 @task
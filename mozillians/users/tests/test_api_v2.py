@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import json
+
+from django.db import connection
 from django.http import Http404
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 
 from mock import ANY, Mock, patch
 from nose.tools import eq_, ok_
@@ -14,7 +18,9 @@ from mozillians.users.tests import UserFactory
 from mozillians.users.api.v2 import (ExternalAccountSerializer,
                                      LanguageSerializer,
                                      UserProfileDetailedSerializer,
+                                     UserProfileExportView,
                                      UserProfileFilter,
+                                     UserProfilePrefetchedSerializer,
                                      UserProfileSerializer,
                                      UserProfileViewSet,
                                      WebsiteSerializer)
@@ -170,6 +176,52 @@ class UserProfileViewSetTests(TestCase):
         ok_(userprofile_mock.objects.complete.called)
         userprofile_mock.objects.complete().privacy_level.assert_called_with(MOZILLIANS)
 
+    def test_get_queryset_detailed(self):
+        viewset = UserProfileViewSet()
+        viewset.request = Mock()
+        viewset.request.privacy_level = MOZILLIANS
+        viewset.request.QUERY_PARAMS = {'detailed': '1'}
+        with patch('mozillians.users.api.v2.UserProfile') as userprofile_mock:
+            viewset.get_queryset()
+
+        queryset = userprofile_mock.objects.complete().privacy_level()
+        queryset.select_related.assert_called_with('user', 'geo_country',
+                                                   'geo_region', 'geo_city')
+        queryset.select_related().prefetch_related.assert_called_with(
+            'externalaccount_set', 'language_set')
+        eq_(viewset.get_serializer_class(), UserProfilePrefetchedSerializer)
+
+    def test_list_detailed_queries_do_not_grow(self):
+        view = UserProfileViewSet.as_view({'get': 'list'})
+
+        def _list():
+            request = RequestFactory().get('/', {'detailed': '1'})
+            request.privacy_level = MOZILLIANS
+            with patch('mozillians.users.api.v2.UserProfileViewSet.permission_classes', []):
+                with CaptureQueriesContext(connection) as queries:
+                    response = view(request)
+                    response.render()
+            return response, len(queries)
+
+        def _create_user():
+            user = UserFactory.create()
+            user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_AMO,
+                                                        identifier='amo')
+            user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_WEBSITE,
+                                                        identifier='http://example.com')
+            user.userprofile.language_set.create(code='en')
+
+        _create_user()
+        response, num_queries = _list()
+        eq_(len(response.data['results']), 1)
+        ok_('external_accounts' in response.data['results'][0])
+
+        for i in range(3):
+            _create_user()
+        response, more_num_queries = _list()
+        eq_(len(response.data['results']), 4)
+        eq_(num_queries, more_num_queries)
+
     def test_retrieve_base(self):
         viewset = UserProfileViewSet()
         viewset.request = Mock()
@@ -187,6 +239,74 @@ class UserProfileViewSetTests(TestCase):
         self.assertRaises(Http404, viewset.retrieve, viewset.request, -1)
 
 
+class UserProfilePrefetchedSerializerTests(TestCase):
+    def test_same_as_detailed(self):
+        user = UserFactory.create(userprofile={'privacy_languages': MOZILLIANS})
+        profile = user.userprofile
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_AMO,
+                                           identifier='amo', privacy=PUBLIC)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_GITHUB,
+                                           identifier='github', privacy=MOZILLIANS)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_EMAIL,
+                                           identifier='foo@example.com', privacy=PUBLIC)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_WEBSITE,
+                                           identifier='http://example.com', privacy=MOZILLIANS)
+        profile.language_set.create(code='en')
+        context = {'request': RequestFactory().get('/')}
+
+        for privacy_level in [MOZILLIANS, PUBLIC]:
+            expected = UserProfileDetailedSerializer(
+                UserProfile.objects.privacy_level(privacy_level).get(pk=profile.pk),
+                context=context).data
+
+            prefetched = (UserProfile.objects
+                          .prefetch_related('externalaccount_set', 'language_set')
+                          .get(pk=profile.pk))
+            prefetched.set_instance_privacy_level(privacy_level)
+            with self.assertNumQueries(0):
+                data = UserProfilePrefetchedSerializer(prefetched, context=context).data
+            eq_(data, expected)
+
+
+class UserProfileExportViewTests(TestCase):
+    def _export(self, privacy_level):
+        view = UserProfileExportView()
+        view.request = RequestFactory().get('/')
+        view.request.privacy_level = privacy_level
+        response = view.get(view.request)
+        eq_(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in ''.join(response.streaming_content).splitlines()]
+
+    def test_export(self):
+        users = [UserFactory.create() for i in range(3)]
+        UserFactory.create(userprofile={'full_name': ''})
+
+        with patch.object(UserProfileExportView, 'batch_size', 2):
+            data = self._export(MOZILLIANS)
+
+        eq_([profile['username'] for profile in data],
+            [user.username for user in sorted(users, key=lambda x: x.userprofile.id)])
+
+    def test_export_public(self):
+        public_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        UserFactory.create()
+
+        data = self._export(PUBLIC)
+
+        eq_([profile['username'] for profile in data], [public_user.username])
+
+    def test_export_queries_per_batch(self):
+        for i in range(3):
+            user = UserFactory.create()
+            user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_AMO,
+                                                        identifier='amo')
+            user.userprofile.language_set.create(code='en')
+
+        # One query per batch plus two prefetches, and a last empty batch.
+        with self.assertNumQueries(4):
+            self._export(MOZILLIANS)
+
+
 class UserProfileFilterTest(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -0,0 +1,26 @@
+from StringIO import StringIO
+
+from nose.tools import eq_
+
+from mozillians.common.tests import TestCase
+from mozillians.users.managers import PUBLIC
+from mozillians.users.management.commands.benchmark_privacy_access import (ATTRIBUTES,
+                                                                           Command,
+                                                                           legacy_getattribute)
+from mozillians.users.tests import UserFactory
+
+
+class BenchmarkPrivacyAccessTests(TestCase):
+    def test_legacy_getattribute_matches(self):
+        user = UserFactory.create(userprofile={'ircname': 'foobar'})
+        profile = user.userprofile
+        for privacy_level in [None, PUBLIC]:
+            profile.set_instance_privacy_level(privacy_level)
+            for attrname in ATTRIBUTES + ['email']:
+                eq_(legacy_getattribute(profile, attrname), getattr(profile, attrname))
+
+    def test_handle(self):
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(number=1)
+        eq_(len(cmd.stdout.getvalue().splitlines()), 6)
@@ -0,0 +1,68 @@
+from StringIO import StringIO
+
+from django.core.management.base import CommandError
+
+from mock import patch
+from nose.tools import eq_, ok_, raises
+
+from mozillians.common.tests import TestCase
+from mozillians.geo.models import PendingGeocode
+from mozillians.geo.tests import CountryFactory
+from mozillians.users.management.commands.geocode_profiles import Command
+from mozillians.users.tests import UserFactory
+
+
+class GeocodeProfilesCommandTests(TestCase):
+    def handle(self, **kwargs):
+        options = {'batch_size': 500, 'rate': 2, 'start_id': 0, 'missing': False}
+        options.update(kwargs)
+        cmd = Command()
+        cmd.stdout = StringIO()
+        cmd.handle(**options)
+        return cmd.stdout.getvalue()
+
+    @patch('mozillians.users.management.commands.geocode_profiles.geocode_profiles')
+    def test_batches(self, geocode_profiles_mock):
+        geocode_profiles_mock.return_value = []
+        profiles = [UserFactory.create().userprofile for i in range(3)]
+        UserFactory.create(userprofile={'lat': None, 'lng': None})
+
+        output = self.handle(batch_size=2, rate=4)
+        eq_(geocode_profiles_mock.call_count, 2)
+        first, second = [args[0] for args, kwargs in geocode_profiles_mock.call_args_list]
+        eq_(first, {profiles[0].id: (True, True), profiles[1].id: (True, True)})
+        eq_(second, {profiles[2].id: (True, True)})
+        eq_(geocode_profiles_mock.call_args[1], {'min_interval': 0.25})
+        eq_(len(output.splitlines()), 2)
+
+    @patch('mozillians.users.management.commands.geocode_profiles.geocode_profiles')
+    def test_start_id_and_missing(self, geocode_profiles_mock):
+        geocode_profiles_mock.return_value = []
+        error_country = CountryFactory.create(mapbox_id='geo_error')
+        first = UserFactory.create(userprofile={'geo_country': None}).userprofile
+        UserFactory.create()
+        missing = UserFactory.create(userprofile={'geo_country': None, 'geo_region': None,
+                                                  'geo_city': None}).userprofile
+        error = UserFactory.create(userprofile={'geo_country': error_country,
+                                                'geo_region': None,
+                                                'geo_city': None}).userprofile
+
+        self.handle(start_id=first.id, missing=True)
+        geocode_profiles_mock.assert_called_once_with(
+            {missing.id: (False, False), error.id: (False, False)}, min_interval=0.5)
+
+    @patch('mozillians.users.management.commands.geocode_profiles.geocode_profiles')
+    def test_queued_profiles(self, geocode_profiles_mock):
+        geocode_profiles_mock.return_value = []
+        UserFactory.create()
+        queued = UserFactory.create().userprofile
+        PendingGeocode.objects.create(profile=queued, save_city=False)
+
+        self.handle(missing=True)
+        geocode_profiles_mock.assert_called_once_with({queued.id: (True, False)},
+                                                      min_interval=0.5)
+        ok_(not PendingGeocode.objects.exists())
+
+    @raises(CommandError)
+    def test_invalid_rate(self):
+        self.handle(rate=0)
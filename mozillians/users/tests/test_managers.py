@@ -1,8 +1,8 @@
 from mock import patch
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.managers import PUBLIC
+from mozillians.users.managers import MOZILLIANS, PUBLIC
 from mozillians.users.models import UserProfile
 from mozillians.users.tests import UserFactory
 
@@ -24,6 +24,13 @@ class UserProfileQuerySetTests(TestCase):
         eq_(set(queryset.all()), set([public_user_1.userprofile,
                                       public_user_2.userprofile]))
 
+    def test_with_public_flag(self):
+        public_user = UserFactory.create(userprofile={'privacy_ircname': PUBLIC})
+        user = UserFactory.create()
+        queryset = UserProfile.objects.with_public_flag()
+        ok_(queryset.get(pk=public_user.userprofile.pk).has_public_field)
+        ok_(not queryset.get(pk=user.userprofile.pk).has_public_field)
+
     def test_vouched(self):
         vouched_user = UserFactory.create()
         UserFactory.create(vouched=False)
@@ -76,3 +83,42 @@ class UserProfileQuerySetTests(TestCase):
         queryset = UserProfile.objects.all()
         queryset.privacy_level(99)
         eq_(queryset.all()[0]._privacy_level, 99)
+
+    def test_values_privacy(self):
+        user = UserFactory.create(userprofile={'ircname': 'foo',
+                                               'privacy_full_name': PUBLIC,
+                                               'privacy_ircname': MOZILLIANS})
+        queryset = UserProfile.objects.filter(pk=user.userprofile.pk)
+        fields = ('full_name', 'privacy_full_name', 'ircname', 'privacy_ircname', 'id')
+
+        values = queryset.privacy_level(PUBLIC).values(*fields)[0]
+        eq_(values['full_name'], user.userprofile.full_name)
+        eq_(values['ircname'], UserProfile.privacy_fields()['ircname'])
+        eq_(values['id'], user.userprofile.pk)
+
+        values = queryset.privacy_level(MOZILLIANS).values(*fields)[0]
+        eq_(values['ircname'], 'foo')
+
+        values = queryset.values(*fields)[0]
+        eq_(values['ircname'], 'foo')
+
+    @patch('mozillians.users.managers.GET_ITERATOR_CHUNK_SIZE', 2)
+    def test_values_privacy_chunks(self):
+        public = UserFactory.create(userprofile={'ircname': 'foo', 'privacy_ircname': PUBLIC})
+        private = UserFactory.create(userprofile={'ircname': 'bar',
+                                                  'privacy_ircname': MOZILLIANS})
+        other = UserFactory.create(userprofile={'ircname': 'baz', 'privacy_ircname': PUBLIC})
+        pks = [user.userprofile.pk for user in (public, private, other)]
+        queryset = (UserProfile.objects.filter(pk__in=pks).privacy_level(PUBLIC)
+                    .values('id', 'ircname', 'privacy_ircname').order_by('id'))
+        ircnames = dict((values['id'], values['ircname']) for values in queryset)
+        eq_(ircnames, {public.userprofile.pk: 'foo',
+                       private.userprofile.pk: UserProfile.privacy_fields()['ircname'],
+                       other.userprofile.pk: 'baz'})
+
+    def test_values_privacy_field_required(self):
+        UserFactory.create()
+        queryset = UserProfile.objects.privacy_level(PUBLIC).values('ircname')
+        with self.assertRaises(ValueError):
+            list(queryset)
+        ok_(list(UserProfile.objects.values('id')))
@@ -4,8 +4,10 @@ from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db.models.query import QuerySet
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import unittest
 from django.utils.timezone import make_aware
 
@@ -15,12 +17,14 @@ from mock import Mock, call, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, Skill
+from mozillians.groups.models import Group, GroupMembership, Skill
 from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
                                      SkillAliasFactory, SkillFactory)
 from mozillians.users.managers import (EMPLOYEES, MOZILLIANS, PUBLIC, PUBLIC_INDEXABLE_FIELDS)
-from mozillians.users.models import ExternalAccount, UserProfile, _calculate_photo_filename, Vouch
-from mozillians.users.es import PrivacyAwareS, UserProfileMappingType
+from mozillians.users.models import (ExternalAccount, UserProfile, _calculate_photo_filename, Vouch,
+                                     get_profile_version)
+from mozillians.users.es import (PrivacyAwareS, SearchResultCard, UserProfileMappingType,
+                                 bump_search_generation)
 from mozillians.users.tests import LanguageFactory, UserFactory
 
 
@@ -34,24 +38,15 @@ class SignaledFunctionsTests(TestCase):
         user = UserFactory.create()
         update_basket_mock.assert_called_with(user.userprofile.id)
 
-    @patch('mozillians.users.models.index_objects.delay')
-    @patch('mozillians.users.models.unindex_objects.delay')
-    def test_update_index_post_save(self, unindex_objects_mock,
-                                    index_objects_mock):
-        user = UserFactory.create()
-        index_objects_mock.assert_called_with(
-            UserProfileMappingType, [user.userprofile.id], public_index=False)
-        unindex_objects_mock.assert_called_with(
-            UserProfileMappingType, [user.userprofile.id], public_index=True)
-
-    @patch('mozillians.users.models.index_objects.delay')
-    @patch('mozillians.users.models.unindex_objects.delay')
-    def test_update_index_post_save_incomplete_profile(self,
-                                                       unindex_objects_mock,
-                                                       index_objects_mock):
+    @patch('mozillians.users.models.queue_index_update')
+    def test_update_index_post_save(self, queue_index_update_mock):
+        user = UserFactory.create()
+        queue_index_update_mock.assert_called_with(user.userprofile.id)
+
+    @patch('mozillians.users.models.queue_index_update')
+    def test_update_index_post_save_incomplete_profile(self, queue_index_update_mock):
         UserFactory.create(userprofile={'full_name': ''})
-        ok_(not index_objects_mock.called)
-        ok_(not unindex_objects_mock.called)
+        ok_(not queue_index_update_mock.called)
 
     def test_remove_from_index_post_delete(self):
         user = UserFactory.create()
@@ -184,11 +179,71 @@ class UserProfileTests(TestCase):
         eq_(set(result['languages']),
             set([u'en', u'fr', u'english', u'french', u'français']))
 
+    def test_extract_documents(self):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        group = GroupFactory.create()
+        skill = SkillFactory.create()
+        for profile in [user_1.userprofile, user_2.userprofile]:
+            group.add_member(profile)
+            profile.skills.add(skill)
+            LanguageFactory.create(code='fr', userprofile=profile)
+        ids = [user_1.userprofile.id, user_2.userprofile.id]
+
+        # One query for the profiles with their user and geo data,
+        # then one per prefetched relation.
+        with self.assertNumQueries(6):
+            result = UserProfileMappingType.extract_documents(ids)
+
+        eq_(sorted(result, key=lambda doc: doc['id']),
+            [UserProfileMappingType.extract_document(id_) for id_ in ids])
+
+    def test_extract_documents_privacy_level(self):
+        user = UserFactory.create(userprofile={'privacy_groups': MOZILLIANS})
+        group = GroupFactory.create()
+        group.add_member(user.userprofile)
+        objs = UserProfile.objects.filter(id=user.userprofile.id).privacy_level(PUBLIC)
+
+        result = UserProfileMappingType.extract_documents([user.userprofile.id], objs)
+        eq_(result[0]['groups'], [])
+
+    def test_extract_private_and_public_documents(self):
+        public = UserFactory.create(userprofile={'privacy_full_name': PUBLIC,
+                                                 'privacy_bio': MOZILLIANS,
+                                                 'bio': 'bio'}).userprofile
+        private = UserFactory.create().userprofile
+        ids = [public.id, private.id]
+
+        documents, public_documents = (
+            UserProfileMappingType.extract_private_and_public_documents(ids))
+
+        eq_(set([doc['id'] for doc in documents]), set(ids))
+        eq_([doc['bio'] for doc in documents if doc['id'] == public.id], ['bio'])
+        eq_([doc['id'] for doc in public_documents], [public.id])
+        eq_(public_documents[0]['fullname'], public.full_name.lower())
+        eq_(public_documents[0]['bio'], '')
+
+    def test_extract_card(self):
+        user = UserFactory.create(userprofile={'full_name': 'Nikos Koukos',
+                                               'ircname': 'nikos',
+                                               'privacy_full_name': PUBLIC,
+                                               'privacy_ircname': MOZILLIANS})
+        profile = user.userprofile
+        profile.set_instance_privacy_level(PUBLIC)
+
+        card = UserProfileMappingType.extract_card(profile)
+        eq_(card['id'], profile.id)
+        eq_(card['username'], user.username)
+        eq_(card['display_name'], 'Nikos Koukos')
+        eq_(card['ircname'], '')
+        eq_(card['photo_url'], profile.get_photo_url('70x70'))
+
     def test_get_mapping(self):
         ok_(UserProfileMappingType.get_mapping())
 
     def test_privacy_aware_iterator(self):
         UserFactory.create(userprofile={'ircname': 'foo'})
+        UserProfileMappingType.refresh_index()
         s = PrivacyAwareS(UserProfileMappingType)
 
         # Manually set privacy level in UserProfileMappingType instance
@@ -197,6 +252,183 @@ class UserProfileTests(TestCase):
         eq_(len(q), 1)
         eq_(q[0]._privacy_level, PUBLIC)
 
+    @patch('mozillians.users.es.S.__iter__')
+    def test_privacy_aware_iterator_single_query(self, iter_mock):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        iter_mock.return_value = iter([Mock(_id=str(user_2.userprofile.id)),
+                                       Mock(_id=str(user_1.userprofile.id))])
+        s = PrivacyAwareS(UserProfileMappingType).privacy_level(PUBLIC)
+
+        with self.assertNumQueries(1):
+            result = list(s)
+            eq_([profile.user.username for profile in result],
+                [user_2.username, user_1.username])
+        eq_(result[0]._privacy_level, PUBLIC)
+
+    @patch('mozillians.users.es.S.__iter__')
+    def test_privacy_aware_source_only(self, iter_mock):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        card = UserProfileMappingType.extract_card(user_1.userprofile)
+        iter_mock.return_value = iter([Mock(_id=str(user_1.userprofile.id), card=card),
+                                       Mock(_id=str(user_2.userprofile.id), card=None)])
+        s = PrivacyAwareS(UserProfileMappingType).source_only()
+
+        # Only the hit without a card is loaded from the database.
+        with self.assertNumQueries(1):
+            result = list(s)
+        ok_(isinstance(result[0], SearchResultCard))
+        eq_(result[0].user.username, user_1.username)
+        eq_(result[0].display_name, user_1.userprofile.display_name)
+        eq_(result[0].get_photo_url('70x70'), card['photo_url'])
+        eq_(result[1], user_2.userprofile)
+
+    def _cursor_hit(self, profile, score=1.0):
+        name = profile.full_name.lower()
+        return {'_id': str(profile.id), '_source': {}, 'sort': [score, name, profile.id]}
+
+    @patch.object(PrivacyAwareS, 'get_es')
+    def test_privacy_aware_cursor_page(self, get_es_mock):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        user_3 = UserFactory.create()
+        es = get_es_mock()
+        es.search.return_value = {
+            'hits': {'total': 3, 'hits': [self._cursor_hit(user_2.userprofile, 2.0),
+                                          self._cursor_hit(user_1.userprofile)]}}
+        s = (PrivacyAwareS(UserProfileMappingType).privacy_level(PUBLIC)
+             .order_by('_score', 'name'))
+
+        page = s.cursor_page(size=2)
+        eq_(page.object_list, [user_2.userprofile, user_1.userprofile])
+        eq_(page[0]._privacy_level, PUBLIC)
+        eq_(page.count, 3)
+        ok_(page.next_cursor)
+        body = es.search.call_args[1]['body']
+        eq_((body['from'], body['size']), (0, 2))
+        eq_(body['sort'], ['_score', 'name', 'id'])
+
+        # The next page is fetched from the last hit of the previous one.
+        es.search.return_value = {
+            'hits': {'total': 3, 'hits': [self._cursor_hit(user_1.userprofile),
+                                          self._cursor_hit(user_3.userprofile, 0.5)]}}
+        page = s.cursor_page(page.next_cursor, size=2)
+        body = es.search.call_args[1]['body']
+        eq_((body['from'], body['size']), (1, 3))
+        eq_(page.object_list, [user_3.userprofile])
+        eq_(page.next_cursor, None)
+
+    @patch.object(PrivacyAwareS, 'get_es')
+    def test_privacy_aware_cursor_page_skips_shifted_hits(self, get_es_mock):
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        user_3 = UserFactory.create()
+        es = get_es_mock()
+        es.search.return_value = {
+            'hits': {'total': 3, 'hits': [self._cursor_hit(user_1.userprofile, 3.0),
+                                          self._cursor_hit(user_2.userprofile, 2.0)]}}
+        s = PrivacyAwareS(UserProfileMappingType).order_by('_score', 'name')
+        cursor = s.cursor_page(size=2).next_cursor
+
+        # A profile indexed in between pushed user_2 back.
+        es.search.return_value = {
+            'hits': {'total': 4, 'hits': [self._cursor_hit(UserFactory.create().userprofile, 2.5),
+                                          self._cursor_hit(user_2.userprofile, 2.0),
+                                          self._cursor_hit(user_3.userprofile, 1.0)]}}
+        page = s.cursor_page(cursor, size=2)
+        eq_(page.object_list, [user_3.userprofile])
+
+    @patch.object(PrivacyAwareS, 'get_es')
+    def test_privacy_aware_cursor_page_invalid_cursor(self, get_es_mock):
+        user = UserFactory.create()
+        es = get_es_mock()
+        es.search.return_value = {
+            'hits': {'total': 2, 'hits': [self._cursor_hit(user.userprofile)]}}
+        s = PrivacyAwareS(UserProfileMappingType).order_by('_score', 'name')
+        cursor = s.cursor_page(size=1).next_cursor
+        ok_(cursor)
+
+        # Cursors of other privacy levels, indexes and queries, and
+        # forged cursors return the first page.
+        for other, other_cursor in [(s.indexes('foo'), cursor),
+                                    (s.query(ircname='foo'), cursor),
+                                    (s, 'invalid'),
+                                    (s, cursor[:-1]),
+                                    (s._clone().privacy_level(PUBLIC), cursor)]:
+            other.cursor_page(other_cursor, size=1)
+            eq_(es.search.call_args[1]['body']['from'], 0)
+
+    @patch('mozillians.users.es.S.count')
+    def test_privacy_aware_cache_count(self, count_mock):
+        cache.clear()
+        count_mock.return_value = 5
+        s = PrivacyAwareS(UserProfileMappingType).query(ircname='foo')
+        eq_(s.count(), 5)
+        eq_(s.count(), 5)
+        eq_(count_mock.call_count, 2)
+
+        count_mock.reset_mock()
+        s = s.cache_count()
+        eq_(s.count(), 5)
+        eq_(s.filter(is_vouched=True).count(), 5)
+        eq_(s.count(), 5)
+        eq_(count_mock.call_count, 2)
+
+    @patch('mozillians.users.es.S.__iter__')
+    def test_privacy_aware_cache_results(self, iter_mock):
+        cache.clear()
+        user = UserFactory.create()
+        iter_mock.side_effect = lambda: iter([Mock(_id=str(user.userprofile.id), card=None)])
+        s = PrivacyAwareS(UserProfileMappingType).query(ircname='foo').cache_results()
+
+        eq_(list(s[:10]), [user.userprofile])
+        eq_(list(s[:10]), [user.userprofile])
+        eq_(iter_mock.call_count, 1)
+
+        # Another page is a different search.
+        list(s[10:20])
+        eq_(iter_mock.call_count, 2)
+
+        bump_search_generation()
+        list(s[:10])
+        eq_(iter_mock.call_count, 3)
+
+        # So is another privacy level.
+        list(s.privacy_level(PUBLIC)[:10])
+        eq_(iter_mock.call_count, 4)
+
+    @patch('mozillians.users.es.S._do_search')
+    @patch('mozillians.users.es.S.__iter__')
+    def test_privacy_aware_cached_results_len(self, iter_mock, do_search_mock):
+        cache.clear()
+        user = UserFactory.create()
+        iter_mock.side_effect = lambda: iter([Mock(_id=str(user.userprofile.id), card=None)])
+        s = PrivacyAwareS(UserProfileMappingType).query(ircname='foo').cache_results()
+        list(s[:10])
+
+        page = s[:10]
+        eq_(len(page), 1)
+        eq_(list(page), [user.userprofile])
+        eq_(iter_mock.call_count, 1)
+        ok_(not do_search_mock.called)
+
+    @override_settings(ES_SLOW_QUERY_THRESHOLD=0)
+    @patch('mozillians.users.es.logger')
+    @patch('mozillians.users.es.statsd')
+    @patch('mozillians.users.es.S.__iter__')
+    def test_privacy_aware_timings(self, iter_mock, statsd_mock, logger_mock):
+        user = UserFactory.create()
+        iter_mock.return_value = iter([Mock(_id=str(user.userprofile.id), card=None)])
+        s = PrivacyAwareS(UserProfileMappingType).query(ircname='foo').stats_prefix('foo')
+        list(s)
+
+        eq_([args[0][0] for args in statsd_mock.timing.call_args_list],
+            ['foo.es', 'foo.hydrate'])
+        # Only Elasticsearch requests are logged.
+        eq_(logger_mock.warning.call_count, 1)
+        ok_('ircname' in logger_mock.warning.call_args[0][2])
+
     @override_settings(ES_INDEXES={'default': 'index'})
     @patch('mozillians.users.es.PrivacyAwareS')
     def test_search_no_public_only_vouched(self, PrivacyAwareSMock):
@@ -205,7 +437,7 @@ class UserProfileTests(TestCase):
         PrivacyAwareSMock.assert_any_call(UserProfileMappingType)
         PrivacyAwareSMock().indexes.assert_any_call('index')
         (PrivacyAwareSMock().indexes().boost()
-         .query().order_by().filter.assert_any_call(is_vouched=True))
+         .query().order_by().cache_results().filter.assert_any_call(is_vouched=True))
         ok_(call().privacy_level(PUBLIC) not in PrivacyAwareSMock.mock_calls)
 
     @override_settings(ES_INDEXES={'default': 'index'})
@@ -216,7 +448,7 @@ class UserProfileTests(TestCase):
         PrivacyAwareSMock.assert_any_call(UserProfileMappingType)
         PrivacyAwareSMock().indexes.assert_any_call('index')
         ok_(call().indexes().boost()
-            .query().order_by().filter(is_vouched=True)
+            .query().order_by().cache_results().filter(is_vouched=True)
             not in PrivacyAwareSMock.mock_calls)
         ok_(call().privacy_level(PUBLIC) not in PrivacyAwareSMock.mock_calls)
 
@@ -230,7 +462,7 @@ class UserProfileTests(TestCase):
         (PrivacyAwareSMock().privacy_level()
          .indexes.assert_any_call('public_index'))
         (PrivacyAwareSMock().privacy_level().indexes().boost()
-         .query().order_by().filter.assert_any_call(is_vouched=True))
+         .query().order_by().cache_results().filter.assert_any_call(is_vouched=True))
 
     @override_settings(ES_INDEXES={'public': 'public_index'})
     @patch('mozillians.users.es.PrivacyAwareS')
@@ -243,7 +475,7 @@ class UserProfileTests(TestCase):
         (PrivacyAwareSMock().privacy_level()
          .indexes.assert_any_call('public_index'))
         ok_(call().privacy_level().indexes().boost()
-            .query().order_by().filter(is_vouched=True)
+            .query().order_by().cache_results().filter(is_vouched=True)
             not in PrivacyAwareSMock.mock_calls)
 
     def test_accounts_access(self):
@@ -318,6 +550,41 @@ class UserProfileTests(TestCase):
         user_groups = profile.get_annotated_groups()
         eq_([group_1], user_groups)
 
+    def test_get_annotated_groups_single_query(self):
+        profile = UserFactory.create().userprofile
+        groups = GroupFactory.create_batch(3)
+        for group in groups[:2]:
+            group.add_member(profile)
+        groups[2].add_member(profile, GroupMembership.PENDING)
+
+        with self.assertNumQueries(1):
+            user_groups = profile.get_annotated_groups()
+            eq_(sorted((group.id, group.pending) for group in user_groups),
+                sorted([(groups[0].id, False), (groups[1].id, False), (groups[2].id, True)]))
+
+    def test_profile_version(self):
+        profile = UserFactory.create().userprofile
+        voucher = UserFactory.create().userprofile
+
+        def _changes(func):
+            versions = [get_profile_version(profile.id), get_profile_version(voucher.id)]
+            func()
+            return [versions[0] != get_profile_version(profile.id),
+                    versions[1] != get_profile_version(voucher.id)]
+
+        eq_(_changes(lambda: None), [False, False])
+        eq_(_changes(profile.save), [True, False])
+        eq_(_changes(lambda: profile.externalaccount_set.create(
+            type=ExternalAccount.TYPE_AMO, identifier='foo')), [True, False])
+        eq_(_changes(lambda: LanguageFactory.create(userprofile=profile)), [True, False])
+        eq_(_changes(lambda: GroupFactory.create().add_member(profile)), [True, False])
+        eq_(_changes(lambda: profile.skills.add(SkillFactory.create())), [True, False])
+        eq_(_changes(lambda: Vouch.objects.create(
+            vouchee=profile, voucher=voucher, description='Vouch',
+            date=make_aware(datetime.now(), pytz.UTC))), [True, True])
+        eq_(_changes(voucher.save), [True, True])
+        eq_(_changes(lambda: profile._add_to_groups([GroupFactory.create()])), [True, False])
+
     @patch('mozillians.users.models.UserProfile.auto_vouch')
     def test_auto_vouch_on_profile_save(self, auto_vouch_mock):
         UserFactory.create()
@@ -478,6 +745,37 @@ class UserProfileTests(TestCase):
         ok_(user.userprofile.groups.filter(name='bar').exists())
         eq_(user.userprofile.groups.count(), 1)
 
+    @patch('mozillians.users.models.email_membership_change.delay')
+    @patch('mozillians.users.models.update_basket_task.delay')
+    def test_set_membership_group_bulk(self, update_basket_mock, email_mock):
+        user = UserFactory.create()
+        group_1 = GroupFactory.create(functional_area=True)
+        group_2 = GroupFactory.create()
+        group_3 = GroupFactory.create()
+        group_2.add_member(user.userprofile, GroupMembership.PENDING)
+        group_3.add_member(user.userprofile)
+        update_basket_mock.reset_mock()
+
+        user.userprofile.set_membership(Group, [group_1.name, group_2.name, group_3.name])
+
+        eq_(GroupMembership.objects.filter(userprofile=user.userprofile,
+                                           status=GroupMembership.MEMBER).count(), 3)
+        eq_(Group.objects.get(pk=group_1.pk).member_count, 1)
+        update_basket_mock.assert_called_once_with(user.userprofile.id)
+        email_mock.assert_called_once_with(group_2.pk, user.pk, GroupMembership.PENDING,
+                                           GroupMembership.MEMBER)
+
+    def test_set_membership_queries_do_not_grow(self):
+        user = UserFactory.create()
+        skills = [SkillFactory.create().name for i in range(10)]
+
+        with CaptureQueriesContext(connection) as few_skills:
+            user.userprofile.set_membership(Skill, skills[:2])
+        user.userprofile.skills.clear()
+        with CaptureQueriesContext(connection) as many_skills:
+            user.userprofile.set_membership(Skill, skills)
+        eq_(len(few_skills), len(many_skills))
+
     def test_set_membership_skill_matches_alias(self):
         group_1 = SkillFactory.create(name='foo')
         group_2 = SkillFactory.create(name='lo')
@@ -1,8 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test.utils import override_settings
+from django.utils import timezone
 
 from elasticsearch.exceptions import NotFoundError
 from mock import MagicMock, Mock, call, patch
@@ -10,11 +12,16 @@ from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
 from mozillians.groups.tests import GroupFactory
+from mozillians.users.es import get_search_generation
 from mozillians.users.managers import PUBLIC
-from mozillians.users.models import UserProfile
-from mozillians.users.tasks import (_email_basket_managers, index_objects,
-                                    remove_incomplete_accounts, unindex_objects,
-                                    unsubscribe_from_basket_task)
+from mozillians.users.models import UserProfile, UserProfileMappingType
+from mozillians.users.tasks import (INDEX_QUEUE_DELAY, INDEX_QUEUE_KEY,
+                                    INDEX_QUEUE_MISSING_TIMEOUT, _email_basket_managers,
+                                    flush_index_queue, index_objects,
+                                    index_objects_private_and_public, queue_index_update,
+                                    reindex_profiles, remove_incomplete_accounts,
+                                    swap_index_aliases,
+                                    unindex_objects, unsubscribe_from_basket_task)
 from mozillians.users.tests import UserFactory
 
 
@@ -50,15 +57,17 @@ class ElasticSearchIndexTests(TestCase):
         mapping_type = MagicMock()
         model = MagicMock()
         mapping_type.get_model.return_value = model
-        model.objects.filter.return_value = [user_1.userprofile,
-                                             user_2.userprofile]
-        mapping_type.extract_document.return_value = 'foo'
+        qs = model.objects.filter()
+        mapping_type.extract_documents.return_value = ['foo', 'foo']
         index_objects(mapping_type,
                       [user_1.userprofile.id, user_2.userprofile.id],
                       public_index=False)
+        mapping_type.extract_documents.assert_called_with(
+            (user_1.userprofile.id, user_2.userprofile.id), qs)
         mapping_type.bulk_index.assert_has_calls([
             call(['foo', 'foo'], id_field='id', es=get_es_mock(),
                  index=mapping_type.get_index(False))])
+        ok_(not mapping_type.refresh_index.called)
 
     @patch('mozillians.users.tasks.get_es')
     def test_index_objects_public(self, get_es_mock):
@@ -67,9 +76,8 @@ class ElasticSearchIndexTests(TestCase):
         mapping_type = MagicMock()
         model = MagicMock()
         mapping_type.get_model.return_value = model
-        qs = model.objects.filter().public_indexable().privacy_level
-        qs.return_value = [user_1.userprofile, user_2.userprofile]
-        mapping_type.extract_document.return_value = 'foo'
+        qs = model.objects.filter().public_indexable().privacy_level()
+        mapping_type.extract_documents.return_value = ['foo', 'foo']
         index_objects(mapping_type,
                       [user_1.userprofile.id, user_2.userprofile.id],
                       public_index=True)
@@ -79,10 +87,27 @@ class ElasticSearchIndexTests(TestCase):
             call.filter().public_indexable(),
             call.filter().public_indexable().privacy_level(PUBLIC),
         ])
+        mapping_type.extract_documents.assert_called_with(
+            (user_1.userprofile.id, user_2.userprofile.id), qs)
         mapping_type.bulk_index.assert_has_calls([
             call(['foo', 'foo'], id_field='id', es=get_es_mock(),
                  index=mapping_type.get_index(True))])
 
+    @patch('mozillians.users.tasks.get_es')
+    def test_index_objects_private_and_public(self, get_es_mock):
+        mapping_type = MagicMock()
+        model = MagicMock()
+        mapping_type.get_model.return_value = model
+        mapping_type.extract_private_and_public_documents.return_value = (['foo', 'bar'],
+                                                                          ['bar'])
+        index_objects_private_and_public(mapping_type, [1, 2],
+                                         indexes={'default': 'index', 'public': 'public'})
+
+        model.objects.filter.assert_called_once_with(id__in=(1, 2))
+        mapping_type.bulk_index.assert_has_calls([
+            call(['foo', 'bar'], id_field='id', es=get_es_mock(), index='index'),
+            call(['bar'], id_field='id', es=get_es_mock(), index='public')])
+
     @patch('mozillians.users.tasks.get_es')
     def test_unindex_objects(self, get_es_mock):
         mapping_type = MagicMock()
@@ -93,6 +118,26 @@ class ElasticSearchIndexTests(TestCase):
             call.unindex(2, es=get_es_mock(), public_index='foo'),
             call.unindex(3, es=get_es_mock(), public_index='foo')])
 
+    @patch('mozillians.users.tasks.get_es')
+    def test_unindex_bumps_search_generation(self, get_es_mock):
+        mapping_type = MagicMock()
+        generation = get_search_generation()
+        unindex_objects(mapping_type, [1], False)
+        eq_(get_search_generation(), generation + 1)
+        mapping_type.refresh_index.assert_called_with(es=get_es_mock(), public_index=False)
+
+    @override_settings(ES_DISABLED=False)
+    @patch('mozillians.users.tasks.get_es')
+    @patch('mozillians.users.tasks.index_objects_private_and_public')
+    def test_reindex_profiles_bumps_search_generation(self, index_mock, get_es_mock):
+        profile = UserFactory.create().userprofile
+        generation = get_search_generation()
+        with patch.object(UserProfileMappingType, 'refresh_index') as refresh_mock:
+            reindex_profiles([profile.id])
+        ok_(get_search_generation() > generation)
+        refresh_mock.assert_has_calls([call(es=get_es_mock(), public_index=False),
+                                       call(es=get_es_mock(), public_index=True)])
+
     def test_unindex_raises_not_found_exception(self):
         exception = NotFoundError(404, {'not found': 'not found '}, {'foo': 'foo'})
         mapping_type = Mock()
@@ -100,6 +145,180 @@ class ElasticSearchIndexTests(TestCase):
         unindex_objects(mapping_type, [1, 2, 3], 'foo')
 
 
+class IndexQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('mozillians.users.tasks.flush_index_queue.apply_async')
+    def test_queue_schedules_single_flush(self, apply_async_mock):
+        queue_index_update(1)
+        queue_index_update(2)
+        queue_index_update(1)
+        apply_async_mock.assert_called_once_with(countdown=INDEX_QUEUE_DELAY)
+
+    @patch('mozillians.users.tasks.unindex_objects')
+    @patch('mozillians.users.tasks.index_objects_private_and_public')
+    def test_flush_deduplicates(self, index_objects_mock, unindex_objects_mock):
+        public = UserFactory.create(userprofile={'privacy_full_name': PUBLIC}).userprofile
+        private = UserFactory.create().userprofile
+        incomplete = UserFactory.create(userprofile={'full_name': ''}).userprofile
+        cache.clear()
+
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async'):
+            for profile in [public, private, public, incomplete, private]:
+                queue_index_update(profile.id)
+        flush_index_queue()
+
+        eq_(index_objects_mock.call_count, 1)
+        args, kwargs = index_objects_mock.call_args
+        eq_(args[0], UserProfileMappingType)
+        eq_(set(args[1]), set([public.id, private.id]))
+        unindex_objects_mock.assert_called_once_with(UserProfileMappingType, [private.id],
+                                                     public_index=True)
+
+        # The queue is empty after a flush.
+        index_objects_mock.reset_mock()
+        flush_index_queue()
+        ok_(not index_objects_mock.called)
+
+    @patch('mozillians.users.tasks.reindex_profiles')
+    def test_flush_waits_for_unwritten_slot(self, reindex_profiles_mock):
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async'):
+            queue_index_update(1)
+            # A writer took slot 2 but has not written it yet.
+            cache.incr(INDEX_QUEUE_KEY + ':tail')
+            queue_index_update(3)
+        flush_index_queue()
+        reindex_profiles_mock.assert_called_once_with(set([1]))
+        eq_(cache.get(INDEX_QUEUE_KEY + ':head'), 1)
+
+        cache.set(INDEX_QUEUE_KEY + ':2', 2, None)
+        reindex_profiles_mock.reset_mock()
+        flush_index_queue()
+        reindex_profiles_mock.assert_called_once_with(set([2, 3]))
+        eq_(cache.get(INDEX_QUEUE_KEY + ':head'), 3)
+
+    @patch('mozillians.users.tasks.time')
+    @patch('mozillians.users.tasks.reindex_profiles')
+    def test_flush_skips_evicted_slot(self, reindex_profiles_mock, time_mock):
+        # Slot 1 was taken and then evicted.
+        cache.set(INDEX_QUEUE_KEY + ':tail', 1, None)
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async'):
+            queue_index_update(2)
+        time_mock.time.return_value = 1000
+        flush_index_queue()
+        ok_(not reindex_profiles_mock.called)
+
+        time_mock.time.return_value = 1000 + INDEX_QUEUE_MISSING_TIMEOUT
+        flush_index_queue()
+        reindex_profiles_mock.assert_called_once_with(set([2]))
+        eq_(cache.get(INDEX_QUEUE_KEY + ':head'), 2)
+
+    @patch('mozillians.users.tasks.INDEX_QUEUE_MAX_BATCH', 2)
+    @patch('mozillians.users.tasks.reindex_profiles')
+    def test_flush_without_head_is_bounded(self, reindex_profiles_mock):
+        cache.set(INDEX_QUEUE_KEY + ':tail', 100, None)
+        for slot in range(1, 101):
+            cache.set('{0}:{1}'.format(INDEX_QUEUE_KEY, slot), slot, None)
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async') as apply_async_mock:
+            flush_index_queue()
+        reindex_profiles_mock.assert_called_once_with(set([99, 100]))
+        eq_(cache.get(INDEX_QUEUE_KEY + ':head'), 100)
+        ok_(not apply_async_mock.called)
+
+    @patch('mozillians.users.tasks.INDEX_QUEUE_MAX_BATCH', 2)
+    @patch('mozillians.users.tasks.reindex_profiles')
+    def test_flush_reschedules_remaining(self, reindex_profiles_mock):
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async'):
+            for profile_id in [1, 2, 3]:
+                queue_index_update(profile_id)
+        with patch('mozillians.users.tasks.flush_index_queue.apply_async') as apply_async_mock:
+            flush_index_queue()
+        reindex_profiles_mock.assert_called_once_with(set([1, 2]))
+        apply_async_mock.assert_called_once_with(countdown=INDEX_QUEUE_DELAY)
+
+
+@override_settings(ES_DISABLED=False)
+class SwapIndexAliasesTests(TestCase):
+    @patch('mozillians.users.tasks.get_es')
+    def test_swap_existing_alias(self, get_es_mock):
+        es = get_es_mock()
+        mapping_type = MagicMock()
+        mapping_type.get_index_settings.return_value = {'refresh_interval': '1s'}
+        es.indices.exists_alias.return_value = True
+        es.indices.get_alias.return_value = {'foo-20150101000000': {}}
+        es.indices.get_settings.return_value = {'foo-20150101000000': {},
+                                                'foo-20160101000000': {},
+                                                'foo-public-20150101000000': {}}
+
+        generation = get_search_generation()
+        swap_index_aliases([], mapping_type, {'foo': 'foo-20160101000000'})
+        eq_(get_search_generation(), generation + 1)
+
+        es.indices.put_settings.assert_called_with(
+            index='foo-20160101000000', body={'index': {'refresh_interval': '1s'}})
+        es.indices.refresh.assert_called_with(index='foo-20160101000000')
+        es.indices.update_aliases.assert_called_with(body={'actions': [
+            {'remove': {'index': 'foo-20150101000000', 'alias': 'foo'}},
+            {'add': {'index': 'foo-20160101000000', 'alias': 'foo'}}]})
+        es.indices.delete.assert_called_once_with(index='foo-20150101000000')
+
+    @patch('mozillians.users.tasks.get_es')
+    def test_swap_replaces_plain_index(self, get_es_mock):
+        es = get_es_mock()
+        mapping_type = MagicMock()
+        es.indices.exists_alias.return_value = False
+        es.indices.exists.return_value = True
+        es.indices.get_settings.return_value = {'foo-20160101000000': {}}
+
+        swap_index_aliases([], mapping_type, {'foo': 'foo-20160101000000'})
+
+        es.indices.delete.assert_called_once_with(index='foo')
+        es.indices.update_aliases.assert_called_with(body={'actions': [
+            {'add': {'index': 'foo-20160101000000', 'alias': 'foo'}}]})
+
+    @patch('mozillians.users.tasks.get_es')
+    def test_swap_skipped_on_failed_chunk(self, get_es_mock):
+        es = get_es_mock()
+        mapping_type = MagicMock()
+
+        swap_index_aliases([[1, 2], Exception('boom')], mapping_type,
+                           {'foo': 'foo-20160101000000'})
+
+        es.indices.delete.assert_called_once_with(index='foo-20160101000000', ignore=404)
+        ok_(not es.indices.update_aliases.called)
+
+    @patch('mozillians.users.tasks.index_objects_private_and_public')
+    @patch('mozillians.users.tasks.get_es')
+    def test_swap_replays_changes(self, get_es_mock, index_objects_mock):
+        es = get_es_mock()
+        es.indices.exists_alias.return_value = False
+        es.indices.exists.return_value = False
+        es.indices.get_settings.return_value = {}
+        unchanged = UserFactory.create().userprofile
+        changed = UserFactory.create().userprofile
+        deleted = UserFactory.create().userprofile
+        deleted_id = deleted.id
+        deleted.delete()
+        started = timezone.now() - timedelta(minutes=1)
+        UserProfile.objects.filter(id=unchanged.id).update(
+            last_updated=started - timedelta(hours=1))
+        new_indexes = {'default': 'foo-20160101000000', 'public': 'foo-public-20160101000000'}
+
+        swap_index_aliases([[unchanged.id, deleted_id]], UserProfileMappingType,
+                           {'foo': new_indexes['default'],
+                            'foo-public': new_indexes['public']},
+                           started=started, new_indexes=new_indexes)
+
+        index_objects_mock.assert_called_once_with(UserProfileMappingType, [changed.id],
+                                                   indexes=new_indexes)
+        doc_type = UserProfileMappingType.get_mapping_type_name()
+        es.delete.assert_has_calls([
+            call(index=new_indexes['default'], doc_type=doc_type, id=deleted_id),
+            call(index=new_indexes['public'], doc_type=doc_type, id=deleted_id)])
+        ok_(es.indices.update_aliases.called)
+
+
 class BasketTests(TestCase):
     @override_settings(BASKET_MANAGERS=False)
     @patch('mozillians.users.tasks.send_mail')